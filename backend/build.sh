@@ -5,4 +5,9 @@ set -o errexit
 pip install -r requirements.txt
 
 python manage.py collectstatic --no-input
-python manage.py migrate
\ No newline at end of file
+python manage.py migrate
+
+# Served as files by /api/schema/, so servers don't generate the schema
+mkdir -p "${OPENAPI_SCHEMA_DIR:-openapi}"
+python manage.py spectacular --file "${OPENAPI_SCHEMA_DIR:-openapi}/schema.yaml"
+python manage.py spectacular --format openapi-json --file "${OPENAPI_SCHEMA_DIR:-openapi}/schema.json"
@@ -1,29 +1,216 @@
-from django.contrib import admin
-from .models import Driver, Route, Order, SimulationRun
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections, models
+from django.db.models import Max
+from django.utils.functional import cached_property
+
+from . import change_feed, route_stats
+from .models import Change, Driver, Route, Order, OrderOutcome, SimulationRun, RuleSet
+from .simulation import invalidate_snapshot
+
+# Below this many rows the changelist counts exactly
+EXACT_COUNT_LIMIT = 100_000
+# Selected objects listed on a delete confirmation page
+DELETE_PREVIEW_LIMIT = 100
+
+
+def estimated_count(queryset):
+    """The database's estimate of a table's row count, or None"""
+    model = queryset.model
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+            row = cursor.fetchone()
+        # -1 until the table is first analyzed
+        return row[0] if row and row[0] >= 0 else None
+    # Elsewhere the highest primary key, an index lookup, bounds the count
+    return model._default_manager.using(queryset.db).aggregate(highest=Max('pk'))['highest'] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """Use the table estimate for unfiltered changelists of large tables"""
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            estimate = estimated_count(self.object_list)
+            if estimate is not None and estimate >= EXACT_COUNT_LIMIT:
+                return estimate
+        return super().count
+
+
+class DepotListFilter(admin.SimpleListFilter):
+    """Depot filter whose choices come from the (small) route table, not a distinct scan"""
+    title = 'depot'
+    parameter_name = 'depot'
+
+    def lookups(self, request, model_admin):
+        depots = Route.objects.order_by('depot').values_list('depot', flat=True).distinct()
+        return [(depot, depot) for depot in depots]
+
+    def queryset(self, request, queryset):
+        return queryset.filter(depot=self.value()) if self.value() else queryset
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelists and deletes for tables with millions of rows: estimated
+    counts, no second full-table count, and a delete confirmation that
+    summarizes related rows with COUNT queries instead of listing each one.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    # Fields matched exactly (a unique index) rather than with icontains
+    exact_search_fields = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        if not self.exact_search_fields:
+            return super().get_search_results(request, queryset, search_term)
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        matches = queryset.none()
+        for field in self.exact_search_fields:
+            matches |= queryset.filter(**{field: term})
+        return matches, False
+
+    def get_deleted_objects(self, objs, request):
+        # A queryset from the delete action, a one-object list from the delete view
+        if isinstance(objs, list):
+            count, selected, pks = len(objs), objs, [obj.pk for obj in objs]
+        else:
+            count, selected, pks = objs.count(), list(objs[:DELETE_PREVIEW_LIMIT]), objs.order_by().values('pk')
+        deleted_objects = [str(obj) for obj in selected[:DELETE_PREVIEW_LIMIT]]
+        if count > DELETE_PREVIEW_LIMIT:
+            deleted_objects.append(f'... and {count - DELETE_PREVIEW_LIMIT} more')
+
+        model_count = {self.model._meta.verbose_name_plural: count}
+        for relation in self.model._meta.related_objects:
+            if not relation.one_to_many:
+                continue
+            related = relation.related_model._base_manager.filter(**{f'{relation.field.name}__in': pks}).count()
+            if related:
+                action = 'unlinked' if relation.on_delete is models.SET_NULL else 'deleted'
+                model_count[f'{relation.related_model._meta.verbose_name_plural} ({action})'] = related
+        return deleted_objects, model_count, set(), []
+
 
 # Register your models here.
 @admin.register(Driver)
 class DriverAdmin(admin.ModelAdmin):
-    list_display = ['name', 'current_shift_hours', 'past_7_day_work_hours']
+    list_display = ['name', 'depot', 'current_shift_hours', 'past_7_day_work_hours']
     search_fields = ['name']
+    list_filter = ['depot']
 
 @admin.register(Route)
-class RouteAdmin(admin.ModelAdmin):
-    list_display = ['route_id', 'distance_km', 'traffic_level', 'base_time']
+class RouteAdmin(LargeTableAdmin):
+    list_display = ['route_id', 'depot', 'distance_km', 'traffic_level', 'base_time']
+    # Also what the order form's route autocomplete searches
     search_fields = ['route_id']
-    list_filter = ['traffic_level']
+    list_filter = ['depot', 'traffic_level']
+    ordering = ['route_id']
+    actions = ['mark_traffic_high', 'mark_traffic_medium', 'mark_traffic_low']
+
+    def _set_traffic_level(self, request, queryset, level):
+        with Change.scope() as change:
+            updated = queryset.update(traffic_level=level, sync_version=change)
+            # update() sends no signals; scenario snapshots must still reload
+            invalidate_snapshot(sender=Route)
+        self.message_user(request, f'{updated} routes set to {level} traffic.', messages.SUCCESS)
+
+    @admin.action(description='Set traffic level to High')
+    def mark_traffic_high(self, request, queryset):
+        self._set_traffic_level(request, queryset, 'High')
+
+    @admin.action(description='Set traffic level to Medium')
+    def mark_traffic_medium(self, request, queryset):
+        self._set_traffic_level(request, queryset, 'Medium')
+
+    @admin.action(description='Set traffic level to Low')
+    def mark_traffic_low(self, request, queryset):
+        self._set_traffic_level(request, queryset, 'Low')
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(LargeTableAdmin):
     list_display = ['order_id', 'value_rs', 'assigned_route', 'is_late', 'profit', 'simulation_run_at']
-    search_fields = ['order_id']
-    list_filter = ['is_late', 'simulation_run_at']
+    list_select_related = ['assigned_route']
+    exact_search_fields = ['order_id']
+    search_help_text = 'Exact order ID'
+    # simulation_run_at is indexed, and its date filter is a range query
+    list_filter = [DepotListFilter, 'is_late', 'simulation_run_at']
+    autocomplete_fields = ['assigned_route']
     readonly_fields = ['simulation_run_at']
+    actions = ['unassign_route', 'clear_simulation_results']
+
+    @staticmethod
+    def _selected(queryset):
+        # A plain pk subquery: the changelist queryset carries joins and ordering
+        return Order.objects.filter(pk__in=queryset.order_by().values('pk'))
+
+    def delete_queryset(self, request, queryset):
+        """
+        One grouped update of the route statistics, one UPDATE on the outcomes
+        and one DELETE, instead of a delete per order. Django's
+        ``QuerySet.delete()`` would load every order to send its delete
+        signals, so the DELETE is raw SQL and the work of those signals (the
+        change feed tombstones, the route statistics, the snapshot reload) is
+        done here for the whole selection.
+        """
+        selected = self._selected(queryset)
+        with Change.scope():
+            change_feed.record_deletes(Order, selected.values_list('pk', flat=True).iterator())
+            route_stats.remove_orders(selected)
+            OrderOutcome.objects.filter(order__in=selected.values('pk')).update(order=None)
+            connection = connections[selected.db]
+            subquery, params = queryset.order_by().values('pk').query.sql_with_params()
+            table = connection.ops.quote_name(Order._meta.db_table)
+            pk = connection.ops.quote_name(Order._meta.pk.column)
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {table} WHERE {pk} IN ({subquery})', params)
+        invalidate_snapshot(sender=Order)
+
+    @admin.action(description='Unassign route')
+    def unassign_route(self, request, queryset):
+        selected = self._selected(queryset)
+        with Change.scope() as change:
+            # update() sends no signals: move the statistics and reload snapshots here
+            route_stats.unassign_orders(selected)
+            updated = selected.update(assigned_route=None, sync_version=change)
+        invalidate_snapshot(sender=Order)
+        self.message_user(request, f'{updated} orders unassigned.', messages.SUCCESS)
+
+    @admin.action(description='Clear simulation results')
+    def clear_simulation_results(self, request, queryset):
+        with Change.scope() as change:
+            updated = self._selected(queryset).update(
+                fuel_cost=0, penalty=0, bonus=0, profit=0, is_late=False,
+                delivery_timestamp=None, simulation_run_at=None, sync_version=change,
+            )
+        self.message_user(request, f'Simulation results cleared on {updated} orders.', messages.SUCCESS)
 
 @admin.register(SimulationRun)
-class SimulationRunAdmin(admin.ModelAdmin):
-    list_display = ['run_id', 'timestamp', 'num_drivers', 'total_profit', 'efficiency_score', 'total_orders']
-    search_fields = ['run_id']
-    list_filter = ['timestamp', 'num_drivers']
+class SimulationRunAdmin(LargeTableAdmin):
+    list_display = ['run_id', 'timestamp', 'num_drivers', 'total_profit', 'efficiency_score', 'total_orders', 'rule_set']
+    list_select_related = ['rule_set']
+    exact_search_fields = ['run_id']
+    search_help_text = 'Exact run ID'
+    # timestamp is indexed; mode has fixed choices, so no filter scans the table
+    list_filter = ['timestamp', 'mode', DepotListFilter]
     readonly_fields = ['timestamp']
     ordering = ['-timestamp']
+
+@admin.register(RuleSet)
+class RuleSetAdmin(admin.ModelAdmin):
+    list_display = ['version', 'name', 'is_active', 'fuel_cost_per_km', 'late_threshold_minutes', 'late_penalty', 'created_at']
+    list_filter = ['is_active']
+    readonly_fields = ['created_at', 'created_by']
+    ordering = ['-version']
+
+    # Runs reference the exact version they used; change rules through the
+    # API, which creates a new version
+    def has_change_permission(self, request, obj=None):
+        return obj is None and super().has_change_permission(request, obj)
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,222 @@
+"""
+Admission control for expensive endpoint classes.
+
+Each endpoint class (``simulation``, ``analytics``) has a concurrency limit and
+a bounded wait queue configured in ``settings.ADMISSION_CONTROL``. A request
+takes one of ``limit`` execution slots; if all are busy it takes a queue
+ticket and waits up to ``queue_timeout`` seconds for a slot. When the queue is
+full the request is turned away at once with 429, and a request that waits
+out its timeout gets 503; both carry ``Retry-After``. CRUD and login views
+are not gated, so they stay responsive while a burst of simulations is
+queued.
+
+A single-threaded WSGI worker (gunicorn's default sync worker, which
+reports ``wsgi.multithread`` false) serves one request at a time, so a
+request waiting there would only hold the worker that a slot needs to free
+up. Such requests skip the queue and get 429 at once when no slot is free.
+
+Slots and queue tickets are cache keys added with ``cache.add`` and a lease
+timeout, so a worker that dies mid-request frees its slot once the lease runs
+out. The limits only hold across worker processes with a shared cache
+backend (CACHE_URL); the ``delivery_api.E001`` system check refuses to start
+with admission control on a per-process cache. Admissions, rejections and
+current queue depth are exposed by ``AdmissionMetricsAPIView``.
+"""
+import asyncio
+import logging
+import math
+import time
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.exceptions import APIException, Throttled
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.05
+MAX_POLL_INTERVAL = 0.5
+COUNTERS = ('admitted', 'queued', 'rejected_queue_full', 'rejected_timeout')
+
+
+class Overloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Server is busy. Please retry later.'
+    default_code = 'overloaded'
+
+    def __init__(self, detail=None, wait: Optional[float] = None):
+        super().__init__(detail)
+        # DRF's exception handler turns ``wait`` into a Retry-After header
+        self.wait = wait
+
+
+class AdmissionController:
+    """Concurrency limit plus bounded wait queue for one endpoint class"""
+
+    def __init__(self, name: str, limit: int, queue_size: int, queue_timeout: float, lease: int):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.lease = lease
+        self.retry_after = max(1, math.ceil(queue_timeout))
+        self._slot_keys = [f'admission:{name}:slot:{i}' for i in range(limit)]
+        self._queue_keys = [f'admission:{name}:queue:{i}' for i in range(queue_size)]
+        # Queue tickets outlive the wait by a little so a slow poll can't lose its place
+        self._ticket_lease = math.ceil(queue_timeout) + 5
+
+    def _counter_key(self, counter: str) -> str:
+        return f'admission:{self.name}:{counter}'
+
+    def _count(self, counter: str) -> None:
+        key = self._counter_key(counter)
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+    async def _acount(self, counter: str) -> None:
+        key = self._counter_key(counter)
+        await cache.aadd(key, 0, timeout=None)
+        try:
+            await cache.aincr(key)
+        except ValueError:
+            await cache.aset(key, 1, timeout=None)
+
+    def _take(self, keys: List[str], lease: int) -> Optional[str]:
+        for key in keys:
+            if cache.add(key, 1, timeout=lease):
+                return key
+        return None
+
+    async def _atake(self, keys: List[str], lease: int) -> Optional[str]:
+        for key in keys:
+            if await cache.aadd(key, 1, timeout=lease):
+                return key
+        return None
+
+    def _queue_full(self) -> Throttled:
+        logger.warning("Admission queue full for '%s' (%d running, %d waiting)", self.name, self.limit, self.queue_size)
+        return Throttled(wait=self.retry_after, detail='Too many concurrent requests. Please retry later.')
+
+    def _timed_out(self) -> Overloaded:
+        logger.warning("Admission wait timed out for '%s' after %ss", self.name, self.queue_timeout)
+        return Overloaded(wait=self.retry_after)
+
+    def acquire(self, wait: bool = True) -> str:
+        """Take an execution slot, waiting in the queue if needed; returns the slot to release.
+
+        With ``wait=False`` a request that finds every slot busy is rejected
+        as if the queue were full.
+        """
+        slot = self._take(self._slot_keys, self.lease)
+        if slot is None:
+            ticket = self._take(self._queue_keys, self._ticket_lease) if wait else None
+            if ticket is None:
+                self._count('rejected_queue_full')
+                raise self._queue_full()
+            self._count('queued')
+            try:
+                deadline = time.monotonic() + self.queue_timeout
+                interval = POLL_INTERVAL
+                while slot is None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._count('rejected_timeout')
+                        raise self._timed_out()
+                    time.sleep(min(interval, remaining))
+                    interval = min(interval * 2, MAX_POLL_INTERVAL)
+                    slot = self._take(self._slot_keys, self.lease)
+            finally:
+                cache.delete(ticket)
+        self._count('admitted')
+        return slot
+
+    async def aacquire(self) -> str:
+        """acquire() for async views; waits on the event loop instead of a thread"""
+        slot = await self._atake(self._slot_keys, self.lease)
+        if slot is None:
+            ticket = await self._atake(self._queue_keys, self._ticket_lease)
+            if ticket is None:
+                await self._acount('rejected_queue_full')
+                raise self._queue_full()
+            await self._acount('queued')
+            try:
+                deadline = time.monotonic() + self.queue_timeout
+                interval = POLL_INTERVAL
+                while slot is None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        await self._acount('rejected_timeout')
+                        raise self._timed_out()
+                    await asyncio.sleep(min(interval, remaining))
+                    interval = min(interval * 2, MAX_POLL_INTERVAL)
+                    slot = await self._atake(self._slot_keys, self.lease)
+            finally:
+                await cache.adelete(ticket)
+        await self._acount('admitted')
+        return slot
+
+    def release(self, slot: str) -> None:
+        cache.delete(slot)
+
+    async def arelease(self, slot: str) -> None:
+        await cache.adelete(slot)
+
+    def stats(self) -> Dict[str, Any]:
+        counters = cache.get_many([self._counter_key(c) for c in COUNTERS])
+        return {
+            'limit': self.limit,
+            'queue_size': self.queue_size,
+            'queue_timeout': self.queue_timeout,
+            'in_flight': len(cache.get_many(self._slot_keys)),
+            'queue_depth': len(cache.get_many(self._queue_keys)),
+            **{c: counters.get(self._counter_key(c), 0) for c in COUNTERS},
+        }
+
+
+_controllers: Dict[str, AdmissionController] = {}
+
+
+def get_controller(name: Optional[str]) -> Optional[AdmissionController]:
+    """Controller for an endpoint class, or None when it is not limited"""
+    if name is None or not settings.ADMISSION_CONTROL_ENABLED:
+        return None
+    controller = _controllers.get(name)
+    if controller is None:
+        config = settings.ADMISSION_CONTROL.get(name)
+        if config is None:
+            return None
+        controller = _controllers.setdefault(name, AdmissionController(name, **config))
+    return controller
+
+
+def admission_stats() -> Dict[str, Dict[str, Any]]:
+    """Current state and counters of every configured endpoint class"""
+    if not settings.ADMISSION_CONTROL_ENABLED:
+        return {}
+    return {name: get_controller(name).stats() for name in settings.ADMISSION_CONTROL}
+
+
+class AdmissionMixin:
+    """Gate an APIView's handlers behind the controller for ``admission_class``"""
+    admission_class: Optional[str] = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._admission_slot = None
+        controller = get_controller(self.admission_class)
+        if controller is not None and request.method != 'OPTIONS':
+            # Waiting would block a single-threaded worker (see module docstring)
+            self._admission_slot = controller.acquire(wait=request.META.get('wsgi.multithread', True))
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            slot = getattr(self, '_admission_slot', None)
+            if slot is not None:
+                self._admission_slot = None
+                get_controller(self.admission_class).release(slot)
@@ -4,3 +4,55 @@ from django.apps import AppConfig
 class DeliveryApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'delivery_api'
+
+    def ready(self):
+        from django.conf import settings
+        from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+
+        from .authentication import invalidate_cached_user
+        from .models import Driver, Order, Route, SimulationRun
+        from .simulation import invalidate_snapshot
+        from . import change_feed, outcome_store, route_stats
+        from . import checks  # noqa: F401 (registers the system checks)
+
+        post_save.connect(invalidate_cached_user, sender=settings.AUTH_USER_MODEL,
+                          dispatch_uid='delivery_api.invalidate_cached_user.save')
+        post_delete.connect(invalidate_cached_user, sender=settings.AUTH_USER_MODEL,
+                            dispatch_uid='delivery_api.invalidate_cached_user.delete')
+
+        # Change feed tombstones. Connected before the other receivers so a
+        # delete takes the version counter before any lock, in the same order
+        # as save() does, and concurrent writers can't deadlock
+        for model in (Driver, Route, Order, SimulationRun):
+            post_delete.connect(change_feed.record_delete, sender=model,
+                                dispatch_uid=f'delivery_api.change_feed.{model.__name__.lower()}.delete')
+        pre_delete.connect(change_feed.route_pre_delete, sender=Route,
+                           dispatch_uid='delivery_api.change_feed.route.pre_delete')
+        # Rows moved to another depot are removed from the old depot's feed
+        for model in (Driver, Route, Order, SimulationRun):
+            name = model.__name__.lower()
+            pre_save.connect(change_feed.depot_pre_save, sender=model,
+                             dispatch_uid=f'delivery_api.change_feed.{name}.pre_save')
+            post_save.connect(change_feed.depot_post_save, sender=model,
+                              dispatch_uid=f'delivery_api.change_feed.{name}.save')
+
+        # Scenario snapshots reload after any change to the simulation inputs
+        for model in (Driver, Route, Order):
+            name = model.__name__.lower()
+            post_save.connect(invalidate_snapshot, sender=model,
+                              dispatch_uid=f'delivery_api.invalidate_snapshot.{name}.save')
+            post_delete.connect(invalidate_snapshot, sender=model,
+                                dispatch_uid=f'delivery_api.invalidate_snapshot.{name}.delete')
+
+        # Per-route order statistics follow every order write
+        pre_save.connect(route_stats.order_pre_save, sender=Order,
+                         dispatch_uid='delivery_api.route_stats.order.pre_save')
+        post_save.connect(route_stats.order_post_save, sender=Order,
+                          dispatch_uid='delivery_api.route_stats.order.save')
+        post_delete.connect(route_stats.order_post_delete, sender=Order,
+                            dispatch_uid='delivery_api.route_stats.order.delete')
+        pre_delete.connect(route_stats.route_pre_delete, sender=Route,
+                           dispatch_uid='delivery_api.route_stats.route.delete')
+
+        post_delete.connect(outcome_store.delete_run_outcomes, sender=SimulationRun,
+                            dispatch_uid='delivery_api.outcome_store.run.delete')
@@ -0,0 +1,210 @@
+"""
+Async counterparts of the read-only analytics views.
+
+DRF's APIView is synchronous, so under ASGI every request to it occupies a
+worker thread for as long as its queries run. The views in this module are
+plain Django async views that authenticate with the configured DRF
+authentication classes, query through Django's async ORM and render with the
+same JSON renderer as the DRF views, so their responses are identical to the
+sync views in ``views.py``. ``greencart/urls.py`` mounts them in place of the sync views
+when ``settings.ASYNC_VIEWS`` is enabled (see SETUP_INSTRUCTIONS.md).
+"""
+import logging
+from typing import Any, Dict, Optional
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.settings import api_settings
+
+from . import change_feed, sketches
+from .admission import Overloaded, get_controller
+from .models import SimulationRun
+from .renderers import FastJSONRenderer
+from .serializers import SimulationRunSerializer, get_row_builder
+from .views import (
+    SimulationRunViewSet,
+    driver_performance_data,
+    driver_performance_rows,
+    historical_trend_data,
+    route_performance_data,
+    route_performance_rows,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _json_response(data: Any, status_code: int = status.HTTP_200_OK, headers: Optional[Dict[str, str]] = None) -> HttpResponse:
+    renderer = FastJSONRenderer()
+    response = HttpResponse(renderer.render(data), status=status_code, content_type=renderer.media_type)
+    for name, value in (headers or {}).items():
+        response[name] = value
+    return response
+
+
+class AsyncAPIView(View):
+    """Async base view that enforces DRF authentication before dispatching"""
+    authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    http_method_names = ['get', 'head', 'options']
+    admission_class = None
+
+    def _authenticate(self, request):
+        """Run the authenticators; returns the user or raises an APIException"""
+        for authenticator in [auth() for auth in self.authentication_classes]:
+            user_auth_tuple = authenticator.authenticate(request)
+            if user_auth_tuple is not None:
+                return user_auth_tuple[0]
+        raise exceptions.NotAuthenticated()
+
+    def _auth_failed_response(self, request, exc: exceptions.APIException) -> HttpResponse:
+        data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+        headers = {}
+        if self.authentication_classes:
+            authenticate_header = self.authentication_classes[0]().authenticate_header(request)
+            if authenticate_header:
+                headers['WWW-Authenticate'] = authenticate_header
+        status_code = status.HTTP_401_UNAUTHORIZED if headers else status.HTTP_403_FORBIDDEN
+        return _json_response(data, status_code, headers)
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            request.user = await sync_to_async(self._authenticate)(request)
+        except (exceptions.AuthenticationFailed, exceptions.NotAuthenticated) as exc:
+            return self._auth_failed_response(request, exc)
+
+        controller = get_controller(self.admission_class)
+        if controller is None or request.method == 'OPTIONS':
+            return await super().dispatch(request, *args, **kwargs)
+        try:
+            slot = await controller.aacquire()
+        except (exceptions.Throttled, Overloaded) as exc:
+            return _json_response({'detail': exc.detail}, exc.status_code, {'Retry-After': '%d' % exc.wait})
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        finally:
+            await controller.arelease(slot)
+
+
+class AsyncHistoricalDataView(AsyncAPIView):
+    admission_class = 'analytics'
+
+    async def get(self, request, *args, **kwargs):
+        """Get historical simulation data for trend charts"""
+        try:
+            runs = SimulationRun.objects.all()
+            depot = request.GET.get('depot')
+            if depot:
+                runs = runs.filter(depot=depot)
+            latest = [run async for run in runs.order_by('-timestamp')[:10]]
+
+            return _json_response({
+                'trend_data': historical_trend_data(latest),
+                'total_runs': await runs.acount()
+            })
+
+        except Exception as e:
+            logger.error(f"Error fetching historical data: {str(e)}")
+            return _json_response(
+                {'error': 'Failed to fetch historical data'},
+                status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class AsyncRunDrillDownView(AsyncAPIView):
+    """Shared run_id lookup for the per-run drill-down views"""
+    admission_class = 'analytics'
+
+    async def get_simulation_run(self, request):
+        run_id = request.GET.get('run_id')
+        if not run_id:
+            return None, _json_response(
+                {'error': 'run_id parameter is required'},
+                status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            return await SimulationRun.objects.aget(run_id=run_id), None
+        except SimulationRun.DoesNotExist:
+            return None, _json_response(
+                {'error': 'Simulation run not found'},
+                status.HTTP_404_NOT_FOUND
+            )
+
+
+class AsyncDriverPerformanceView(AsyncRunDrillDownView):
+
+    async def get(self, request, *args, **kwargs):
+        """Get driver performance breakdown for drill-down analysis"""
+        try:
+            simulation_run, error_response = await self.get_simulation_run(request)
+            if error_response is not None:
+                return error_response
+
+            orders = await sync_to_async(driver_performance_rows)(simulation_run)
+            run_sketches = await sync_to_async(sketches.load)(simulation_run)
+
+            return _json_response({
+                'driver_performance': driver_performance_data(orders, simulation_run, run_sketches),
+                'simulation_run': SimulationRunSerializer(simulation_run).data
+            })
+
+        except Exception as e:
+            logger.error(f"Error fetching driver performance: {str(e)}")
+            return _json_response(
+                {'error': 'Failed to fetch driver performance data'},
+                status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class AsyncRoutePerformanceView(AsyncRunDrillDownView):
+
+    async def get(self, request, *args, **kwargs):
+        """Get route performance breakdown for drill-down analysis"""
+        try:
+            simulation_run, error_response = await self.get_simulation_run(request)
+            if error_response is not None:
+                return error_response
+
+            orders = await sync_to_async(route_performance_rows)(simulation_run)
+            run_sketches = await sync_to_async(sketches.load)(simulation_run)
+
+            return _json_response({
+                'route_performance': route_performance_data(orders, simulation_run, run_sketches),
+                'simulation_run': SimulationRunSerializer(simulation_run).data
+            })
+
+        except Exception as e:
+            logger.error(f"Error fetching route performance: {str(e)}")
+            return _json_response(
+                {'error': 'Failed to fetch route performance data'},
+                status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class AsyncSimulationRunListView(AsyncAPIView):
+    """Async GET for the simulation run collection.
+
+    POST and change feed requests (``?since=``) are handed to the regular
+    SimulationRunViewSet so the collection URL keeps its full behaviour when
+    this view is mounted over it.
+    """
+    http_method_names = ['get', 'post', 'head', 'options']
+    _create_view = staticmethod(SimulationRunViewSet.as_view({'post': 'create'}))
+    _changes_view = staticmethod(SimulationRunViewSet.as_view({'get': 'list'}))
+
+    async def get(self, request, *args, **kwargs):
+        if 'since' in request.GET:
+            response = await sync_to_async(self._changes_view)(request, *args, **kwargs)
+            return await sync_to_async(response.render)()
+        version = await change_feed.acurrent_version()
+        builder = get_row_builder(SimulationRunSerializer)
+        queryset = SimulationRunViewSet.queryset.all()
+        depot = request.GET.get('depot')
+        if depot:
+            queryset = queryset.filter(depot=depot)
+        return _json_response([builder.build(row) async for row in queryset.values_list(*builder.columns)],
+                              headers={change_feed.VERSION_HEADER: str(version)})
+
+    async def post(self, request, *args, **kwargs):
+        response = await sync_to_async(self._create_view)(request, *args, **kwargs)
+        return await sync_to_async(response.render)()
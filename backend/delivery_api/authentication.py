@@ -0,0 +1,140 @@
+"""
+JWT authentication with an in-process cache of resolved users.
+
+simplejwt's JWTAuthentication loads the user row from ``auth_user`` on every
+request. The dashboard fires several API calls per page view with the same
+token, so CachedJWTAuthentication keeps recently resolved users in a bounded
+LRU for at most ``AUTH_USER_CACHE_TTL`` seconds (never past the token's own
+expiry).
+
+Invalidation: saving or deleting a user evicts it from this process's cache
+and bumps a per-user generation counter in Django's cache framework. Every
+cache hit compares its generation with the current one, so other worker
+processes drop the stale entry on their next request as long as CACHES points
+at a shared backend (CACHE_URL). Bulk ``QuerySet.update()`` calls bypass the
+signals; those changes are picked up when the entry's TTL runs out. The
+generation is read on every request, hit or miss: with the default
+local-memory cache that is a dictionary lookup, with CACHE_URL it is one
+round trip to the cache server per request, which replaces the auth_user
+query rather than removing all I/O.
+
+Each request gets its own copy of the cached user, so attributes one
+request sets or caches on it (permission caches, say) don't leak into
+concurrent requests for the same user.
+
+A cached user serves every token for that user id, so each hit repeats the
+checks simplejwt makes after loading the row: the user must be active and,
+with CHECK_REVOKE_TOKEN, the token's password hash must match the cached
+user's password. A token issued before a password change is refused even
+after a newer login has refilled the cache.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import Token
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+def _generation_key(user_id: Any) -> str:
+    return f'auth-user-generation:{user_id}'
+
+
+class UserCache:
+    """Thread-safe LRU of user objects keyed by user id, with per-entry expiry"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: 'OrderedDict[Any, Tuple[Any, float, int]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: Any, generation: int) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            user, expires_at, cached_generation = entry
+            if expires_at <= time.monotonic() or cached_generation != generation:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return user
+
+    def set(self, user_id: Any, user: Any, ttl: float, generation: int) -> None:
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[user_id] = (user, time.monotonic() + ttl, generation)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def evict(self, user_id: Any) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache(settings.AUTH_USER_CACHE_SIZE)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that serves repeat lookups from ``user_cache``"""
+
+    def get_user(self, validated_token: Token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            # Let simplejwt raise its usual InvalidToken
+            return super().get_user(validated_token)
+
+        generation = cache.get(_generation_key(user_id), 0)
+        user = user_cache.get(user_id, generation)
+        if user is not None:
+            self.check_cached_user(validated_token, user)
+            return copy.copy(user)
+
+        user = super().get_user(validated_token)
+        ttl = settings.AUTH_USER_CACHE_TTL
+        expires = validated_token.get('exp')
+        if expires is not None:
+            ttl = min(ttl, expires - time.time())
+        user_cache.set(user_id, copy.copy(user), ttl, generation)
+        return user
+
+    def check_cached_user(self, validated_token: Token, user) -> None:
+        """The checks simplejwt's get_user makes once it has the user row"""
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+            api_settings.REVOKE_TOKEN_CLAIM
+        ) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(
+                _("The user's password has been changed."), code="password_changed"
+            )
+
+
+def invalidate_cached_user(sender, instance, update_fields=None, **kwargs) -> None:
+    """post_save/post_delete receiver for the user model"""
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        # Login stamps last_login; nothing the authenticator checks changed
+        return
+    user_id = getattr(instance, api_settings.USER_ID_FIELD)
+    user_cache.evict(user_id)
+    key = _generation_key(user_id)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr(); any new value invalidates
+        cache.set(key, 1, timeout=None)
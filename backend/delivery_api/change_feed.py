@@ -0,0 +1,150 @@
+"""
+Change feed for drivers, routes, orders and simulation runs.
+
+Every transaction that writes these models is a ``Change``: ``save()``
+stamps the row's ``sync_version`` with the change's id, and the receivers
+below record deletes as Tombstones of the change. When the transaction is
+about to commit, the change takes a version from one monotonically
+increasing counter (``ChangeCounter``). List endpoints return the current
+version in the Change-Version header, and ``?since=<version>`` returns only
+the rows and the ids deleted by changes versioned after it, so a client
+that keeps a local copy refreshes in time proportional to the changes, not
+the table.
+
+The version is the transaction's last statement and holds the counter row
+until the commit, so versions become visible in order: once a reader sees
+version N, every change versioned up to N is visible too. Readers take the
+version before reading rows; a write that commits in between is sent again
+next time rather than missed. The change id is an autoincrement, so the
+writes themselves (a simulation's bulk publish, say) don't hold the counter
+and concurrent writers only queue for each other's commits. Inside a
+longer transaction that isn't itself a ``Change.scope()``, a write takes
+its version when it is made and the counter stays held until that
+transaction commits; wrap such transactions in ``Change.scope()``.
+
+A feed limited to one depot (``?depot=``) reports a row that moved to
+another depot as deleted: saving a row with a new depot leaves a Tombstone
+for the depot it left. A row that moves back is sent in ``results`` again.
+
+``QuerySet.update()``, ``bulk_update()`` and raw deletes bypass ``save()``
+and the signals; the code that uses them stamps ``sync_version`` with its
+``Change.scope()`` itself and records deletes with ``record_deletes()``;
+none of them changes a depot.
+
+Changes and their tombstones are kept for CHANGE_FEED_RETENTION_DAYS;
+``manage.py prune_change_feed`` removes older ones, after which feeds from
+before the newest pruned version answer 410 and the client fetches the full
+list.
+"""
+import logging
+from datetime import timedelta
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .models import Change, ChangeCounter, Order, Route, Tombstone
+
+logger = logging.getLogger(__name__)
+
+# Response header carrying the version a list was read at
+VERSION_HEADER = 'Change-Version'
+
+
+def feed_state() -> Tuple[int, int]:
+    """(current version, newest pruned version)"""
+    state = ChangeCounter.objects.filter(pk=1).values_list('value', 'pruned_through').first()
+    return state or (0, 0)
+
+
+def current_version() -> int:
+    return feed_state()[0]
+
+
+async def acurrent_version() -> int:
+    value = await ChangeCounter.objects.filter(pk=1).values_list('value', flat=True).afirst()
+    return value or 0
+
+
+def changes_since(since: int):
+    """Ids of the changes versioned after ``since``, as a subquery"""
+    return Change.objects.filter(version__gt=since).values('pk')
+
+
+def changed_since(queryset, since: int, related: Sequence[str] = ()):
+    """Rows of ``queryset`` written after ``since``, or whose nested ``related`` rows were"""
+    changes = changes_since(since)
+    condition = Q(sync_version__in=changes)
+    for name in related:
+        condition |= Q(**{f'{name}__sync_version__in': changes})
+    return queryset.filter(condition)
+
+
+def deleted_since(model, since: int, depot: Optional[str] = None) -> List[int]:
+    """Ids deleted after ``since``, and with ``depot`` those moved out of it"""
+    tombstones = Tombstone.objects.filter(model=model._meta.label_lower, change__in=changes_since(since))
+    tombstones = tombstones.filter(Q(depot='') | Q(depot=depot)) if depot else tombstones.filter(depot='')
+    return list(tombstones.order_by('change__version').values_list('object_id', flat=True))
+
+
+def record_deletes(model, object_ids: Iterable[int]) -> None:
+    """Tombstones for rows deleted without signals; call in the deleting ``Change.scope()``"""
+    change = Change.current()
+    label = model._meta.label_lower
+    Tombstone.objects.bulk_create(
+        (Tombstone(model=label, object_id=object_id, change_id=change) for object_id in object_ids),
+        batch_size=1000,
+    )
+
+
+def record_delete(sender, instance, **kwargs) -> None:
+    """post_delete receiver; runs inside the delete's transaction"""
+    Tombstone.objects.create(
+        model=sender._meta.label_lower, object_id=instance.pk, change_id=Change.current()
+    )
+
+
+def depot_pre_save(sender, instance, raw=False, update_fields=None, **kwargs) -> None:
+    """Remember the stored depot so post_save can record a move out of it"""
+    instance._change_feed_depot = None
+    if raw or instance.pk is None or (update_fields is not None and 'depot' not in update_fields):
+        return
+    stored = instance.stored_values('depot')
+    if stored is None:
+        stored = sender.objects.filter(pk=instance.pk).values_list('depot').first()
+    instance._change_feed_depot = stored and stored[0]
+
+
+def depot_post_save(sender, instance, raw=False, **kwargs) -> None:
+    """post_save receiver; runs inside save()'s change, after the row was stamped with it"""
+    previous = getattr(instance, '_change_feed_depot', None)
+    instance._change_feed_depot = None
+    if raw or not previous or previous == instance.depot:
+        return
+    Tombstone.objects.create(
+        model=sender._meta.label_lower, object_id=instance.pk, change_id=instance.sync_version, depot=previous
+    )
+
+
+def route_pre_delete(sender, instance: Route, **kwargs) -> None:
+    """The route's orders are unlinked by SET_NULL, which doesn't save them"""
+    Order.objects.filter(assigned_route=instance).update(sync_version=Change.current())
+
+
+def prune(days: Optional[int] = None) -> int:
+    """Delete changes and tombstones older than ``days`` (CHANGE_FEED_RETENTION_DAYS); returns how many tombstones"""
+    if days is None:
+        days = settings.CHANGE_FEED_RETENTION_DAYS
+    cutoff = timezone.now() - timedelta(days=days)
+    with transaction.atomic():
+        newest = Change.objects.filter(created_at__lt=cutoff).aggregate(newest=Max('version'))['newest']
+        if newest is None:
+            return 0
+        # Feeds from before the newest pruned change could miss deletes
+        ChangeCounter.objects.filter(pk=1, pruned_through__lt=newest).update(pruned_through=newest)
+        count, _ = Tombstone.objects.filter(change__version__lte=newest).delete()
+        Change.objects.filter(version__lte=newest).delete()
+    logger.info("Pruned change feed through version %d (%d tombstones)", newest, count)
+    return count
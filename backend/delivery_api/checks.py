@@ -0,0 +1,27 @@
+"""
+System checks for settings that are only wrong in combination.
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Cache backends whose keys are private to one process
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_admission_cache(app_configs, **kwargs):
+    """Admission control keeps its slots in the default cache, which every worker must share"""
+    if not settings.ADMISSION_CONTROL_ENABLED:
+        return []
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Error(
+        f'ADMISSION_CONTROL_ENABLED needs a cache shared by all worker processes, not {backend}.',
+        hint='Set CACHE_URL to a shared cache such as redis://localhost:6379/0, '
+             'or set ADMISSION_CONTROL_ENABLED=False.',
+        id='delivery_api.E001',
+    )]
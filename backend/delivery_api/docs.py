@@ -0,0 +1,105 @@
+"""
+OpenAPI schema and API documentation views.
+
+drf_spectacular and its YAML and JSON-schema dependencies make up a good part
+of start-up time, yet only /api/schema/, /api/docs/ and /api/redoc/ use them,
+so these views import it on their first request. /api/schema/ serves the
+schema written at build time (build.sh runs ``manage.py spectacular`` into
+OPENAPI_SCHEMA_DIR) straight from memory and only generates it per request
+when the build output is missing or the request asks for a variant of it
+(``?lang=``, ``?version=``).
+"""
+import os
+import sys
+import threading
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.schemas.inspectors import ViewInspector
+
+# Media types, as drf_spectacular serves them
+SCHEMA_FORMATS = {
+    'yaml': ('schema.yaml', 'application/vnd.oai.openapi'),
+    'json': ('schema.json', 'application/vnd.oai.openapi+json'),
+}
+
+_schemas: Dict[str, Optional[bytes]] = {}
+_schemas_lock = threading.Lock()
+
+
+class LazyAutoSchema(ViewInspector):
+    """
+    DEFAULT_SCHEMA_CLASS that doesn't import drf_spectacular.
+
+    DRF creates the schema class whenever a view's ``schema`` is read, which
+    the router does for every viewset while the URLconf is built. Until
+    schema generation has imported drf_spectacular.openapi this is a bare
+    ViewInspector; from then on it is drf_spectacular's AutoSchema.
+    """
+
+    def __new__(cls, *args, **kwargs):
+        openapi = sys.modules.get('drf_spectacular.openapi')
+        if openapi is not None:
+            return openapi.AutoSchema(*args, **kwargs)
+        return super().__new__(cls)
+
+
+def lazy_view(view_path: str, **initkwargs):
+    """A class-based view imported, and set up with ``initkwargs``, on its first request"""
+    view = None
+    lock = threading.Lock()
+
+    @csrf_exempt
+    def dispatch(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            with lock:
+                if view is None:
+                    view = import_string(view_path).as_view(**initkwargs)
+        return view(request, *args, **kwargs)
+
+    return dispatch
+
+
+def load_schema(schema_format: str) -> Optional[bytes]:
+    """The build-time schema file in ``schema_format``, or None if it wasn't built"""
+    with _schemas_lock:
+        if schema_format not in _schemas:
+            file_name = SCHEMA_FORMATS[schema_format][0]
+            try:
+                with open(os.path.join(settings.OPENAPI_SCHEMA_DIR, file_name), 'rb') as file:
+                    _schemas[schema_format] = file.read()
+            except FileNotFoundError:
+                _schemas[schema_format] = None
+        return _schemas[schema_format]
+
+
+def _requested_format(request) -> str:
+    requested = request.GET.get('format')
+    if requested:
+        return 'json' if 'json' in requested else 'yaml'
+    media_types = [part.split(';')[0].strip() for part in request.headers.get('Accept', '').split(',')]
+    # Content negotiation picks YAML unless the client only takes JSON
+    if any('yaml' in media_type or media_type == 'application/vnd.oai.openapi' for media_type in media_types):
+        return 'yaml'
+    return 'json' if any('json' in media_type for media_type in media_types) else 'yaml'
+
+
+_generated_schema_view = lazy_view('drf_spectacular.views.SpectacularAPIView')
+
+
+@csrf_exempt
+def schema_view(request, *args, **kwargs):
+    """The OpenAPI schema, from the build output when there is one"""
+    if request.method == 'GET' and not {'lang', 'version'} & request.GET.keys():
+        schema_format = _requested_format(request)
+        content = load_schema(schema_format)
+        if content is not None:
+            file_name, content_type = SCHEMA_FORMATS[schema_format]
+            response = HttpResponse(content, content_type=f'{content_type}; charset=utf-8')
+            response['Content-Disposition'] = f'inline; filename="{file_name}"'
+            return response
+    return _generated_schema_view(request, *args, **kwargs)
@@ -0,0 +1,127 @@
+"""
+Discrete-event dispatch of one day's orders.
+
+In event mode the simulation no longer assumes every order leaves at the start
+time. ``num_drivers`` drivers start at the depot at the run's start time and
+take orders one at a time, earliest requested delivery time first. A trip is
+out to the customer and back, and each leg takes the route's base time scaled
+by the route's traffic multiplier for the hour of day the leg starts (the rule
+set's ``time_of_day_factors``), so the same route is slower in rush hour.
+
+The future event list is a heap of driver-return events keyed by time. Each
+dispatch pops the earliest returning driver, schedules the delivery and the
+driver's next return, and pushes that back (one ``heapreplace``), so the loop
+does O(log drivers) work per order over plain Python floats.
+
+A driver works at most ``shift_minutes`` from the start time. When the
+earliest free driver's round trip would not be back before the end of the
+shift, the order is offered to the other drivers in the order they become
+free: travel time depends on the hour a leg starts, so a driver who leaves
+later can still be back in time. An order no driver can fit into the day is
+left undelivered and dispatch continues with the next order. When drivers
+differ (multi-day runs, where fatigue slows some down and weekly limits
+shorten their day) every order is offered that way.
+"""
+import heapq
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+# Driver column value for orders no driver could deliver within the shift
+UNDELIVERED = -1
+MINUTES_PER_HOUR = 60
+HOURS_PER_DAY = 24
+
+
+def dispatch_orders(*, priority: np.ndarray, base_minutes: np.ndarray, route_of: np.ndarray,
+                    hourly_multipliers: np.ndarray, num_drivers: int, shift_minutes: float,
+                    start_minute: float, speed_factors: Optional[Sequence[float]] = None,
+                    shift_limits: Optional[Sequence[float]] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Run the event loop.
+
+    ``base_minutes`` and ``route_of`` (row of ``hourly_multipliers``, routes x
+    24) describe each order; ``priority`` is the order of dispatch as
+    positions in those arrays. ``speed_factors`` and ``shift_limits``
+    optionally give each driver a factor on travel time and a shorter day
+    (minutes, at most ``shift_minutes``); a driver with a limit of 0 doesn't
+    work. Returns per order the driver that delivered it (UNDELIVERED if none)
+    and the arrival time in minutes after the start, and per driver the
+    minutes worked.
+    """
+    count = base_minutes.size
+    driver = [UNDELIVERED] * count
+    arrival = [0.0] * count
+    worked = [0.0] * num_drivers
+    if num_drivers > 0 and count:
+        base = base_minutes.tolist()
+        routes = route_of.tolist()
+        multipliers = hourly_multipliers.tolist()
+        lightest = hourly_multipliers.min(axis=1).tolist()
+        # (time the driver is back at the depot, driver); already a heap
+        drivers = [(0.0, d) for d in range(num_drivers)]
+        heapreplace, heappop, heappush = heapq.heapreplace, heapq.heappop, heapq.heappush
+
+        if speed_factors is None and shift_limits is None:
+            for order in priority.tolist():
+                free_at, d = drivers[0]
+                minutes = base[order]
+                factors = multipliers[routes[order]]
+                arrives = free_at + minutes * factors[int((start_minute + free_at) // MINUTES_PER_HOUR) % HOURS_PER_DAY]
+                back = arrives + minutes * factors[int((start_minute + arrives) // MINUTES_PER_HOUR) % HOURS_PER_DAY]
+                if back <= shift_minutes:
+                    heapreplace(drivers, (back, d))
+                    driver[order] = d
+                    arrival[order] = arrives
+                    continue
+                # Too late for the first one free: try the others as they
+                # become free (drivers free at the same time fare the same),
+                # up to the last start that could be back in time at the
+                # route's lightest traffic
+                latest = shift_minutes - 2 * minutes * lightest[routes[order]]
+                passed = [heappop(drivers)]
+                while drivers and drivers[0][0] <= latest:
+                    free_at, d = drivers[0]
+                    if free_at != passed[-1][0]:
+                        arrives = free_at + minutes * factors[int((start_minute + free_at) // MINUTES_PER_HOUR) % HOURS_PER_DAY]
+                        back = arrives + minutes * factors[int((start_minute + arrives) // MINUTES_PER_HOUR) % HOURS_PER_DAY]
+                        if back <= shift_minutes:
+                            heapreplace(drivers, (back, d))
+                            driver[order] = d
+                            arrival[order] = arrives
+                            break
+                    passed.append(heappop(drivers))
+                for entry in passed:
+                    heappush(drivers, entry)
+        else:
+            speed = list(speed_factors) if speed_factors is not None else [1.0] * num_drivers
+            limits = [min(shift_minutes, limit) for limit in shift_limits] if shift_limits is not None \
+                else [shift_minutes] * num_drivers
+            drivers = [(0.0, d) for d in range(num_drivers) if limits[d] > 0]
+            for order in priority.tolist():
+                # Drivers are no longer alike, so the first one free may be
+                # the wrong one: try them in the order they become free
+                passed = []
+                while drivers:
+                    free_at, d = drivers[0]
+                    if free_at >= limits[d]:
+                        # Done for the day
+                        worked[d] = free_at
+                        heappop(drivers)
+                        continue
+                    minutes = base[order] * speed[d]
+                    factors = multipliers[routes[order]]
+                    arrives = free_at + minutes * factors[int((start_minute + free_at) // MINUTES_PER_HOUR) % HOURS_PER_DAY]
+                    back = arrives + minutes * factors[int((start_minute + arrives) // MINUTES_PER_HOUR) % HOURS_PER_DAY]
+                    if back <= limits[d]:
+                        heapreplace(drivers, (back, d))
+                        driver[order] = d
+                        arrival[order] = arrives
+                        break
+                    passed.append(heappop(drivers))
+                for entry in passed:
+                    heappush(drivers, entry)
+
+        for free_at, d in drivers:
+            worked[d] = free_at
+
+    return np.array(driver, dtype=np.int32), np.array(arrival, dtype=np.float64), np.array(worked, dtype=np.float64)
@@ -0,0 +1,97 @@
+"""
+Multi-day simulation with a rolling 7-day driver fatigue window.
+
+The order book is dispatched once per day in event mode (see
+event_simulation.py), with the same start time of day on each of ``days``
+consecutive days. Every driver carries the hours worked on each of the last
+seven days in one row of a (drivers x 7) array, oldest first. Before each day:
+
+- a driver who worked more than the rule set's ``fatigue_threshold_hours``
+  the day before is fatigued, and their travel times are multiplied by
+  ``fatigue_time_factor``;
+- a driver may only work as many hours as keep the last seven days (the six
+  before today plus today) within ``max_weekly_hours``, and at most
+  ``max_hours_per_day``; a driver with no hours left rests for the day.
+
+After the day the window shifts by one column and the day's hours go in the
+last. ``/api/simulate/`` in event mode and event-mode scenarios evaluate
+the first of these days (``DatasetSnapshot.evaluate_day()``). Daily KPIs are computed as the day is simulated, so a whole horizon is
+one pass over the days with no writes.
+
+As in ``/api/simulate/``, each depot's drivers only deliver that depot's
+orders: ``num_drivers`` is split across the depots (``depot_drivers()``),
+every depot is dispatched on its own with its own drivers' history, and
+each day's depot evaluations are merged before the KPIs are taken.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+import numpy as np
+
+from .models import DEFAULT_DEPOT
+from .rules import EvaluationPlan
+from .sharding import depot_drivers, merge_evaluations
+from .simulation import DatasetSnapshot, driver_limits, summarize
+
+MINUTES_PER_HOUR = 60
+
+
+def simulate_horizon(snapshot: DatasetSnapshot, plan: EvaluationPlan, *, num_drivers: int, days: int,
+                     max_hours_per_day: int, start_time: datetime) -> Dict[str, Any]:
+    """Daily KPIs, totals and final driver state for ``days`` consecutive days"""
+    if len(snapshot.depots) > 1:
+        shards = [snapshot.shard(depot) for depot in snapshot.depots]
+        drivers = depot_drivers(snapshot, num_drivers)
+    else:
+        shards, drivers = [snapshot], [num_drivers]
+    depots = [shard.depots[0] if shard.depots else DEFAULT_DEPOT for shard in shards]
+    histories = [shard.driver_history(shard_drivers) for shard, shard_drivers in zip(shards, drivers)]
+    inputs = [shard.event_inputs(plan) for shard in shards]
+    start_minute = start_time.hour * MINUTES_PER_HOUR + start_time.minute + start_time.second / 60
+    shift_minutes = max_hours_per_day * MINUTES_PER_HOUR
+
+    daily: List[Dict[str, Any]] = []
+    for day in range(days):
+        evaluations = []
+        resting = fatigued_drivers = 0
+        for shard, shard_drivers, (_, history), shard_inputs in zip(shards, drivers, histories, inputs):
+            fatigued, allowance = driver_limits(plan, history, max_hours_per_day)
+            evaluation = shard.evaluate_day(plan, shard_drivers, shift_minutes, start_minute,
+                                            history=history, inputs=shard_inputs)
+            history[:, :-1] = history[:, 1:]
+            history[:, -1] = evaluation.driver_minutes / MINUTES_PER_HOUR
+            evaluations.append(evaluation)
+            resting += int((allowance <= 0).sum())
+            fatigued_drivers += int(fatigued.sum())
+        evaluation = evaluations[0] if len(shards) == 1 else merge_evaluations(snapshot, evaluations)
+
+        daily.append({
+            'day': day + 1,
+            'date': (start_time + timedelta(days=day)).date(),
+            **summarize(evaluation, snapshot.total_orders),
+            'undelivered_orders': int(evaluation.undelivered.sum()),
+            'drivers_resting': resting,
+            'drivers_fatigued': fatigued_drivers,
+            'driver_hours': float((evaluation.driver_minutes / MINUTES_PER_HOUR).sum()),
+        })
+
+    total_orders = sum(day['total_orders'] for day in daily)
+    on_time_deliveries = sum(day['on_time_deliveries'] for day in daily)
+    return {
+        'daily': daily,
+        'totals': {
+            'total_profit': sum(day['total_profit'] for day in daily),
+            'total_fuel_cost': sum(day['total_fuel_cost'] for day in daily),
+            'total_orders': total_orders,
+            'on_time_deliveries': on_time_deliveries,
+            'late_deliveries': total_orders - on_time_deliveries,
+            'undelivered_orders': sum(day['undelivered_orders'] for day in daily),
+            'efficiency_score': (on_time_deliveries / total_orders) * 100 if total_orders > 0 else 0,
+            'driver_hours': sum(day['driver_hours'] for day in daily),
+        },
+        'drivers': [
+            {'name': name, 'depot': depot, 'last_7_days_hours': [round(h, 2) for h in row]}
+            for depot, (names, history) in zip(depots, histories)
+            for name, row in zip(names, history.tolist())
+        ],
+    }
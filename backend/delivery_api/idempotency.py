@@ -0,0 +1,208 @@
+"""
+Idempotency-Key support and single-flight deduplication for mutating views.
+
+A POST/PUT/PATCH/DELETE carrying an ``Idempotency-Key`` header claims that key
+for the authenticated user by inserting an IdempotencyRecord before the view
+runs. When the view finishes, its response is stored on the record and any
+later request with the same key gets that response back (marked with
+``Idempotent-Replayed: true``) instead of doing the work again. A duplicate
+that arrives while the first request is still running waits for it to finish
+(up to IDEMPOTENCY_WAIT_TIMEOUT seconds) and then receives the same response,
+so double-clicks and proxy retries share one computation. On a
+single-threaded WSGI worker (``wsgi.multithread`` false, gunicorn's sync
+worker) waiting would hold the worker for nothing, so the duplicate gets 409
+with ``Retry-After`` at once, as admission control does.
+
+Views with ``idempotency_single_flight = True`` (the simulation endpoint) get
+the waiting behaviour even without a header: the request fingerprint itself is
+used as the key while the request is in flight, and the stored response is
+only handed to requests that were waiting on it. A new identical request that
+arrives after completion starts a fresh run.
+
+Reusing a key with a different body is rejected with 422. Server errors (5xx)
+and 429 rejections are not stored; the claim is released so the client can retry.
+"""
+import hashlib
+import json
+import logging
+import time
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http.request import RawPostDataException
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyRecord
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MUTATING_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+MAX_KEY_LENGTH = IdempotencyRecord._meta.get_field('key').max_length
+
+# Prefix for keys derived from the request itself (single-flight without a header)
+AUTO_KEY_PREFIX = 'auto:'
+POLL_INTERVAL = 0.1
+MAX_POLL_INTERVAL = 1.0
+
+
+class _ShortCircuit(APIException):
+    """Carries a ready response out of ``initial()`` past the handler"""
+
+    def __init__(self, response: Response):
+        super().__init__()
+        self.response = response
+
+
+def request_fingerprint(request) -> str:
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(b'\0')
+    digest.update(request.get_full_path().encode())
+    digest.update(b'\0')
+    try:
+        body = request._request.body
+    except RawPostDataException:
+        # Stream already consumed by a parser; fall back to the parsed data
+        body = json.dumps(request.data, cls=JSONEncoder, sort_keys=True).encode()
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def _replay(record: IdempotencyRecord) -> Response:
+    data = json.loads(record.response_body) if record.response_body else None
+    return Response(data, status=record.status_code, headers={REPLAYED_HEADER: 'true'})
+
+
+class IdempotencyMixin:
+    """Deduplicate mutating requests on APIViews/ViewSets by Idempotency-Key"""
+    idempotency_single_flight = False
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._idempotency_record = None
+        if request.method not in MUTATING_METHODS or not request.user.is_authenticated:
+            return
+
+        key = request.META.get(IDEMPOTENCY_HEADER)
+        if key is not None:
+            key = key.strip()
+            if not key or len(key) > MAX_KEY_LENGTH or key.startswith(AUTO_KEY_PREFIX):
+                raise _ShortCircuit(Response(
+                    {'error': f'Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters and not start with "{AUTO_KEY_PREFIX}".'},
+                    status=status.HTTP_400_BAD_REQUEST
+                ))
+        elif not self.idempotency_single_flight:
+            return
+
+        arrived_at = timezone.now()
+        fingerprint = request_fingerprint(request)
+        if key is None:
+            key = AUTO_KEY_PREFIX + fingerprint
+        # Polling would block a single-threaded worker (see module docstring)
+        wait = request.META.get('wsgi.multithread', True)
+        response = self._claim_or_wait(request.user, key, fingerprint, arrived_at, wait)
+        if response is not None:
+            raise _ShortCircuit(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, _ShortCircuit):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        record = getattr(self, '_idempotency_record', None)
+        if record is not None:
+            self._idempotency_record = None
+            self._store_response(record, response)
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # Unhandled exception: finalize_response never ran, free the key
+            record = getattr(self, '_idempotency_record', None)
+            if record is not None:
+                self._idempotency_record = None
+                IdempotencyRecord.objects.filter(pk=record.pk, completed=False).delete()
+
+    def _claim(self, user, key: str, fingerprint: str) -> Optional[IdempotencyRecord]:
+        now = timezone.now()
+        if key.startswith(AUTO_KEY_PREFIX):
+            expires_at = now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+        else:
+            expires_at = now + timedelta(seconds=settings.IDEMPOTENCY_TTL)
+        try:
+            with transaction.atomic():
+                IdempotencyRecord.objects.filter(user=user, expires_at__lte=now).delete()
+                return IdempotencyRecord.objects.create(
+                    user=user, key=key, fingerprint=fingerprint, expires_at=expires_at
+                )
+        except IntegrityError:
+            return None
+
+    def _claim_or_wait(self, user, key: str, fingerprint: str, arrived_at, wait: bool) -> Optional[Response]:
+        """Claim ``key`` for this request, or return the response to send instead"""
+        timeout = settings.IDEMPOTENCY_WAIT_TIMEOUT if wait else 0
+        deadline = time.monotonic() + timeout
+        interval = POLL_INTERVAL
+        while True:
+            record = self._claim(user, key, fingerprint)
+            if record is not None:
+                self._idempotency_record = record
+                return None
+
+            record = IdempotencyRecord.objects.filter(user=user, key=key).first()
+            if record is None:
+                # Released (or purged) between our insert and read; try again
+                continue
+            if record.fingerprint != fingerprint:
+                return Response(
+                    {'error': 'Idempotency-Key was already used with a different request.'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+
+            if record.completed:
+                if not key.startswith(AUTO_KEY_PREFIX) or record.completed_at >= arrived_at:
+                    # Keyed replay, or we arrived while this result was in flight
+                    return _replay(record)
+                # Finished single-flight result from an earlier request: run afresh
+                IdempotencyRecord.objects.filter(pk=record.pk).delete()
+                continue
+
+            stale_before = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+            if record.created_at <= stale_before:
+                logger.warning("Taking over stale idempotency claim %s", record)
+                IdempotencyRecord.objects.filter(pk=record.pk, completed=False).delete()
+                continue
+
+            if time.monotonic() >= deadline:
+                return Response(
+                    {'error': 'An identical request is still being processed. Retry later.'},
+                    status=status.HTTP_409_CONFLICT,
+                    headers={'Retry-After': str(max(1, int(timeout)))}
+                )
+            time.sleep(interval)
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+
+    def _store_response(self, record: IdempotencyRecord, response: Response) -> None:
+        if response.status_code >= 500 or response.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
+            # Retryable: don't pin the key to a transient failure or rejection
+            IdempotencyRecord.objects.filter(pk=record.pk, completed=False).delete()
+            return
+        data = getattr(response, 'data', None)
+        IdempotencyRecord.objects.filter(pk=record.pk).update(
+            completed=True,
+            completed_at=timezone.now(),
+            status_code=response.status_code,
+            response_body='' if data is None else json.dumps(data, cls=JSONEncoder),
+        )
@@ -0,0 +1,32 @@
+"""
+Named locks for resources shared between concurrent simulations.
+
+On PostgreSQL these are transaction-scoped advisory locks, so they are held
+across gunicorn workers and hosts and are released automatically on commit
+or rollback. SQLite already serializes writers: with the IMMEDIATE
+transaction mode configured in settings, the enclosing atomic block holds
+the database write lock, so no extra locking is needed there.
+"""
+import zlib
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+
+
+def _lock_key(name: str) -> int:
+    # pg_advisory_xact_lock takes a signed bigint
+    return zlib.crc32(name.encode()) - 2 ** 31
+
+
+@contextmanager
+def advisory_lock(name: str):
+    """Hold the named lock until the surrounding transaction ends.
+
+    Must be used inside transaction.atomic().
+    """
+    if not connection.in_atomic_block:
+        raise transaction.TransactionManagementError('advisory_lock() requires an atomic block')
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [_lock_key(name)])
+    yield
@@ -0,0 +1,159 @@
+"""
+Logging set-up for request threads that must not wait on log output.
+
+``configure()`` is Django's LOGGING_CONFIG: it applies ``settings.LOGGING``
+and then moves the root logger's handlers behind a bounded queue. Request
+threads only merge a record's arguments into its message and put it on the
+queue; a listener thread formats it, traceback included, and writes it to
+the file and console. When the queue is full the record is
+dropped rather than blocking the request, and the number dropped is logged
+once the queue has room again. Under gunicorn's preload the listener thread
+of the master doesn't survive the fork, so every process starts its own.
+
+Before a record is queued it passes ``SamplingFilter``: at most
+LOG_SAMPLE_BURST records per LOG_SAMPLE_INTERVAL seconds with the same
+logger, level and message template; the next record after a window notes
+how many were suppressed. Only warnings are sampled. Sampling works on the
+template, so log with %-style arguments, not f-strings.
+"""
+import atexit
+import copy
+import logging
+import logging.config
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+# Distinct message templates tracked at once; beyond it expired windows are forgotten
+MAX_SAMPLED_TEMPLATES = 1024
+
+
+class SamplingFilter(logging.Filter):
+    """Pass at most ``burst`` warnings per template every ``interval`` seconds"""
+
+    def __init__(self, burst: int, interval: float):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._windows: Dict[Tuple[str, int, str], List] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno != logging.WARNING:
+            return True
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                if len(self._windows) >= MAX_SAMPLED_TEMPLATES:
+                    self._forget_expired(now)
+                self._windows[key] = [now, 1, 0]
+            elif window[1] < self.burst:
+                window[1] += 1
+                return True
+            else:
+                window[2] += 1
+                return False
+        if suppressed:
+            record.msg = f'{record.getMessage()} ({suppressed} similar messages suppressed)'
+            record.args = None
+        return True
+
+    def _forget_expired(self, now: float) -> None:
+        expired = [key for key, window in self._windows.items() if now - window[0] >= self.interval]
+        for key in expired:
+            del self._windows[key]
+        if len(self._windows) >= MAX_SAMPLED_TEMPLATES:
+            self._windows.clear()
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """A QueueHandler that drops records instead of waiting when the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Bind the arguments now, since they may change once the call returns,
+        but leave formatting to the listener. QueueHandler.prepare would run
+        the formatter, traceback included, in the logging thread.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            notice = logging.makeLogRecord({
+                'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': '%d log records dropped: the log queue was full', 'args': (dropped,),
+            })
+            if not self._put(notice):
+                self._count_dropped(dropped + 1)
+                return
+        if not self._put(record):
+            self._count_dropped(1)
+
+    def _put(self, record: logging.LogRecord) -> bool:
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except queue.Full:
+            return False
+
+    def _count_dropped(self, count: int) -> None:
+        with self._dropped_lock:
+            self.dropped += count
+
+
+_handler: Optional[NonBlockingQueueHandler] = None
+_listener: Optional[QueueListener] = None
+_targets: List[logging.Handler] = []
+
+
+def _start_listener() -> None:
+    global _listener
+    _handler.queue = queue.Queue(settings.LOG_QUEUE_SIZE)
+    _listener = QueueListener(_handler.queue, *_targets, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener() -> None:
+    global _listener
+    if _listener is not None:
+        # Writes out what is still queued
+        _listener.stop()
+        _listener = None
+
+
+def configure(logging_settings) -> None:
+    """LOGGING_CONFIG: dictConfig, then queue the root logger's handlers"""
+    global _handler, _targets
+    logging.config.dictConfig(logging_settings)
+    if not settings.LOG_QUEUE_ENABLED:
+        return
+    _stop_listener()
+    root = logging.getLogger()
+    _targets = list(root.handlers)
+    if _handler is None:
+        _handler = NonBlockingQueueHandler(queue.Queue(settings.LOG_QUEUE_SIZE))
+        _handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_BURST, settings.LOG_SAMPLE_INTERVAL))
+        atexit.register(_stop_listener)
+        os.register_at_fork(after_in_child=_start_listener)
+    for handler in _targets:
+        root.removeHandler(handler)
+    root.addHandler(_handler)
+    _start_listener()
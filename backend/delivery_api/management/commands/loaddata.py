@@ -7,7 +7,7 @@ from django.db import transaction, DatabaseError, IntegrityError
 from django.core.exceptions import ValidationError
 from django.utils.timezone import now
 from django.conf import settings
-from delivery_api.models import Driver, Route, Order
+from delivery_api.models import DEFAULT_DEPOT, Driver, Route, Order
 from datetime import datetime, timedelta
 from decimal import Decimal, InvalidOperation
 import logging
@@ -20,6 +20,14 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('--data-dir', type=str, help='Directory containing CSV files')
 
+    @staticmethod
+    def parse_delivery_time(value: Optional[str]) -> Optional[int]:
+        """'HH:MM' to minutes; None when the column is empty"""
+        if not value or not value.strip():
+            return None
+        hours, minutes = value.strip().split(':')
+        return int(hours) * 60 + int(minutes)
+
     def handle(self, *args, **options):
         data_dir = options.get('data_dir', '')
         
@@ -47,7 +55,11 @@ class Command(BaseCommand):
                             name=row['name'],
                             defaults={
                                 'current_shift_hours': row['shift_hours'],
-                                'past_7_day_work_hours': total_past_week_hours
+                                'past_7_day_work_hours': total_past_week_hours,
+                                # Per-day breakdown, oldest first, for multi-day simulations
+                                'past_week_daily_hours': past_week_hours_list,
+                                # Optional depot column; single-depot data has none
+                                'depot': row.get('depot') or DEFAULT_DEPOT
                             }
                         )
                     except Exception as e:
@@ -67,7 +79,8 @@ class Command(BaseCommand):
                             defaults={
                                 'distance_km': row['distance_km'],
                                 'traffic_level': row['traffic_level'],
-                                'base_time': row['base_time_min']
+                                'base_time': row['base_time_min'],
+                                'depot': row.get('depot') or DEFAULT_DEPOT
                             }
                         )
                     except Exception as e:
@@ -87,9 +100,12 @@ class Command(BaseCommand):
                             defaults={
                                 'value_rs': row['value_rs'],
                                 'assigned_route': route,
-                                # delivery_timestamp is not included in the initial data load.
-                                # The CSV only contains a time string, not a full date.
-                                # It will be populated during the simulation.
+                                # Orders are served from their route's depot
+                                'depot': route.depot,
+                                # The CSV's delivery_time (HH:MM) is the requested
+                                # delivery time relative to the run's start.
+                                # delivery_timestamp is populated by the simulation.
+                                'delivery_time': self.parse_delivery_time(row.get('delivery_time')),
                             }
                         )
                     except Route.DoesNotExist:
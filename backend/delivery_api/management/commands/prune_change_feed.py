@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from delivery_api.change_feed import prune
+
+
+class Command(BaseCommand):
+    help = 'Removes change feed changes and tombstones older than CHANGE_FEED_RETENTION_DAYS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Keep this many days instead of CHANGE_FEED_RETENTION_DAYS')
+
+    def handle(self, *args, **options):
+        count = prune(options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Pruned {count} change feed tombstone(s)'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from delivery_api.route_stats import rebuild_all
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the per-route order statistics used for projected KPIs'
+
+    def handle(self, *args, **options):
+        count = rebuild_all()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt route statistics for {count} high-value threshold(s)'))
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery_api', '0003_simulationrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderOutcome',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_late', models.BooleanField(default=False)),
+                ('delivery_minutes', models.IntegerField(help_text="Delivery time in minutes from the run's start time")),
+                ('fuel_cost', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('penalty', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('bonus', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('profit', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='outcomes', to='delivery_api.order')),
+                ('route', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='outcomes', to='delivery_api.route')),
+                ('simulation_run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outcomes', to='delivery_api.simulationrun')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('simulation_run', 'order'), name='unique_outcome_per_run_order')],
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:04
+
+import delivery_api.models
+import django.core.validators
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_default_rule_set(apps, schema_editor):
+    # Version 1 holds the rules that were hard-coded in the simulation view
+    RuleSet = apps.get_model('delivery_api', 'RuleSet')
+    if not RuleSet.objects.exists():
+        RuleSet.objects.create(name='Company defaults', is_active=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery_api', '0005_idempotencyrecord'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RuleSet',
+            fields=[
+                ('version', models.AutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('is_active', models.BooleanField(default=False)),
+                ('fuel_cost_per_km', models.DecimalField(decimal_places=2, default=Decimal('5.00'), max_digits=8, validators=[django.core.validators.MinValueValidator(0)])),
+                ('traffic_levels', models.JSONField(default=delivery_api.models.default_traffic_levels, help_text='Per traffic level fuel_surcharge_per_km and time_multiplier')),
+                ('late_threshold_minutes', models.PositiveIntegerField(default=10, help_text='Minutes over base time before a delivery is late')),
+                ('late_penalty', models.DecimalField(decimal_places=2, default=Decimal('50.00'), max_digits=10, validators=[django.core.validators.MinValueValidator(0)])),
+                ('high_value_threshold', models.DecimalField(decimal_places=2, default=Decimal('1000.00'), max_digits=10, validators=[django.core.validators.MinValueValidator(0)])),
+                ('high_value_bonus_rate', models.DecimalField(decimal_places=2, default=Decimal('0.10'), max_digits=3, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(1)])),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-version'],
+            },
+        ),
+        migrations.AddField(
+            model_name='simulationrun',
+            name='rule_set',
+            field=models.ForeignKey(blank=True, help_text='Rule set version the run used', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='simulation_runs', to='delivery_api.ruleset'),
+        ),
+        migrations.AddConstraint(
+            model_name='ruleset',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('is_active',), name='single_active_rule_set'),
+        ),
+        migrations.RunPython(create_default_rule_set, migrations.RunPython.noop),
+    ]
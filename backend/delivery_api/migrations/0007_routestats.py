@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery_api', '0006_ruleset'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('high_value_threshold', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('order_count', models.IntegerField(default=0)),
+                ('value_sum_cents', models.BigIntegerField(default=0)),
+                ('high_value_count', models.IntegerField(default=0, help_text='Orders with value_rs above the threshold')),
+                ('high_value_sum_cents', models.BigIntegerField(default=0)),
+                ('route', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='delivery_api.route')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('route__isnull', False)), fields=('route', 'high_value_threshold'), name='unique_route_stats_per_threshold'), models.UniqueConstraint(condition=models.Q(('route__isnull', True)), fields=('high_value_threshold',), name='unique_unassigned_stats_per_threshold')],
+            },
+        ),
+    ]
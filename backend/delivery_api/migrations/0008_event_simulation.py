@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:15
+
+import delivery_api.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery_api', '0007_routestats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='delivery_time',
+            field=models.PositiveIntegerField(blank=True, help_text="Requested delivery time in minutes after the run's start time", null=True),
+        ),
+        migrations.AddField(
+            model_name='ruleset',
+            name='time_of_day_factors',
+            field=models.JSONField(default=delivery_api.models.default_time_of_day_factors, help_text='Per traffic level, 24 hourly factors on the time multiplier (event-mode simulations only)'),
+        ),
+        migrations.AddField(
+            model_name='simulationrun',
+            name='mode',
+            field=models.CharField(choices=[('batch', 'Batch: every order leaves at the start time'), ('event', 'Event: orders dispatched by drivers over the day')], default='batch', max_length=10),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:18
+
+import django.core.validators
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery_api', '0008_event_simulation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='driver',
+            name='past_week_daily_hours',
+            field=models.JSONField(blank=True, default=list, help_text='Hours worked on each of the last 7 days, oldest first'),
+        ),
+        migrations.AddField(
+            model_name='ruleset',
+            name='fatigue_threshold_hours',
+            field=models.DecimalField(decimal_places=2, default=Decimal('8.00'), help_text='Hours in a day after which a driver is fatigued the next day', max_digits=4, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.AddField(
+            model_name='ruleset',
+            name='fatigue_time_factor',
+            field=models.DecimalField(decimal_places=2, default=Decimal('1.30'), help_text="Factor on a fatigued driver's travel times", max_digits=3, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='ruleset',
+            name='max_weekly_hours',
+            field=models.DecimalField(decimal_places=2, default=Decimal('60.00'), help_text='Most hours a driver may work in any 7 consecutive days', max_digits=5, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+    ]
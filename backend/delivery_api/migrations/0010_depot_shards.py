@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery_api', '0009_driver_fatigue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='driver',
+            name='depot',
+            field=models.CharField(db_index=True, default='main', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='depot',
+            field=models.CharField(db_index=True, default='main', help_text="Must match the assigned route's depot", max_length=50),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='depot',
+            field=models.CharField(db_index=True, default='main', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='simulationrun',
+            name='depot',
+            field=models.CharField(blank=True, db_index=True, default='', help_text='Depot the run was limited to; blank for a run over every depot', max_length=50),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery_api', '0010_depot_shards'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='simulation_run_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='simulationrun',
+            name='timestamp',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:43
+
+from django.db import migrations, models
+
+
+def create_change_counter(apps, schema_editor):
+    # Existing rows keep version 0: they predate the feed and come with a full list
+    ChangeCounter = apps.get_model('delivery_api', 'ChangeCounter')
+    ChangeCounter.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery_api', '0011_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+                ('pruned_through', models.BigIntegerField(default=0, help_text='Newest version whose tombstones were pruned')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='driver',
+            name='sync_version',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='sync_version',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='sync_version',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='simulationrun',
+            name='sync_version',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(help_text='Model label, e.g. delivery_api.order', max_length=100)),
+                ('object_id', models.BigIntegerField()),
+                ('version', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['model', 'version'], name='tombstone_model_version')],
+            },
+        ),
+        migrations.RunPython(create_change_counter, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery_api', '0012_change_feed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderoutcome',
+            name='driver',
+            field=models.IntegerField(blank=True, help_text="Index of the run's driver that delivered the order (event mode); null for runs that didn't dispatch", null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery_api', '0013_orderoutcome_driver'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tombstone',
+            name='depot',
+            field=models.CharField(blank=True, default='', help_text='Depot the row moved out of; blank for a delete', max_length=50),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-20 10:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+
+
+def restart_feed(apps, schema_editor):
+    # Tombstones held versions; from here on they and the rows hold change
+    # ids. Feeds from before this migration answer 410 and clients fetch the
+    # full list again. Rows keep their old sync_version: one that equals a
+    # later change's id is at worst sent again.
+    apps.get_model('delivery_api', 'Tombstone').objects.all().delete()
+    apps.get_model('delivery_api', 'ChangeCounter').objects.filter(pk=1).update(pruned_through=F('value'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery_api', '0014_tombstone_depot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(null=True, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.RunPython(restart_feed, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='tombstone',
+            name='tombstone_model_version',
+        ),
+        migrations.RemoveField(
+            model_name='tombstone',
+            name='version',
+        ),
+        migrations.AddField(
+            model_name='tombstone',
+            name='change',
+            field=models.ForeignKey(default=0, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='delivery_api.change'),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['model', 'change'], name='tombstone_model_change'),
+        ),
+        migrations.AlterField(
+            model_name='changecounter',
+            name='pruned_through',
+            field=models.BigIntegerField(default=0, help_text='Newest version whose changes were pruned'),
+        ),
+        migrations.AlterField(
+            model_name='driver',
+            name='sync_version',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False, help_text='Id of the change that last wrote the row'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='sync_version',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False, help_text='Id of the change that last wrote the row'),
+        ),
+        migrations.AlterField(
+            model_name='route',
+            name='sync_version',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False, help_text='Id of the change that last wrote the row'),
+        ),
+        migrations.AlterField(
+            model_name='simulationrun',
+            name='sync_version',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False, help_text='Id of the change that last wrote the row'),
+        ),
+    ]
@@ -1,19 +1,176 @@
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import F
+from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.translation import gettext_lazy as _
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Optional
+from decimal import Decimal
+from typing import Iterable, Iterator, Optional
 
-class Driver(models.Model):
+# Depot (region) of rows loaded without one; every depot is a simulation shard
+DEFAULT_DEPOT = 'main'
+
+
+def depot_field(**kwargs):
+    return models.CharField(max_length=50, default=DEFAULT_DEPOT, db_index=True, **kwargs)
+
+
+class ChangeCounter(models.Model):
+    """The change feed's version counter, a single row (see change_feed.py).
+
+    A writing transaction takes the next value as its last statement
+    (``Change.scope()``). Taking it locks the row until the commit, so
+    transactions commit in version order and a reader never sees version N
+    while one versioned below N is still to commit. The row is held only for
+    the commit itself, not for the transaction's writes.
+    """
+    value = models.BigIntegerField(default=0)
+    pruned_through = models.BigIntegerField(default=0, help_text="Newest version whose changes were pruned")
+
+    @classmethod
+    def next_version(cls) -> int:
+        """Take the next version; must be called inside the writing transaction"""
+        if not connection.in_atomic_block:
+            raise transaction.TransactionManagementError('next_version() requires an atomic block')
+        if not cls.objects.filter(pk=1).update(value=F('value') + 1):
+            # The migration creates the row; this covers a flushed database
+            cls.objects.get_or_create(pk=1)
+            cls.objects.filter(pk=1).update(value=F('value') + 1)
+        return cls.objects.filter(pk=1).values_list('value', flat=True).get()
+
+
+class Change(models.Model):
+    """One transaction's writes to change-tracked models (see change_feed.py).
+
+    Rows and tombstones are stamped with the change's id, an autoincrement
+    that takes no lock. The version is set from ChangeCounter when the
+    transaction is about to commit; a change without one hasn't committed.
+    """
+    version = models.BigIntegerField(null=True, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    @classmethod
+    @contextmanager
+    def scope(cls) -> Iterator[int]:
+        """Transaction for writes to change-tracked models; yields the change id to stamp.
+
+        Nested scopes share the outermost one's change. Its version is taken as
+        the scope's last statement, so the counter is locked only for the
+        commit when the scope is the outermost transaction.
+        """
+        active = getattr(connection, 'change_feed_change', None)
+        if active is not None:
+            yield active
+            return
+        with transaction.atomic():
+            change = cls.objects.create()
+            connection.change_feed_change = change.pk
+            try:
+                yield change.pk
+            finally:
+                connection.change_feed_change = None
+            cls.objects.filter(pk=change.pk).update(version=ChangeCounter.next_version())
+
+    @classmethod
+    def current(cls) -> int:
+        """The change of the scope in progress, else one versioned now (holding the counter until commit)"""
+        active = getattr(connection, 'change_feed_change', None)
+        if active is not None:
+            return active
+        return cls.objects.create(version=ChangeCounter.next_version()).pk
+
+
+class ChangeTracked(models.Model):
+    """Models with a change feed: every save() stamps the row with its change (``Change.scope()``).
+
+    ``QuerySet.update()`` and ``bulk_update()`` bypass this, so callers add
+    ``sync_version`` themselves; deletes are recorded as Tombstones by the
+    signal handlers in change_feed.py.
+
+    An instance remembers the values it was loaded, refreshed or last saved
+    with, so pre_save handlers can see what a save changes without reading
+    the row again (``stored_values()``).
+    """
+    sync_version = models.BigIntegerField(default=0, db_index=True, editable=False,
+                                          help_text="Id of the change that last wrote the row")
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stored_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._remember_stored(kwargs.get('fields'))
+
+    def _remember_stored(self, fields: Optional[Iterable[str]] = None) -> None:
+        if fields is None:
+            deferred = self.get_deferred_fields()
+            attnames = [f.attname for f in self._meta.concrete_fields if f.attname not in deferred]
+        else:
+            attnames = [self._meta.get_field(name).attname for name in fields]
+        stored = getattr(self, '_stored_values', {})
+        self._stored_values = {**stored, **{name: getattr(self, name) for name in attnames}}
+
+    def stored_values(self, *attnames: str) -> Optional[tuple]:
+        """The values of ``attnames`` as last loaded or saved, or None if one isn't known"""
+        stored = getattr(self, '_stored_values', None)
+        if stored is None or self._state.adding or not all(name in stored for name in attnames):
+            return None
+        return tuple(stored[name] for name in attnames)
+
+    def save(self, *args, **kwargs):
+        if kwargs.get('update_fields') is not None and not kwargs['update_fields']:
+            # Django saves nothing for an empty update_fields
+            return super().save(*args, **kwargs)
+        with Change.scope() as change:
+            self.sync_version = change
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'sync_version'}
+            super().save(*args, **kwargs)
+        self._remember_stored(kwargs.get('update_fields'))
+
+    def delete(self, *args, **kwargs):
+        # The tombstones (and cascaded deletes) share one change
+        with Change.scope():
+            return super().delete(*args, **kwargs)
+
+
+class Tombstone(models.Model):
+    """A deleted change-tracked row, or one moved out of a depot, so change feeds can report it removed"""
+    model = models.CharField(max_length=100, help_text="Model label, e.g. delivery_api.order")
+    object_id = models.BigIntegerField()
+    change = models.ForeignKey(Change, on_delete=models.DO_NOTHING, related_name='+')
+    depot = models.CharField(max_length=50, blank=True, default='',
+                             help_text="Depot the row moved out of; blank for a delete")
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['model', 'change'], name='tombstone_model_change')]
+
+    def __str__(self):
+        return f"{self.model}:{self.object_id} @ change {self.change_id}"
+
+
+class Driver(ChangeTracked):
     name = models.CharField(max_length=255)
+    depot = depot_field()
     current_shift_hours = models.DecimalField(max_digits=5, decimal_places=2)
     past_7_day_work_hours = models.DecimalField(max_digits=5, decimal_places=2)
+    past_week_daily_hours = models.JSONField(default=list, blank=True,
+                                             help_text="Hours worked on each of the last 7 days, oldest first")
 
     def __str__(self):
         return self.name
 
-class Route(models.Model):
+class Route(ChangeTracked):
     route_id = models.CharField(max_length=50, unique=True)
+    depot = depot_field()
     distance_km = models.DecimalField(max_digits=10, decimal_places=2)
     traffic_level = models.CharField(max_length=50)
     base_time = models.IntegerField(help_text="Base time in minutes")
@@ -21,24 +178,132 @@ class Route(models.Model):
     def __str__(self):
         return self.route_id
 
-class Order(models.Model):
+class Order(ChangeTracked):
     order_id = models.CharField(max_length=50, unique=True)
+    depot = depot_field(help_text="Must match the assigned route's depot")
     value_rs = models.DecimalField(max_digits=10, decimal_places=2)
     assigned_route = models.ForeignKey(Route, on_delete=models.SET_NULL, null=True, blank=True)
+    delivery_time = models.PositiveIntegerField(null=True, blank=True,
+                                                help_text="Requested delivery time in minutes after the run's start time")
     delivery_timestamp = models.DateTimeField(null=True, blank=True)
     is_late = models.BooleanField(default=False)
     penalty = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     bonus = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     fuel_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     profit = models.DecimalField(max_digits=10, decimal_places=2, default=0)
-    simulation_run_at = models.DateTimeField(null=True, blank=True)
+    simulation_run_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
     def __str__(self):
         return self.order_id
 
-class SimulationRun(models.Model):
+def default_traffic_levels():
+    return {
+        'high': {'fuel_surcharge_per_km': '2.00', 'time_multiplier': 1.5},
+        'medium': {'fuel_surcharge_per_km': '0.00', 'time_multiplier': 1.2},
+    }
+
+
+def _rush_hour_factors(peak: float):
+    # Morning (08-10) and evening (17-20) rush hours
+    return [peak if hour in (8, 9, 17, 18, 19) else 1.0 for hour in range(24)]
+
+
+def default_time_of_day_factors():
+    return {
+        'high': _rush_hour_factors(1.3),
+        'medium': _rush_hour_factors(1.15),
+    }
+
+
+class RuleSet(models.Model):
+    """Versioned company rules applied by the simulation.
+
+    A version is never edited once created: changing the rules creates the
+    next version, so every SimulationRun keeps pointing at the exact rules it
+    was computed with. Exactly one version is active at a time. Traffic
+    levels not listed in ``traffic_levels`` get no fuel surcharge and a time
+    multiplier of 1.0; levels not listed in ``time_of_day_factors`` have the
+    same travel time at every hour.
+    """
+    version = models.AutoField(primary_key=True)
+    name = models.CharField(max_length=100, blank=True)
+    is_active = models.BooleanField(default=False)
+    fuel_cost_per_km = models.DecimalField(max_digits=8, decimal_places=2, default=Decimal('5.00'),
+                                           validators=[MinValueValidator(0)])
+    traffic_levels = models.JSONField(default=default_traffic_levels,
+                                      help_text="Per traffic level fuel_surcharge_per_km and time_multiplier")
+    time_of_day_factors = models.JSONField(default=default_time_of_day_factors,
+                                           help_text="Per traffic level, 24 hourly factors on the time multiplier "
+                                                     "(event-mode simulations only)")
+    late_threshold_minutes = models.PositiveIntegerField(default=10,
+                                                         help_text="Minutes over base time before a delivery is late")
+    late_penalty = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('50.00'),
+                                       validators=[MinValueValidator(0)])
+    high_value_threshold = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('1000.00'),
+                                               validators=[MinValueValidator(0)])
+    high_value_bonus_rate = models.DecimalField(max_digits=3, decimal_places=2, default=Decimal('0.10'),
+                                                validators=[MinValueValidator(0), MaxValueValidator(1)])
+    fatigue_threshold_hours = models.DecimalField(max_digits=4, decimal_places=2, default=Decimal('8.00'),
+                                                  validators=[MinValueValidator(0)],
+                                                  help_text="Hours in a day after which a driver is fatigued the next day")
+    fatigue_time_factor = models.DecimalField(max_digits=3, decimal_places=2, default=Decimal('1.30'),
+                                              validators=[MinValueValidator(1)],
+                                              help_text="Factor on a fatigued driver's travel times")
+    max_weekly_hours = models.DecimalField(max_digits=5, decimal_places=2, default=Decimal('60.00'),
+                                           validators=[MinValueValidator(0)],
+                                           help_text="Most hours a driver may work in any 7 consecutive days")
+    created_at = models.DateTimeField(auto_now_add=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+
+    class Meta:
+        ordering = ['-version']
+        constraints = [
+            models.UniqueConstraint(fields=['is_active'], condition=models.Q(is_active=True),
+                                    name='single_active_rule_set'),
+        ]
+
+    def __str__(self):
+        return f"Rule set v{self.version}" + (f" ({self.name})" if self.name else "")
+
+
+class RouteStats(models.Model):
+    """Per-route order statistics the route-grouped simulation kernel works from.
+
+    Kept up to date by signal handlers as orders are created, edited,
+    reassigned or deleted (see route_stats.py). High-value figures depend on
+    the rule set's threshold, so there is one row per route and threshold in
+    use; the row with no route collects unassigned orders.
+    """
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, null=True, blank=True, related_name='stats')
+    high_value_threshold = models.DecimalField(max_digits=10, decimal_places=2)
+    order_count = models.IntegerField(default=0)
+    # Sums in integer paise, so incremental updates stay exact on every backend
+    value_sum_cents = models.BigIntegerField(default=0)
+    high_value_count = models.IntegerField(default=0, help_text="Orders with value_rs above the threshold")
+    high_value_sum_cents = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['route', 'high_value_threshold'], condition=models.Q(route__isnull=False),
+                                    name='unique_route_stats_per_threshold'),
+            models.UniqueConstraint(fields=['high_value_threshold'], condition=models.Q(route__isnull=True),
+                                    name='unique_unassigned_stats_per_threshold'),
+        ]
+
+    def __str__(self):
+        return f"{self.route_id or 'unassigned'} @ {self.high_value_threshold}"
+
+
+class SimulationRun(ChangeTracked):
+    MODE_BATCH = 'batch'
+    MODE_EVENT = 'event'
+    MODE_CHOICES = [
+        (MODE_BATCH, 'Batch: every order leaves at the start time'),
+        (MODE_EVENT, 'Event: orders dispatched by drivers over the day'),
+    ]
+
     run_id = models.CharField(max_length=50, unique=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
     num_drivers = models.IntegerField()
     start_time = models.DateTimeField()
     max_hours_per_day = models.IntegerField()
@@ -50,6 +315,66 @@ class SimulationRun(models.Model):
     total_orders = models.IntegerField()
     avg_delivery_time = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)
     high_value_orders = models.IntegerField(default=0)
+    rule_set = models.ForeignKey(RuleSet, on_delete=models.PROTECT, null=True, blank=True,
+                                 related_name='simulation_runs', help_text="Rule set version the run used")
+    mode = models.CharField(max_length=10, choices=MODE_CHOICES, default=MODE_BATCH)
+    depot = models.CharField(max_length=50, blank=True, default='', db_index=True,
+                             help_text="Depot the run was limited to; blank for a run over every depot")
+
+    def __str__(self):
+        return f"Simulation Run {self.run_id} - {self.timestamp.strftime('%Y-%m-%d %H:%M')}"
+
+class OrderOutcome(models.Model):
+    """Per-order result of one simulation run.
+
+    Order rows only hold the outcome of the most recent run; these rows keep
+    every run's outcomes so runs can be compared order by order.
+    """
+    simulation_run = models.ForeignKey(SimulationRun, on_delete=models.CASCADE, related_name='outcomes')
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='outcomes')
+    route = models.ForeignKey(Route, on_delete=models.SET_NULL, null=True, blank=True, related_name='outcomes')
+    is_late = models.BooleanField(default=False)
+    delivery_minutes = models.IntegerField(help_text="Delivery time in minutes from the run's start time")
+    fuel_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    penalty = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    bonus = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    profit = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    driver = models.IntegerField(
+        null=True, blank=True,
+        help_text="Index of the run's driver that delivered the order (event mode); "
+                  "null for runs that didn't dispatch"
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['simulation_run', 'order'], name='unique_outcome_per_run_order'),
+        ]
+
+    def __str__(self):
+        return f"{self.simulation_run_id}:{self.order_id}"
+
+
+class IdempotencyRecord(models.Model):
+    """Stored outcome of a mutating request, keyed per user by idempotency key.
+
+    A record is created (completed=False) when a request claims its key and
+    is filled in with the response once the request finishes, so retries and
+    concurrent duplicates get the same response instead of redoing the work.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64, help_text="SHA-256 of method, path and body")
+    completed = models.BooleanField(default=False)
+    status_code = models.IntegerField(null=True, blank=True)
+    response_body = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
 
     def __str__(self):
-        return f"Simulation Run {self.run_id} - {self.timestamp.strftime('%Y-%m-%d %H:%M')}"
\ No newline at end of file
+        return f"{self.user_id}:{self.key}"
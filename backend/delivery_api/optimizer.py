@@ -0,0 +1,173 @@
+"""
+Fleet-size search: the smallest ``num_drivers`` and ``max_hours_per_day``
+whose event-mode simulation reaches a target efficiency score or profit.
+
+For a given shift length, adding a driver doesn't make the day worse, so
+feasibility (the KPI reaching the target) is taken to be monotone in
+``num_drivers`` and the fewest drivers is found by bisection. Shift length
+is not monotone: a shorter shift skips round trips that can't be back in
+time, which can leave drivers free for orders they would otherwise deliver
+late. And with fewer drivers a longer shift can reach a target that a
+shorter one can't, even where ``max_drivers`` deliver every order in both.
+So the search first evaluates every shift length with ``max_drivers``;
+only the shift lengths that reach the target there can reach it with
+fewer drivers.
+
+``prefer='drivers'`` (the default) returns the fewest drivers for which
+any shift length reaches the target, with the shortest such shift. The
+candidate shift with the best KPI is bisected first, and its result bounds
+the others, which mostly cost one evaluation each. ``prefer='hours'``
+returns the shortest shift that reaches the target, with the fewest
+drivers for it. Either way that is the shift lengths plus about log2 of
+the driver range: a few dozen simulations at most. The search doesn't
+check the monotonicity it assumes; the evaluations it made are returned
+with the plan. It holds for rested drivers, but the simulation is the one
+``/api/simulate/`` runs, with the drivers' fatigue and weekly hours: an
+extra fatigued driver can take orders a rested one would have delivered on
+time, and then the plan found may not be the smallest.
+
+An ``Evaluator`` loads nothing itself: it works on the shared snapshot
+(``get_snapshot()``) and computes the per-depot dispatch inputs once. Its
+evaluations are kept, and evaluators are shared between requests for the
+same snapshot, rule set, depot and start time, so repeated and overlapping
+searches reuse earlier simulations. Depots are evaluated one after another
+in the request thread, with drivers split between them as in
+``/api/simulate/``.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .rules import EvaluationPlan
+from .sharding import depot_drivers, merge_evaluations
+from .simulation import DatasetSnapshot, summarize
+
+MINUTES_PER_HOUR = 60
+# KPIs a search can target; both have to reach at least the target value
+TARGET_METRICS = ('efficiency_score', 'total_profit')
+PREFER_DRIVERS = 'drivers'
+PREFER_HOURS = 'hours'
+# Evaluators (with their evaluations) kept per process
+MAX_EVALUATORS = 8
+
+
+class Evaluator:
+    """Event-mode KPIs of one snapshot, rule set and start time, per (num_drivers, max_hours_per_day)"""
+
+    def __init__(self, snapshot: DatasetSnapshot, plan: EvaluationPlan, start_minute: float):
+        self.snapshot = snapshot
+        self.plan = plan
+        self.start_minute = start_minute
+        self.shards = [snapshot.shard(depot) for depot in snapshot.depots] if len(snapshot.depots) > 1 else [snapshot]
+        self.inputs = [shard.event_inputs(plan) for shard in self.shards]
+        self._kpis: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def kpis(self, num_drivers: int, max_hours_per_day: int) -> Tuple[Dict[str, Any], bool]:
+        """The KPIs, and whether they were cached"""
+        key = (num_drivers, max_hours_per_day)
+        with self._lock:
+            kpis = self._kpis.get(key)
+        if kpis is not None:
+            return kpis, True
+        drivers = [num_drivers] if len(self.shards) == 1 else depot_drivers(self.snapshot, num_drivers)
+        evaluations = [
+            shard.evaluate_day(self.plan, shard_drivers, max_hours_per_day * MINUTES_PER_HOUR,
+                               self.start_minute, inputs=inputs)
+            for shard, shard_drivers, inputs in zip(self.shards, drivers, self.inputs)
+        ]
+        evaluation = evaluations[0] if len(self.shards) == 1 else merge_evaluations(self.snapshot, evaluations)
+        kpis = summarize(evaluation, self.snapshot.total_orders)
+        kpis['undelivered_orders'] = int(evaluation.undelivered.sum())
+        with self._lock:
+            self._kpis[key] = kpis
+        return kpis, False
+
+
+_evaluators: 'OrderedDict[tuple, Evaluator]' = OrderedDict()
+_evaluators_lock = threading.Lock()
+
+
+def get_evaluator(snapshot: DatasetSnapshot, plan: EvaluationPlan, start_minute: float,
+                  depot: Optional[str] = None) -> Evaluator:
+    """The shared evaluator for this snapshot, rule set version, depot and start time"""
+    key = (snapshot.generation, snapshot.loaded_at, plan.version, depot, start_minute)
+    with _evaluators_lock:
+        evaluator = _evaluators.get(key)
+        if evaluator is not None:
+            _evaluators.move_to_end(key)
+            return evaluator
+    evaluator = Evaluator(snapshot.shard(depot) if depot is not None else snapshot, plan, start_minute)
+    with _evaluators_lock:
+        evaluator = _evaluators.setdefault(key, evaluator)
+        _evaluators.move_to_end(key)
+        while len(_evaluators) > MAX_EVALUATORS:
+            _evaluators.popitem(last=False)
+    return evaluator
+
+
+def _lowest_feasible(low: int, high: int, feasible: Callable[[int], bool]) -> int:
+    """Smallest value in [low, high] that is feasible, given that ``high`` is"""
+    below = low - 1
+    while high - below > 1:
+        middle = (below + high) // 2
+        if feasible(middle):
+            high = middle
+        else:
+            below = middle
+    return high
+
+
+def search(evaluator: Evaluator, *, metric: str, target: float, drivers: Tuple[int, int],
+           hours: Tuple[int, int], prefer: str = PREFER_DRIVERS) -> Dict[str, Any]:
+    """Cheapest plan within the (min, max) ``drivers`` and ``hours`` bounds that reaches ``target``.
+
+    Returns ``plan`` (num_drivers, max_hours_per_day and kpis, or None if no
+    plan within the bounds reaches the target) and ``evaluations``, in the
+    order they were needed, each with its KPIs and whether it was cached.
+    """
+    evaluations: List[Dict[str, Any]] = []
+
+    def feasible(num_drivers: int, max_hours_per_day: int) -> bool:
+        kpis, cached = evaluator.kpis(num_drivers, max_hours_per_day)
+        reached = float(kpis[metric]) >= target
+        evaluations.append({
+            'num_drivers': num_drivers,
+            'max_hours_per_day': max_hours_per_day,
+            'feasible': reached,
+            'cached': cached,
+            'kpis': kpis,
+        })
+        return reached
+
+    # Shift lengths that reach the target with the most drivers
+    candidates = []
+    for max_hours_per_day in range(hours[0], hours[1] + 1):
+        if feasible(drivers[1], max_hours_per_day):
+            candidates.append(max_hours_per_day)
+    if not candidates:
+        return {'plan': None, 'evaluations': evaluations}
+
+    def lowest_drivers(max_hours_per_day: int, high: int) -> int:
+        return _lowest_feasible(drivers[0], high, lambda d: feasible(d, max_hours_per_day))
+
+    if prefer == PREFER_HOURS:
+        best = (lowest_drivers(candidates[0], drivers[1]), candidates[0])
+    else:
+        # The shift with the best KPI at full strength likely needs the fewest
+        # drivers; it bounds the searches for the other shifts
+        candidates.sort(key=lambda h: -float(evaluator.kpis(drivers[1], h)[0][metric]))
+        best = (lowest_drivers(candidates[0], drivers[1]), candidates[0])
+        for max_hours_per_day in candidates[1:]:
+            # Only a plan with fewer drivers, or as many on a shorter shift, is better
+            high = best[0] if max_hours_per_day < best[1] else best[0] - 1
+            if high >= drivers[0] and feasible(high, max_hours_per_day):
+                best = (lowest_drivers(max_hours_per_day, high), max_hours_per_day)
+
+    num_drivers, max_hours_per_day = best
+    plan = {
+        'num_drivers': num_drivers,
+        'max_hours_per_day': max_hours_per_day,
+        'kpis': evaluator.kpis(num_drivers, max_hours_per_day)[0],
+    }
+    return {'plan': plan, 'evaluations': evaluations}
@@ -0,0 +1,181 @@
+"""
+Columnar on-disk store of per-run simulation outcomes.
+
+Each run's outcomes are written once, when the run is committed, as one
+``.npy`` file per column under ``OUTCOME_STORE_DIR/<run pk>-<run_id hash>/``:
+
+    order             int64  Order id (MISSING_ID if deleted before the write)
+    route             int64  Route id (MISSING_ID if deleted before the write)
+    profit            int64  paise
+    fuel_cost         int64  paise
+    is_late           bool
+    delivery_minutes  int32
+    driver            int32  Index of the run's driver that delivered the order
+
+Rows are in OrderOutcome insertion order, which is order id order for runs
+written by ``/api/simulate/``. Readers memory-map the files
+(``np.load(mmap_mode='r')``), so analytics and diff requests read the columns
+without parsing Decimals through the ORM, and every gunicorn worker shares the
+same pages through the OS page cache. The OrderOutcome table remains the
+source of truth: a run without files (older runs, a failed write, a wiped
+directory) is loaded from the table once and written back.
+
+Only event-mode runs dispatch orders to drivers. Batch runs, and runs
+stored before the driver column was kept, give order ``i`` of the run to
+driver ``i % num_drivers`` (``round_robin_drivers()``).
+
+Set ``OUTCOME_STORE_ENABLED=False`` to always read from the table.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+from typing import Dict, Optional
+
+import numpy as np
+from django.conf import settings
+
+from .models import OrderOutcome, SimulationRun
+
+logger = logging.getLogger(__name__)
+
+# Order/route id for outcomes whose order or route had been deleted
+MISSING_ID = -1
+
+COLUMNS = {
+    'order': np.int64,
+    'route': np.int64,
+    'profit': np.int64,
+    'fuel_cost': np.int64,
+    'is_late': np.bool_,
+    'delivery_minutes': np.int32,
+    'driver': np.int32,
+}
+
+
+def units_to_cents(units: np.ndarray) -> np.ndarray:
+    """MONEY_SCALE units to paise, rounding half away from zero like numeric(10, 2)"""
+    units = np.asarray(units, dtype=np.int64)
+    return np.where(units >= 0, (units + 50) // 100, -((-units + 50) // 100))
+
+
+def round_robin_drivers(count: int, num_drivers: int) -> np.ndarray:
+    """Driver column of a run without dispatch: order ``i`` to driver ``i % num_drivers``"""
+    return (np.arange(count, dtype=np.int64) % max(num_drivers, 1)).astype(np.int32)
+
+
+def run_dir(simulation_run: SimulationRun) -> str:
+    # The pk keeps names filesystem-safe; the run_id hash stops a reused pk
+    # from picking up a deleted run's files
+    digest = hashlib.sha1(simulation_run.run_id.encode()).hexdigest()[:12]
+    return os.path.join(settings.OUTCOME_STORE_DIR, f'{simulation_run.pk}-{digest}')
+
+
+def write(simulation_run: SimulationRun, columns: Dict[str, np.ndarray]) -> None:
+    """Write a run's outcome columns; a no-op if they are already stored"""
+    if not settings.OUTCOME_STORE_ENABLED:
+        return
+    path = run_dir(simulation_run)
+    if os.path.isdir(path):
+        return
+    os.makedirs(settings.OUTCOME_STORE_DIR, exist_ok=True)
+    # Write into a private directory and rename it into place, so readers
+    # never see a partially written run
+    staging = f'{path}.tmp-{uuid.uuid4().hex}'
+    os.mkdir(staging)
+    try:
+        for name, dtype in COLUMNS.items():
+            np.save(os.path.join(staging, f'{name}.npy'), np.ascontiguousarray(columns[name], dtype=dtype))
+        os.rename(staging, path)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+        if not os.path.isdir(path):
+            raise
+
+
+def write_quietly(simulation_run: SimulationRun, columns: Dict[str, np.ndarray]) -> None:
+    """write() for callers that must not fail; the run is rebuilt from the table on first read"""
+    try:
+        write(simulation_run, columns)
+    except Exception as e:
+        logger.warning("Could not store outcome columns for run %s: %s", simulation_run.run_id, e)
+
+
+def _read(path: str, num_drivers: int) -> Optional[Dict[str, np.ndarray]]:
+    try:
+        columns = {}
+        for name in COLUMNS:
+            file = os.path.join(path, f'{name}.npy')
+            try:
+                columns[name] = np.load(file, mmap_mode='r')
+            except ValueError:
+                # A zero-length array can't be memory-mapped
+                columns[name] = np.load(file)
+            except FileNotFoundError:
+                if name != 'driver' or not columns:
+                    raise
+                # Stored before runs kept their drivers
+                columns[name] = round_robin_drivers(columns['order'].size, num_drivers)
+                columns[name].flags.writeable = False
+        return columns
+    except FileNotFoundError:
+        return None
+
+
+def _ids(values) -> np.ndarray:
+    return np.fromiter((MISSING_ID if v is None else v for v in values), dtype=np.int64, count=len(values))
+
+
+def load_from_table(simulation_run: SimulationRun) -> Dict[str, np.ndarray]:
+    """A run's outcome columns read from OrderOutcome, in insertion order"""
+    rows = list(
+        OrderOutcome.objects.filter(simulation_run=simulation_run)
+        .order_by('id')
+        .values_list('order_id', 'route_id', 'profit', 'fuel_cost', 'is_late', 'delivery_minutes', 'driver')
+    )
+    if not rows:
+        columns = {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+    else:
+        order_ids, route_ids, profit, fuel_cost, is_late, delivery_minutes, drivers = zip(*rows)
+        if None in drivers:
+            driver = round_robin_drivers(len(rows), simulation_run.num_drivers)
+        else:
+            driver = np.array(drivers, dtype=np.int32)
+        columns = {
+            'order': _ids(order_ids),
+            'route': _ids(route_ids),
+            'profit': np.rint(np.asarray(profit, dtype=np.float64) * 100).astype(np.int64),
+            'fuel_cost': np.rint(np.asarray(fuel_cost, dtype=np.float64) * 100).astype(np.int64),
+            'is_late': np.array(is_late, dtype=np.bool_),
+            'delivery_minutes': np.array(delivery_minutes, dtype=np.int32),
+            'driver': driver,
+        }
+    for column in columns.values():
+        column.flags.writeable = False
+    return columns
+
+
+def load(simulation_run: SimulationRun) -> Dict[str, np.ndarray]:
+    """A run's outcome columns, memory-mapped from the store when possible.
+
+    The arrays are read-only. Stored columns keep order and route ids as they
+    were at run time, so callers resolve ids against the live tables.
+    """
+    if not settings.OUTCOME_STORE_ENABLED:
+        return load_from_table(simulation_run)
+    columns = _read(run_dir(simulation_run), simulation_run.num_drivers)
+    if columns is None:
+        columns = load_from_table(simulation_run)
+        write_quietly(simulation_run, columns)
+    return columns
+
+
+def delete(simulation_run: SimulationRun) -> None:
+    shutil.rmtree(run_dir(simulation_run), ignore_errors=True)
+
+
+def delete_run_outcomes(sender, instance: SimulationRun, **kwargs) -> None:
+    """post_delete receiver for SimulationRun"""
+    if settings.OUTCOME_STORE_ENABLED:
+        delete(instance)
@@ -0,0 +1,64 @@
+"""
+Faster drop-in replacement for DRF's JSONRenderer.
+
+DRF builds a new ``json.JSONEncoder`` for every response and routes every
+Decimal/datetime through Python-level ``default()`` calls. FastJSONRenderer
+serializes with orjson when it is installed and otherwise reuses one
+pre-built stdlib encoder. The bytes match JSONRenderer's compact output:
+datetimes, Decimals, UUIDs and lazy strings still go through DRF's
+JSONEncoder.default, and U+2028/U+2029 are escaped the same way.
+
+orjson spells floats below 1e-4 or from 1e16 up without Python's exponent
+form (``0.00001`` vs ``1e-05``). Every float this API emits comes from a
+two-decimal-place money/minutes value or a rounded score, so that range
+never occurs in practice.
+"""
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+_LINE_SEPARATORS = (b'\xe2\x80\xa8', b'\xe2\x80\xa9')
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer with an orjson (or cached stdlib encoder) fast path"""
+
+    def __init__(self):
+        super().__init__()
+        self._default = self.encoder_class().default
+        self._encoder = self.encoder_class(
+            ensure_ascii=self.ensure_ascii,
+            allow_nan=not self.strict,
+            separators=(',', ':') if self.compact else (', ', ': '),
+        )
+        self._use_orjson = orjson is not None and self.compact and not self.ensure_ascii
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            # Pretty-printed output (browsable API, `; indent=N`) is rare
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if self._use_orjson:
+            try:
+                ret = orjson.dumps(
+                    data,
+                    default=self._default,
+                    option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS,
+                )
+            except (TypeError, orjson.JSONEncodeError):
+                # Non-str keys, >64-bit ints and the like: take the stdlib path
+                pass
+            else:
+                if _LINE_SEPARATORS[0] in ret or _LINE_SEPARATORS[1] in ret:
+                    ret = ret.replace(_LINE_SEPARATORS[0], b'\\u2028').replace(_LINE_SEPARATORS[1], b'\\u2029')
+                return ret
+
+        ret = self._encoder.encode(data)
+        ret = ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+        return ret.encode()
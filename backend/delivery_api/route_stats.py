@@ -0,0 +1,249 @@
+"""
+Per-route order statistics and the route-grouped simulation kernel.
+
+Under the company rules an order's outcome depends only on its route and on
+whether its value is above the rule set's high-value threshold: every order on
+a route shares the route's fuel cost, delivery time and lateness, and only the
+bonus scales with the order value. The headline KPIs therefore follow exactly
+from four numbers per route: the order count, the value sum, and the count and
+value sum of the orders above the threshold.
+
+RouteStats holds those numbers, one row per route and threshold, with a row
+without a route for unassigned orders (they still count towards total_orders).
+The signal handlers below keep them current as orders are created, edited,
+reassigned or deleted, using ``F()`` updates so concurrent writers don't lose
+increments; sums are integer paise so the updates are exact on SQLite too.
+A save moves the order from the route and value its instance was loaded
+with (``ChangeTracked.stored_values()``), so no extra SELECT is needed.
+A threshold's rows are built by one GROUP BY the first time a rule set with
+that threshold is evaluated (``ensure_threshold()``), after which they are
+maintained incrementally. ``QuerySet.update()``, ``bulk_create()`` and
+raw deletes on Order bypass signals: the admin's set-based actions apply
+the change to the statistics themselves with one grouped aggregate over the
+selected orders (``remove_orders()``, ``unassign_orders()``); after other
+bulk changes run ``manage.py rebuild_route_stats``.
+
+``route_kpis()`` returns the same dictionary as ``simulation.summarize()``
+with work proportional to the number of routes rather than orders. The
+statistics are not kept per depot: KPIs for one depot are computed from the
+depot's shard of the snapshot instead.
+"""
+import logging
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Sum, Value, When
+
+from .locking import advisory_lock
+from .models import Order, Route, RouteStats
+from .rules import CENTS, EvaluationPlan, from_units, to_cents
+
+logger = logging.getLogger(__name__)
+
+STATS_FIELDS = ('order_count', 'value_sum_cents', 'high_value_count', 'high_value_sum_cents')
+# Order fields the statistics depend on
+TRACKED_FIELDS = ('assigned_route', 'assigned_route_id', 'value_rs')
+LOCK_NAME = 'route-stats'
+
+
+def _tracked_thresholds() -> List[Decimal]:
+    """Thresholds whose statistics are built; each has an unassigned row"""
+    return list(RouteStats.objects.filter(route__isnull=True).values_list('high_value_threshold', flat=True))
+
+
+def build_stats(threshold: Decimal) -> None:
+    """(Re)build every route's statistics for one threshold from the Order table"""
+    with transaction.atomic(), advisory_lock(LOCK_NAME):
+        rows = (
+            Order.objects.order_by().values('assigned_route_id').annotate(
+                order_count=Count('id'),
+                value_sum=Sum('value_rs'),
+                high_value_count=Count('id', filter=Q(value_rs__gt=threshold)),
+                high_value_sum=Sum('value_rs', filter=Q(value_rs__gt=threshold)),
+            )
+        )
+        stats = {
+            row['assigned_route_id']: RouteStats(
+                route_id=row['assigned_route_id'],
+                high_value_threshold=threshold,
+                order_count=row['order_count'],
+                value_sum_cents=to_cents(row['value_sum'] or 0),
+                high_value_count=row['high_value_count'],
+                high_value_sum_cents=to_cents(row['high_value_sum'] or 0),
+            )
+            for row in rows
+        }
+        stats.setdefault(None, RouteStats(route_id=None, high_value_threshold=threshold))
+        RouteStats.objects.filter(high_value_threshold=threshold).delete()
+        RouteStats.objects.bulk_create(stats.values())
+
+
+def rebuild_all() -> int:
+    """Rebuild the statistics of every tracked threshold; returns how many"""
+    thresholds = _tracked_thresholds()
+    for threshold in thresholds:
+        build_stats(threshold)
+    return len(thresholds)
+
+
+def ensure_threshold(threshold: Decimal) -> None:
+    if not RouteStats.objects.filter(route__isnull=True, high_value_threshold=threshold).exists():
+        logger.info("Building route statistics for high-value threshold %s", threshold)
+        build_stats(threshold)
+
+
+def _apply(route_id: Optional[int], value: Decimal, sign: int, thresholds: List[Decimal]) -> None:
+    """Add (sign=1) or remove (sign=-1) one order's contribution to a route's rows"""
+    if route_id is not None:
+        # Rows for routes created after the build; a no-op when they exist
+        RouteStats.objects.bulk_create(
+            [RouteStats(route_id=route_id, high_value_threshold=t) for t in thresholds],
+            ignore_conflicts=True,
+        )
+    cents = sign * to_cents(value)
+    RouteStats.objects.filter(route_id=route_id, high_value_threshold__in=thresholds).update(
+        order_count=F('order_count') + sign,
+        value_sum_cents=F('value_sum_cents') + cents,
+        high_value_count=F('high_value_count') + Case(
+            When(high_value_threshold__lt=value, then=Value(sign)), default=Value(0), output_field=IntegerField()
+        ),
+        high_value_sum_cents=F('high_value_sum_cents') + Case(
+            When(high_value_threshold__lt=value, then=Value(cents)), default=Value(0), output_field=IntegerField()
+        ),
+    )
+
+
+def _remove_grouped(queryset, unassign: bool) -> None:
+    """Subtract the orders of ``queryset`` from their routes' rows with one GROUP BY per threshold"""
+    for threshold in _tracked_thresholds():
+        rows = queryset.order_by().values('assigned_route_id').annotate(
+            order_count=Count('id'),
+            value_sum=Sum('value_rs'),
+            high_value_count=Count('id', filter=Q(value_rs__gt=threshold)),
+            high_value_sum=Sum('value_rs', filter=Q(value_rs__gt=threshold)),
+        )
+        moved = dict.fromkeys(STATS_FIELDS, 0)
+        for row in rows:
+            if unassign and row['assigned_route_id'] is None:
+                continue
+            delta = {
+                'order_count': row['order_count'],
+                'value_sum_cents': to_cents(row['value_sum'] or 0),
+                'high_value_count': row['high_value_count'],
+                'high_value_sum_cents': to_cents(row['high_value_sum'] or 0),
+            }
+            RouteStats.objects.filter(route_id=row['assigned_route_id'], high_value_threshold=threshold).update(
+                **{field: F(field) - delta[field] for field in STATS_FIELDS}
+            )
+            for field in STATS_FIELDS:
+                moved[field] += delta[field]
+        if unassign and moved['order_count']:
+            RouteStats.objects.filter(route__isnull=True, high_value_threshold=threshold).update(
+                **{field: F(field) + moved[field] for field in STATS_FIELDS}
+            )
+
+
+def remove_orders(queryset) -> None:
+    """Take the orders of ``queryset`` out of the statistics; call just before deleting them set-based"""
+    with transaction.atomic(), advisory_lock(LOCK_NAME):
+        _remove_grouped(queryset, unassign=False)
+
+
+def unassign_orders(queryset) -> None:
+    """Move the orders of ``queryset`` to the unassigned row; call just before unassigning them set-based"""
+    with transaction.atomic(), advisory_lock(LOCK_NAME):
+        _remove_grouped(queryset, unassign=True)
+
+
+def order_pre_save(sender, instance: Order, raw=False, update_fields=None, **kwargs) -> None:
+    """Remember the stored route and value so post_save can move the order"""
+    instance._route_stats_previous = None
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and not set(update_fields) & set(TRACKED_FIELDS):
+        instance._route_stats_previous = False
+        return
+    # The values the instance was loaded or last saved with; a SELECT only for
+    # instances built by hand with a pk
+    previous = instance.stored_values('assigned_route_id', 'value_rs')
+    if previous is None:
+        previous = Order.objects.filter(pk=instance.pk).values_list('assigned_route_id', 'value_rs').first()
+    if previous is not None:
+        previous = (previous[0], Decimal(previous[1]))
+    instance._route_stats_previous = previous
+
+
+def order_post_save(sender, instance: Order, raw=False, **kwargs) -> None:
+    previous = getattr(instance, '_route_stats_previous', None)
+    instance._route_stats_previous = None
+    if raw or previous is False:
+        return
+    current = (instance.assigned_route_id, Decimal(instance.value_rs))
+    if previous == current:
+        return
+    with transaction.atomic(), advisory_lock(LOCK_NAME):
+        thresholds = _tracked_thresholds()
+        if thresholds:
+            if previous is not None:
+                _apply(*previous, -1, thresholds)
+            _apply(*current, 1, thresholds)
+
+
+def order_post_delete(sender, instance: Order, **kwargs) -> None:
+    with transaction.atomic(), advisory_lock(LOCK_NAME):
+        thresholds = _tracked_thresholds()
+        if thresholds:
+            _apply(instance.assigned_route_id, Decimal(instance.value_rs), -1, thresholds)
+
+
+def route_pre_delete(sender, instance: Route, **kwargs) -> None:
+    """The route's orders become unassigned (SET_NULL sends no Order signals)"""
+    with transaction.atomic(), advisory_lock(LOCK_NAME):
+        for row in RouteStats.objects.filter(route_id=instance.pk):
+            RouteStats.objects.filter(route__isnull=True, high_value_threshold=row.high_value_threshold).update(
+                **{field: F(field) + getattr(row, field) for field in STATS_FIELDS}
+            )
+
+
+def route_kpis(plan: EvaluationPlan) -> Dict[str, Any]:
+    """Headline KPIs for the current dataset in O(routes), equal to summarize()"""
+    threshold = Decimal(plan.high_value_threshold).scaleb(-2)
+    ensure_threshold(threshold)
+    stats = {
+        row[0]: row[1:] for row in RouteStats.objects.filter(high_value_threshold=threshold).values_list(
+            'route_id', *STATS_FIELDS
+        )
+    }
+    total_orders = sum(row[0] for row in stats.values())
+
+    routes = list(Route.objects.filter(id__in=[r for r in stats if r is not None]).order_by('id').values_list(
+        'id', 'distance_km', 'traffic_level', 'base_time'
+    ))
+    columns = np.array([stats[r[0]] for r in routes], dtype=np.int64).reshape(len(routes), len(STATS_FIELDS))
+    count, value_sum, high_value_count, high_value_sum = columns.T
+    route_columns = plan.route_columns(
+        [r[2] for r in routes],
+        np.fromiter((to_cents(r[1]) for r in routes), dtype=np.int64, count=len(routes)),
+        np.fromiter((r[3] for r in routes), dtype=np.int64, count=len(routes)),
+    )
+
+    is_late = route_columns['is_late']
+    fuel_cost = count * route_columns['fuel_cost']
+    penalty = np.where(is_late, count * plan.late_penalty, 0)
+    bonus = np.where(is_late, 0, high_value_sum * plan.bonus_rate)
+    assigned_orders = int(count.sum())
+    on_time_deliveries = int(count[~is_late].sum())
+    return {
+        'total_profit': from_units((value_sum * CENTS + bonus - penalty - fuel_cost).sum()),
+        'efficiency_score': (on_time_deliveries / total_orders) * 100 if total_orders > 0 else 0,
+        'on_time_deliveries': on_time_deliveries,
+        'late_deliveries': total_orders - on_time_deliveries,
+        'total_fuel_cost': from_units(fuel_cost.sum()),
+        'total_orders': total_orders,
+        'avg_delivery_time': (
+            float((count * route_columns['delivery_minutes']).sum()) / assigned_orders if assigned_orders else 0
+        ),
+        'high_value_orders': int(high_value_count.sum()),
+    }
@@ -0,0 +1,149 @@
+"""
+Compiled company rules for the simulation.
+
+A RuleSet version is compiled once into an EvaluationPlan: its money
+parameters become integers and its traffic levels a lookup table, and the
+plan evaluates every order in one pass of NumPy array operations. Versions
+are immutable, so compiled plans are cached by version number and a run
+only pays for compilation the first time a version is used in a process.
+
+Money is computed in integer units of 1/10000 rupee. Rule amounts, route
+distances and order values all have two decimal places, so every product
+below (distance x rate, value x bonus rate) is exact in those units and the
+per-order amounts equal the Decimal arithmetic the rules describe.
+"""
+import threading
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+from django.db import transaction
+
+from .locking import advisory_lock
+from .models import RuleSet
+
+# Integer money units per rupee
+MONEY_SCALE = 10000
+CENTS = 100
+DEFAULT_TIME_MULTIPLIER = 1.0
+PLAN_CACHE_SIZE = 32
+
+
+def to_cents(value) -> int:
+    """Exact integer paise for a Decimal with at most two decimal places"""
+    return int(Decimal(value).scaleb(2).to_integral_value())
+
+
+def from_units(units: int) -> Decimal:
+    return Decimal(int(units)).scaleb(-4)
+
+
+class EvaluationPlan:
+    """One rule set version, compiled for vectorized evaluation"""
+
+    def __init__(self, rule_set: RuleSet):
+        self.version = rule_set.version
+        self.fuel_cost_per_km = to_cents(rule_set.fuel_cost_per_km)
+        self.late_threshold_seconds = rule_set.late_threshold_minutes * 60
+        self.late_penalty = to_cents(rule_set.late_penalty) * CENTS
+        self.high_value_threshold = to_cents(rule_set.high_value_threshold)
+        self.bonus_rate = to_cents(rule_set.high_value_bonus_rate)
+        self.traffic_levels = {
+            level.lower(): (
+                to_cents(rules.get('fuel_surcharge_per_km', 0)),
+                float(rules.get('time_multiplier', DEFAULT_TIME_MULTIPLIER)),
+            )
+            for level, rules in rule_set.traffic_levels.items()
+        }
+        self.fatigue_threshold_hours = float(rule_set.fatigue_threshold_hours)
+        self.fatigue_time_factor = float(rule_set.fatigue_time_factor)
+        self.max_weekly_hours = float(rule_set.max_weekly_hours)
+        self.time_of_day_factors = {
+            level.lower(): np.asarray(factors, dtype=np.float64)
+            for level, factors in (rule_set.time_of_day_factors or {}).items()
+        }
+
+    def route_columns(self, traffic_levels: Sequence[str], distance_cents: np.ndarray, base_time: np.ndarray) -> Dict[str, np.ndarray]:
+        """Per-route fuel cost, delivery time and lateness"""
+        no_rule = (0, DEFAULT_TIME_MULTIPLIER)
+        rules = [self.traffic_levels.get(level.lower(), no_rule) for level in traffic_levels]
+        surcharge = np.fromiter((r[0] for r in rules), dtype=np.int64, count=len(rules))
+        multiplier = np.fromiter((r[1] for r in rules), dtype=np.float64, count=len(rules))
+
+        base_seconds = base_time.astype(np.int64) * 60
+        delivery_seconds = base_seconds * multiplier
+        return {
+            'fuel_cost': distance_cents * (self.fuel_cost_per_km + surcharge),
+            'is_late': delivery_seconds > base_seconds + self.late_threshold_seconds,
+            'delivery_minutes': delivery_seconds // 60,
+        }
+
+    def hourly_multipliers(self, traffic_levels: Sequence[str]) -> np.ndarray:
+        """Per route and hour of day (routes x 24), the factor on the route's base time"""
+        flat = np.ones(24)
+        rows = []
+        for level in traffic_levels:
+            level = level.lower()
+            multiplier = self.traffic_levels.get(level, (0, DEFAULT_TIME_MULTIPLIER))[1]
+            rows.append(multiplier * self.time_of_day_factors.get(level, flat))
+        return np.array(rows, dtype=np.float64).reshape(len(rows), 24)
+
+    def evaluate(self, routes: Dict[str, np.ndarray], route_index: np.ndarray, value_cents: np.ndarray) -> Dict[str, np.ndarray]:
+        """Evaluate every order at once.
+
+        ``route_index`` maps each order to a row of the ``route_columns``
+        arrays; money columns come back in MONEY_SCALE units.
+        """
+        return self.order_results(
+            routes['is_late'][route_index],
+            routes['delivery_minutes'][route_index],
+            routes['fuel_cost'][route_index],
+            value_cents,
+        )
+
+    def order_results(self, is_late: np.ndarray, delivery_minutes: np.ndarray, fuel_cost: np.ndarray,
+                      value_cents: np.ndarray) -> Dict[str, np.ndarray]:
+        """Money columns for orders whose lateness and fuel cost are already known"""
+        penalty = np.where(is_late, self.late_penalty, 0)
+        bonus = np.where((value_cents > self.high_value_threshold) & ~is_late, value_cents * self.bonus_rate, 0)
+        return {
+            'is_late': is_late,
+            'delivery_minutes': delivery_minutes,
+            'fuel_cost': fuel_cost,
+            'penalty': penalty,
+            'bonus': bonus,
+            'profit': value_cents * CENTS + bonus - penalty - fuel_cost,
+            'high_value': value_cents > self.high_value_threshold,
+        }
+
+
+_plans: 'OrderedDict[int, EvaluationPlan]' = OrderedDict()
+_plans_lock = threading.Lock()
+
+
+def get_plan(rule_set: RuleSet) -> EvaluationPlan:
+    """Compiled plan for a rule set version, cached per process"""
+    with _plans_lock:
+        plan = _plans.get(rule_set.version)
+        if plan is not None:
+            _plans.move_to_end(rule_set.version)
+            return plan
+    plan = EvaluationPlan(rule_set)
+    with _plans_lock:
+        _plans[rule_set.version] = plan
+        while len(_plans) > PLAN_CACHE_SIZE:
+            _plans.popitem(last=False)
+    return plan
+
+
+def get_active_rule_set() -> Optional[RuleSet]:
+    return RuleSet.objects.filter(is_active=True).first()
+
+
+def activate_rule_set(rule_set: RuleSet) -> None:
+    """Make ``rule_set`` the version new simulations use"""
+    with transaction.atomic(), advisory_lock('rule-set-activate'):
+        RuleSet.objects.filter(is_active=True).exclude(pk=rule_set.pk).update(is_active=False)
+        RuleSet.objects.filter(pk=rule_set.pk).update(is_active=True)
+    rule_set.is_active = True
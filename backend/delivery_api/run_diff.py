@@ -0,0 +1,156 @@
+"""
+Run-to-run comparison over stored per-order outcomes.
+
+Both runs' outcomes are read as memory-mapped NumPy columns from the
+outcome store (see outcome_store.py) and joined with a sort-based
+intersection, so the per-order and per-route deltas are computed with array
+operations rather than a Python loop per order.
+Money is handled in integer paise (cents) to keep sums exact.
+"""
+from typing import Any, Dict, List
+
+import numpy as np
+from django.db import models
+
+from . import outcome_store
+from .models import Route, Order, SimulationRun
+from .outcome_store import MISSING_ID
+
+KPI_FIELDS = (
+    'total_profit',
+    'efficiency_score',
+    'on_time_deliveries',
+    'late_deliveries',
+    'total_fuel_cost',
+    'total_orders',
+    'avg_delivery_time',
+    'high_value_orders',
+)
+
+
+def _kpi_deltas(base_run: SimulationRun, compare_run: SimulationRun) -> Dict[str, Dict[str, float]]:
+    deltas = {}
+    for field in KPI_FIELDS:
+        to_number = float if isinstance(SimulationRun._meta.get_field(field), models.DecimalField) else int
+        base = to_number(getattr(base_run, field) or 0)
+        compare = to_number(getattr(compare_run, field) or 0)
+        deltas[field] = {'base': base, 'compare': compare, 'delta': round(compare - base, 2)}
+    return deltas
+
+
+def _order_changes(base: Dict[str, np.ndarray], compare: Dict[str, np.ndarray], limit: int) -> Dict[str, Any]:
+    base_known = base['order'] != MISSING_ID
+    compare_known = compare['order'] != MISSING_ID
+    base_orders = base['order'][base_known]
+    compare_orders = compare['order'][compare_known]
+
+    common, base_idx, compare_idx = np.intersect1d(
+        base_orders, compare_orders, assume_unique=True, return_indices=True
+    )
+
+    def column(run, known, name, idx):
+        return run[name][known][idx]
+
+    base_late = column(base, base_known, 'is_late', base_idx)
+    compare_late = column(compare, compare_known, 'is_late', compare_idx)
+    base_profit = column(base, base_known, 'profit', base_idx)
+    compare_profit = column(compare, compare_known, 'profit', compare_idx)
+    base_route = column(base, base_known, 'route', base_idx)
+    compare_route = column(compare, compare_known, 'route', compare_idx)
+
+    became_late = ~base_late & compare_late
+    became_on_time = base_late & ~compare_late
+    profit_delta = compare_profit - base_profit
+    rerouted = base_route != compare_route
+    changed = became_late | became_on_time | (profit_delta != 0) | rerouted
+
+    # Biggest profit swings first; late/on-time flips ahead of equal swings
+    changed_idx = np.flatnonzero(changed)
+    flipped = (became_late | became_on_time)[changed_idx]
+    order = np.lexsort((common[changed_idx], ~flipped, -np.abs(profit_delta[changed_idx])))
+    top = changed_idx[order][:limit]
+
+    top_order_ids = common[top].tolist()
+    order_codes = dict(Order.objects.filter(id__in=top_order_ids).values_list('id', 'order_id'))
+    route_ids = set(base_route[top].tolist()) | set(compare_route[top].tolist())
+    route_codes = dict(Route.objects.filter(id__in=route_ids).values_list('id', 'route_id'))
+
+    orders = []
+    for i in top.tolist():
+        if became_late[i]:
+            status_change = 'became_late'
+        elif became_on_time[i]:
+            status_change = 'became_on_time'
+        else:
+            status_change = None
+        orders.append({
+            'order_id': order_codes.get(int(common[i])),
+            'base_route_id': route_codes.get(int(base_route[i])),
+            'compare_route_id': route_codes.get(int(compare_route[i])),
+            'base_is_late': bool(base_late[i]),
+            'compare_is_late': bool(compare_late[i]),
+            'status_change': status_change,
+            'base_profit': int(base_profit[i]) / 100,
+            'compare_profit': int(compare_profit[i]) / 100,
+            'profit_delta': int(profit_delta[i]) / 100,
+        })
+
+    return {
+        'summary': {
+            'compared_orders': int(common.size),
+            'changed_orders': int(changed_idx.size),
+            'became_late': int(became_late.sum()),
+            'became_on_time': int(became_on_time.sum()),
+            'rerouted': int(rerouted.sum()),
+            'only_in_base': int(base_orders.size - common.size),
+            'only_in_compare': int(compare_orders.size - common.size),
+        },
+        'orders': orders,
+    }
+
+
+def _route_changes(base: Dict[str, np.ndarray], compare: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    routes = np.union1d(base['route'], compare['route'])
+
+    def totals(run):
+        # np.add.at on int64 rather than weighted bincount, which sums in float64
+        # and loses cents once a route's profit passes 2**53
+        idx = np.searchsorted(routes, run['route'])
+        late = np.zeros(routes.size, dtype=np.int64)
+        np.add.at(late, idx, run['is_late'].astype(np.int64))
+        profit = np.zeros(routes.size, dtype=np.int64)
+        np.add.at(profit, idx, run['profit'].astype(np.int64, copy=False))
+        return np.bincount(idx, minlength=routes.size), late, profit
+
+    base_orders, base_late, base_profit = totals(base)
+    compare_orders, compare_late, compare_profit = totals(compare)
+    profit_delta = compare_profit - base_profit
+    late_delta = compare_late - base_late
+
+    route_codes = dict(Route.objects.filter(id__in=routes.tolist()).values_list('id', 'route_id'))
+    ranking = np.lexsort((routes, -np.abs(late_delta), -np.abs(profit_delta)))
+    return [
+        {
+            'route_id': route_codes.get(int(routes[i])),
+            'base_orders': int(base_orders[i]),
+            'compare_orders': int(compare_orders[i]),
+            'base_late': int(base_late[i]),
+            'compare_late': int(compare_late[i]),
+            'late_delta': int(late_delta[i]),
+            'base_profit': int(base_profit[i]) / 100,
+            'compare_profit': int(compare_profit[i]) / 100,
+            'profit_delta': int(profit_delta[i]) / 100,
+        }
+        for i in ranking.tolist()
+    ]
+
+
+def diff_runs(base_run: SimulationRun, compare_run: SimulationRun, limit: int = 100) -> Dict[str, Any]:
+    """KPI, per-order and per-route changes going from base_run to compare_run"""
+    base = outcome_store.load(base_run)
+    compare = outcome_store.load(compare_run)
+    return {
+        'kpi_deltas': _kpi_deltas(base_run, compare_run),
+        'order_changes': _order_changes(base, compare, limit),
+        'route_changes': _route_changes(base, compare),
+    }
@@ -1,19 +1,40 @@
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.translation import gettext_lazy as _
 from decimal import Decimal
-from .models import Driver, Route, Order, SimulationRun
+import decimal
+from operator import itemgetter
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601
+from .models import Driver, Route, Order, SimulationRun, RuleSet
 
 class DriverSerializer(serializers.ModelSerializer):
     class Meta:
         model = Driver
         fields = '__all__'
 
+    def validate_past_week_daily_hours(self, value):
+        if not isinstance(value, list) or len(value) not in (0, 7):
+            raise serializers.ValidationError('Expected a list of 7 daily hours, oldest first.')
+        try:
+            return [_daily_hours_field.run_validation(hours) for hours in value]
+        except serializers.ValidationError as e:
+            raise serializers.ValidationError(e.detail)
+
 class RouteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Route
         fields = '__all__'
 
+    def validate_depot(self, value):
+        # Orders are simulated within their own depot, so they move with the route
+        if self.instance is not None and value != self.instance.depot and \
+                self.instance.order_set.exclude(depot=value).exists():
+            raise serializers.ValidationError("Move the route's orders to the new depot first.")
+        return value
+
 class OrderSerializer(serializers.ModelSerializer):
     assigned_route = RouteSerializer(read_only=True)
     
@@ -21,11 +42,133 @@ class OrderSerializer(serializers.ModelSerializer):
         model = Order
         fields = '__all__'
 
+    def validate_depot(self, value):
+        route = self.instance.assigned_route if self.instance is not None else None
+        if route is not None and value != route.depot:
+            raise serializers.ValidationError(f"Must match the assigned route's depot ({route.depot}).")
+        return value
+
 class SimulationRunSerializer(serializers.ModelSerializer):
     class Meta:
         model = SimulationRun
         fields = '__all__'
 
+# Validators for the per-level entries of RuleSet.traffic_levels
+_surcharge_field = serializers.DecimalField(max_digits=8, decimal_places=2, min_value=0)
+_multiplier_field = serializers.FloatField(min_value=0)
+# ... and of Driver.past_week_daily_hours
+_daily_hours_field = serializers.FloatField(min_value=0, max_value=24)
+
+
+class RuleSetSerializer(serializers.ModelSerializer):
+    """Rule set versions; fields left out of a create are copied from the active version"""
+    RULE_FIELDS = (
+        'fuel_cost_per_km', 'traffic_levels', 'late_threshold_minutes',
+        'late_penalty', 'high_value_threshold', 'high_value_bonus_rate', 'time_of_day_factors',
+        'fatigue_threshold_hours', 'fatigue_time_factor', 'max_weekly_hours',
+    )
+
+    class Meta:
+        model = RuleSet
+        fields = '__all__'
+        read_only_fields = ['version', 'created_at', 'created_by']
+
+    def validate_traffic_levels(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError('Expected an object keyed by traffic level.')
+        levels = {}
+        for level, rules in value.items():
+            if not isinstance(rules, dict) or set(rules) - {'fuel_surcharge_per_km', 'time_multiplier'}:
+                raise serializers.ValidationError(
+                    f'{level}: expected an object with fuel_surcharge_per_km and/or time_multiplier.'
+                )
+            try:
+                surcharge = _surcharge_field.run_validation(rules.get('fuel_surcharge_per_km', '0'))
+                multiplier = _multiplier_field.run_validation(rules.get('time_multiplier', 1.0))
+            except serializers.ValidationError as e:
+                raise serializers.ValidationError({level: e.detail})
+            levels[level.strip().lower()] = {
+                'fuel_surcharge_per_km': f'{surcharge:.2f}',
+                'time_multiplier': multiplier,
+            }
+        return levels
+
+    def validate_time_of_day_factors(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError('Expected an object keyed by traffic level.')
+        levels = {}
+        for level, factors in value.items():
+            if not isinstance(factors, list) or len(factors) != 24:
+                raise serializers.ValidationError(f'{level}: expected a list of 24 hourly factors.')
+            try:
+                levels[level.strip().lower()] = [_multiplier_field.run_validation(f) for f in factors]
+            except serializers.ValidationError as e:
+                raise serializers.ValidationError({level: e.detail})
+        return levels
+
+    def create(self, validated_data):
+        base = RuleSet.objects.filter(is_active=True).first()
+        if base is not None:
+            for field in self.RULE_FIELDS:
+                validated_data.setdefault(field, getattr(base, field))
+        return super().create(validated_data)
+
+
+class RouteOverrideSerializer(serializers.Serializer):
+    route_id = serializers.CharField()
+    distance_km = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    traffic_level = serializers.CharField(max_length=50, required=False)
+    base_time = serializers.IntegerField(min_value=0, required=False)
+
+class OrderOverrideSerializer(serializers.Serializer):
+    order_id = serializers.CharField()
+    value_rs = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    assigned_route = serializers.CharField(allow_null=True, required=False, help_text="route_id, or null to unassign")
+
+class DriverOverrideSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    past_7_day_work_hours = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=0, required=False,
+                                                     help_text="Replaces the daily hours with this total spread evenly")
+    past_week_daily_hours = serializers.ListField(required=False, help_text="Hours on each of the last 7 days, oldest first")
+
+    def validate_past_week_daily_hours(self, value):
+        if len(value) != 7:
+            raise serializers.ValidationError('Expected a list of 7 daily hours, oldest first.')
+        try:
+            return [_daily_hours_field.run_validation(hours) for hours in value]
+        except serializers.ValidationError as e:
+            raise serializers.ValidationError(e.detail)
+
+class ScenarioSerializer(serializers.Serializer):
+    """What-if request: overrides applied on top of the current dataset.
+
+    Event mode simulates one day as ``/api/simulate/horizon/`` does, so it
+    takes the same num_drivers, start_time and max_hours_per_day; it is the
+    mode in which driver hours affect the KPIs.
+    """
+    EVENT_FIELDS = ('num_drivers', 'start_time', 'max_hours_per_day')
+
+    rule_set_version = serializers.IntegerField(required=False, allow_null=True)
+    mode = serializers.ChoiceField(choices=SimulationRun.MODE_CHOICES, default=SimulationRun.MODE_BATCH)
+    num_drivers = serializers.IntegerField(min_value=1, required=False)
+    start_time = serializers.DateTimeField(input_formats=['%Y-%m-%d %H:%M:%S'], required=False)
+    max_hours_per_day = serializers.IntegerField(min_value=1, max_value=24, required=False)
+    routes = RouteOverrideSerializer(many=True, required=False, default=list)
+    orders = OrderOverrideSerializer(many=True, required=False, default=list)
+    drivers = DriverOverrideSerializer(many=True, required=False, default=list)
+
+    def validate(self, attrs):
+        if attrs['mode'] == SimulationRun.MODE_EVENT:
+            missing = {field: 'Required in event mode.' for field in self.EVENT_FIELDS if field not in attrs}
+            if missing:
+                raise serializers.ValidationError(missing)
+        elif attrs['drivers']:
+            # Batch mode doesn't dispatch drivers, so their hours can't change it
+            raise serializers.ValidationError(
+                {'drivers': 'Driver overrides only affect event-mode scenarios ("mode": "event").'}
+            )
+        return attrs
+
 class SimulationResultSerializer(serializers.Serializer):
     total_profit = serializers.DecimalField(max_digits=10, decimal_places=2)
     efficiency_score = serializers.FloatField()
@@ -51,4 +194,189 @@ class RoutePerformanceSerializer(serializers.Serializer):
     total_profit = serializers.DecimalField(max_digits=10, decimal_places=2)
     avg_delivery_time = serializers.DecimalField(max_digits=8, decimal_places=2)
     distance_km = serializers.DecimalField(max_digits=10, decimal_places=2)
-    traffic_level = serializers.CharField()
\ No newline at end of file
+    traffic_level = serializers.CharField()
+
+class ValuesRowBuilder:
+    """
+    Read-only fast path for ModelSerializer list output.
+
+    Instead of instantiating models and walking DRF's per-field machinery for
+    every row, the serializer's fields are compiled once into a values_list()
+    column list, a converter per column and a function composed of them that
+    builds the row dict from a tuple. Converters reproduce the serializer fields'
+    to_representation (and are skipped for fields whose DB value already is
+    its JSON form), so rows come out exactly as the serializer would render
+    them. Nested read-only ModelSerializers on a foreign key are flattened
+    into joined columns.
+    """
+    # DB values for these field types already are their representation
+    # (BigIntegerField subclasses IntegerField but may coerce to string)
+    PASSTHROUGH_FIELDS = (
+        serializers.BooleanField,
+        serializers.CharField,
+        serializers.IntegerField,
+    )
+
+    def __init__(self, serializer, prefix=''):
+        self.columns = []
+        self.names = []
+        positions = []
+        self.converters = []
+        self.nested = []
+
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.ModelSerializer):
+                if field.source != name:
+                    raise ValueError(f'Cannot compile nested field {name!r}')
+                nested = ValuesRowBuilder(field, prefix=f'{prefix}{field.source}__')
+                start = len(self.columns)
+                self.columns.extend(nested.columns)
+                pk_index = start + nested.names.index('id')
+                self.nested.append((name, start, len(self.columns), pk_index, nested))
+                positions.append(pk_index)
+            elif isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None and '.' not in field.source:
+                # values_list() on a foreign key yields the related pk, which is its representation
+                positions.append(len(self.columns))
+                self.columns.append(f'{prefix}{field.source}')
+            elif field.source == '*' or '.' in field.source or isinstance(
+                field, (serializers.SerializerMethodField, serializers.RelatedField, serializers.ManyRelatedField)
+            ):
+                raise ValueError(f'Cannot compile field {name!r}')
+            else:
+                positions.append(len(self.columns))
+                self.columns.append(f'{prefix}{field.source}')
+                if not isinstance(field, self.PASSTHROUGH_FIELDS) or self._coerces_to_string(field):
+                    self.converters.append((name, self._compile_converter(field)))
+            self.names.append(name)
+
+        self.build = self._compile(positions)
+
+    def _compile(self, positions):
+        """Compose a function turning one values_list() tuple into the row dict"""
+        names = tuple(self.names)
+        # Every field's column in one C-level call; a nested field's is its pk
+        take = itemgetter(*positions) if len(positions) != 1 else (lambda row, p=positions[0]: (row[p],))
+        converters = dict(self.converters)
+        converted = tuple(
+            (name, position, converters[name])
+            for name, position in zip(self.names, positions) if name in converters
+        )
+        nested = tuple((name, pk_index, slice(start, stop), builder.build)
+                       for name, start, stop, pk_index, builder in self.nested)
+
+        def build(row):
+            values = dict(zip(names, take(row)))
+            # Replacing values keeps the serializer's field order
+            for name, position, convert in converted:
+                value = row[position]
+                if value is not None:
+                    values[name] = convert(value)
+            for name, pk_index, columns, build_nested in nested:
+                if row[pk_index] is not None:
+                    values[name] = build_nested(row[columns])
+            return values
+
+        return build
+
+    @staticmethod
+    def _compile_converter(field):
+        """Specialize the common Decimal/datetime representations; else use the field's own"""
+        if (isinstance(field, serializers.DecimalField)
+                and getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+                and field.decimal_places is not None
+                and not field.localize and not field.normalize_output):
+            exponent = Decimal('.1') ** field.decimal_places
+            rounding = field.rounding
+            context = decimal.getcontext().copy()
+            if field.max_digits is not None:
+                context.prec = field.max_digits
+
+            decimal_places = field.decimal_places
+            # str() only switches to exponent notation below 1e-6
+            fast_path = 0 < decimal_places <= 6
+
+            def decimal_to_string(value):
+                if fast_path:
+                    text = str(value)
+                    if len(text) > decimal_places and text[-decimal_places - 1] == '.' and 'E' not in text:
+                        # Already at the field's precision, as DB values are
+                        return text
+                return f'{value.quantize(exponent, rounding=rounding, context=context):f}'
+            return decimal_to_string
+
+        if (isinstance(field, serializers.DateTimeField)
+                and getattr(field, 'format', api_settings.DATETIME_FORMAT) == ISO_8601
+                and not hasattr(field, 'timezone') and settings.USE_TZ):
+            get_current_timezone = timezone.get_current_timezone
+
+            def datetime_to_iso(value):
+                if timezone.is_naive(value):
+                    return field.to_representation(value)
+                value = value.astimezone(get_current_timezone()).isoformat()
+                if value.endswith('+00:00'):
+                    value = value[:-6] + 'Z'
+                return value
+            return datetime_to_iso
+
+        return field.to_representation
+
+    @staticmethod
+    def _coerces_to_string(field):
+        return isinstance(field, serializers.BigIntegerField) and getattr(
+            field, 'coerce_to_string', api_settings.COERCE_BIGINT_TO_STRING
+        )
+
+    def build_rows(self, queryset):
+        build = self.build
+        return [build(row) for row in queryset.values_list(*self.columns)]
+
+
+_row_builders = {}
+
+
+def get_row_builder(serializer_class):
+    """Compile (once per serializer class) a ValuesRowBuilder, or None if unsupported"""
+    if serializer_class not in _row_builders:
+        try:
+            _row_builders[serializer_class] = ValuesRowBuilder(serializer_class())
+        except ValueError:
+            _row_builders[serializer_class] = None
+    return _row_builders[serializer_class]
+
+
+class HorizonSerializer(serializers.Serializer):
+    """Multi-day simulation request"""
+    MAX_DAYS = 366
+
+    num_drivers = serializers.IntegerField(min_value=1)
+    start_time = serializers.DateTimeField(input_formats=['%Y-%m-%d %H:%M:%S'])
+    max_hours_per_day = serializers.IntegerField(min_value=1, max_value=24)
+    days = serializers.IntegerField(min_value=1, max_value=MAX_DAYS)
+    rule_set_version = serializers.IntegerField(required=False, allow_null=True)
+    depot = serializers.CharField(required=False, allow_blank=True)
+
+
+class FleetOptimizationSerializer(serializers.Serializer):
+    """Fleet-size search request: a KPI target and bounds on drivers and shift hours"""
+    MAX_DRIVERS = 10000
+
+    metric = serializers.ChoiceField(choices=['efficiency_score', 'total_profit'])
+    target = serializers.FloatField()
+    start_time = serializers.DateTimeField(input_formats=['%Y-%m-%d %H:%M:%S'])
+    min_drivers = serializers.IntegerField(min_value=1, max_value=MAX_DRIVERS, default=1)
+    max_drivers = serializers.IntegerField(min_value=1, max_value=MAX_DRIVERS)
+    min_hours_per_day = serializers.IntegerField(min_value=1, max_value=24, default=1)
+    max_hours_per_day = serializers.IntegerField(min_value=1, max_value=24)
+    prefer = serializers.ChoiceField(choices=['drivers', 'hours'], default='drivers',
+                                     help_text="Minimize this first, then the other")
+    rule_set_version = serializers.IntegerField(required=False, allow_null=True)
+    depot = serializers.CharField(required=False, allow_blank=True)
+
+    def validate(self, attrs):
+        if attrs['min_drivers'] > attrs['max_drivers']:
+            raise serializers.ValidationError({'min_drivers': 'Must not be greater than max_drivers.'})
+        if attrs['min_hours_per_day'] > attrs['max_hours_per_day']:
+            raise serializers.ValidationError({'min_hours_per_day': 'Must not be greater than max_hours_per_day.'})
+        return attrs
@@ -0,0 +1,174 @@
+"""
+Per-depot simulation shards and the exact merge of their results.
+
+Drivers, routes and orders each belong to a depot, and a depot's drivers only
+deliver that depot's orders on that depot's routes, so a run over every depot
+is a set of independent per-depot simulations. ``evaluate_shards()`` cuts the
+snapshot into one shard per depot, evaluates the shards (in a pool of
+``SIMULATION_SHARD_WORKERS`` worker processes when configured, else one after
+another in the request thread) and merges the per-order results back into
+snapshot order. Money is in integer units and every KPI is a sum or a ratio
+of sums over the merged columns, so the merged KPIs are exactly those of the
+shards combined; in batch mode they equal an unsharded evaluation.
+
+In event mode the run's ``num_drivers`` are split across depots in
+proportion to each depot's Driver rows (or its orders when the Driver table
+is empty), largest remainder first.
+"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import django
+import numpy as np
+from django.conf import settings
+
+from .rules import EvaluationPlan
+from .simulation import DatasetSnapshot, Evaluation, summarize
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def allocate_drivers(num_drivers: int, weights: Sequence[int]) -> List[int]:
+    """Split ``num_drivers`` in proportion to ``weights``, largest remainder first"""
+    weights = np.asarray(weights, dtype=np.float64)
+    if not weights.size:
+        return []
+    if weights.sum() <= 0:
+        weights = np.ones(weights.size)
+    quotas = num_drivers * weights / weights.sum()
+    counts = np.floor(quotas).astype(np.int64)
+    remainder = num_drivers - int(counts.sum())
+    # Stable sort: ties go to the earlier depot
+    counts[np.argsort(-(quotas - counts), kind='stable')[:remainder]] += 1
+    return counts.tolist()
+
+
+def depot_drivers(snapshot: DatasetSnapshot, num_drivers: int) -> List[int]:
+    """``num_drivers`` split across the snapshot's depots by their Driver rows (orders if there are none)"""
+    depot_count = len(snapshot.depots)
+    weights = np.bincount(snapshot.driver_depot, minlength=depot_count)
+    if not weights.any():
+        weights = np.bincount(snapshot.order_depot, minlength=depot_count)
+    return allocate_drivers(num_drivers, weights)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawn rather than fork: the server process has threads. The
+            # initializer must not be in this module, whose import needs the
+            # app registry it sets up.
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.SIMULATION_SHARD_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup,
+            )
+        return _executor
+
+
+def _reset_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def evaluate_shard(shard: DatasetSnapshot, plan: EvaluationPlan, events: bool, num_drivers: int,
+                   shift_minutes: float, start_minute: float) -> Evaluation:
+    """Evaluate one shard; runs in a worker process"""
+    if events:
+        return shard.evaluate_day(plan, num_drivers, shift_minutes, start_minute)
+    return shard.evaluate(plan)
+
+
+def _run(jobs: List[Tuple]) -> List[Evaluation]:
+    if settings.SIMULATION_SHARD_WORKERS > 0 and len(jobs) > 1:
+        try:
+            executor = _get_executor()
+            return list(executor.map(evaluate_shard, *zip(*jobs)))
+        except BrokenProcessPool:
+            logger.warning("Simulation shard worker pool failed; evaluating shards in process")
+            _reset_executor()
+    return [evaluate_shard(*job) for job in jobs]
+
+
+def merge_evaluations(snapshot: DatasetSnapshot, evaluations: Sequence[Evaluation]) -> Evaluation:
+    """One evaluation of ``snapshot`` from the evaluations of its shards, in depot order"""
+    assigned = np.zeros(snapshot.total_orders, dtype=bool)
+    order_positions, route_index = [], []
+    routes: Dict[str, np.ndarray] = {}
+    undelivered = None
+    for depot_index, evaluation in enumerate(evaluations):
+        shard_orders = np.flatnonzero(snapshot.order_depot == depot_index)
+        shard_routes = np.flatnonzero(snapshot.route_depot == depot_index)
+        assigned[shard_orders[evaluation.assigned]] = True
+        order_positions.append(shard_orders[evaluation.assigned])
+        route_index.append(shard_routes[evaluation.route_index])
+        for name, column in evaluation.routes.items():
+            if name not in routes:
+                routes[name] = np.zeros(snapshot.route_ids.size, dtype=column.dtype)
+            routes[name][shard_routes] = column
+        if evaluation.undelivered is not None:
+            if undelivered is None:
+                undelivered = np.zeros(snapshot.total_orders, dtype=bool)
+            undelivered[shard_orders[evaluation.undelivered]] = True
+
+    # Back into snapshot order, as an unsharded evaluation returns them
+    order = np.argsort(np.concatenate(order_positions), kind='stable')
+    results = {
+        name: np.concatenate([evaluation.results[name] for evaluation in evaluations])[order]
+        for name in evaluations[0].results
+    }
+    driver_minutes = [e.driver_minutes for e in evaluations if e.driver_minutes is not None]
+    driver = None
+    if driver_minutes:
+        # Each depot's drivers follow the earlier depots' in ``driver_minutes``
+        offsets = np.cumsum([0] + [minutes.size for minutes in driver_minutes[:-1]])
+        driver = np.concatenate([
+            evaluation.driver + offset for evaluation, offset in zip(evaluations, offsets.tolist())
+        ])[order]
+    return Evaluation(
+        assigned=assigned,
+        route_index=np.concatenate(route_index)[order],
+        routes=routes,
+        results=results,
+        undelivered=undelivered,
+        driver_minutes=np.concatenate(driver_minutes) if driver_minutes else None,
+        driver=driver,
+    )
+
+
+def evaluate_shards(snapshot: DatasetSnapshot, plan: EvaluationPlan, *, events: bool, num_drivers: int,
+                    shift_minutes: float, start_minute: float) -> Tuple[Evaluation, Dict[str, Dict[str, Any]]]:
+    """Evaluate every depot of ``snapshot`` separately.
+
+    Returns the merged evaluation and each depot's KPIs (empty when the
+    snapshot has a single depot, which is evaluated as a whole).
+    """
+    if len(snapshot.depots) <= 1:
+        return evaluate_shard(snapshot, plan, events, num_drivers, shift_minutes, start_minute), {}
+
+    shards = [snapshot.shard(depot) for depot in snapshot.depots]
+    drivers = depot_drivers(snapshot, num_drivers)
+    evaluations = _run([
+        (shard, plan, events, shard_drivers, shift_minutes, start_minute)
+        for shard, shard_drivers in zip(shards, drivers)
+    ])
+
+    shard_kpis = {}
+    for depot, shard, shard_drivers, evaluation in zip(snapshot.depots, shards, drivers, evaluations):
+        kpis = summarize(evaluation, shard.total_orders)
+        if events:
+            kpis['num_drivers'] = shard_drivers
+            kpis['undelivered_orders'] = int(evaluation.undelivered.sum())
+        shard_kpis[depot] = kpis
+    return merge_evaluations(snapshot, evaluations), shard_kpis
@@ -0,0 +1,469 @@
+"""
+Columnar snapshot of the simulation inputs and the evaluation run over it.
+
+DatasetSnapshot holds routes, orders and drivers as read-only NumPy columns
+and evaluates them in batch mode (``evaluate()``: every order leaves at the
+start time) or event mode (``evaluate_day()``: drivers dispatch orders one
+after another over the day, slowed by fatigue and limited by their weekly
+hours, see event_simulation.py).
+``/api/simulate/`` loads a fresh snapshot for every run because it publishes
+its results back onto the Order rows. What-if scenarios instead share one
+snapshot per process (``get_snapshot()``) and apply their overrides
+copy-on-write with ``with_overrides()``, so a scenario costs one evaluation
+and never reloads or writes the live tables.
+
+Every row carries a depot; ``load(depot=...)`` reads one depot through the
+indexed column and ``shard()`` cuts a loaded snapshot down to one depot, so a
+run over every depot can evaluate the depots separately (see sharding.py).
+
+The shared snapshot is reloaded when a Driver, Route or Order is saved or
+deleted (a generation counter in Django's cache, bumped by signals and seen
+by every worker when CACHE_URL is shared) and at the latest after
+``SCENARIO_SNAPSHOT_TTL`` seconds, which covers bulk updates that bypass
+signals.
+"""
+import threading
+from decimal import Decimal
+import time
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .event_simulation import UNDELIVERED, dispatch_orders
+from .models import Driver, Order, Route
+from .rules import EvaluationPlan, from_units, to_cents
+
+# order_route_ids value for orders without a route
+UNASSIGNED = -1
+# delivery_time value for orders without a requested delivery time
+NO_DELIVERY_TIME = -1
+DAYS_PER_WEEK = 7
+MINUTES_PER_HOUR = 60
+GENERATION_KEY = 'dataset-generation'
+
+
+def driver_limits(plan: EvaluationPlan, history: np.ndarray, max_hours_per_day: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Which drivers are fatigued today, and the hours each may work, from their (drivers x 7) past daily hours"""
+    fatigued = history[:, -1] > plan.fatigue_threshold_hours
+    allowance = np.clip(plan.max_weekly_hours - history[:, 1:].sum(axis=1), 0, max_hours_per_day)
+    return fatigued, allowance
+
+
+def _readonly(array: np.ndarray) -> np.ndarray:
+    array.flags.writeable = False
+    return array
+
+
+def _int_column(values, count: int) -> np.ndarray:
+    return _readonly(np.fromiter(values, dtype=np.int64, count=count))
+
+
+def _depot_column(depots: List[str], values: List[str]) -> np.ndarray:
+    """Depot of every row as a position in the sorted ``depots`` list"""
+    positions = {depot: i for i, depot in enumerate(depots)}
+    return _int_column((positions[value] for value in values), len(values))
+
+
+def _daily_hours_cents(daily_hours, week_total) -> List[int]:
+    """Driver.past_week_daily_hours in hundredths of an hour, oldest first.
+
+    Drivers without a breakdown are assumed to have spread their 7-day total
+    evenly.
+    """
+    if len(daily_hours or ()) == DAYS_PER_WEEK:
+        return [to_cents(Decimal(str(hours))) for hours in daily_hours]
+    return [to_cents(week_total) // DAYS_PER_WEEK] * DAYS_PER_WEEK
+
+
+@dataclass
+class Evaluation:
+    """Rule results for the assigned orders of a snapshot"""
+    assigned: np.ndarray          # bool per snapshot order
+    route_index: np.ndarray       # per assigned order, row in ``routes``
+    routes: Dict[str, np.ndarray]
+    results: Dict[str, np.ndarray]
+    # Event mode: bool per snapshot order with a route that no driver could
+    # deliver within the shift (not ``assigned``, like unrouted orders)
+    undelivered: Optional[np.ndarray] = None
+    # Event mode: minutes each driver worked
+    driver_minutes: Optional[np.ndarray] = None
+    # Event mode: per assigned order, the driver (row of ``driver_minutes``)
+    # that delivered it
+    driver: Optional[np.ndarray] = None
+
+
+class DatasetSnapshot:
+    """Read-only columns of routes, orders and drivers"""
+
+    # Column -> the table whose rows it follows (None: not per row)
+    COLUMNS = {
+        'route_ids': 'route', 'route_codes': 'route', 'distance_cents': 'route',
+        'traffic_levels': 'route', 'base_time': 'route', 'route_depot': 'route',
+        'order_ids': 'order', 'order_codes': 'order', 'value_cents': 'order',
+        'order_route_ids': 'order', 'delivery_time': 'order', 'order_depot': 'order',
+        'driver_ids': 'driver', 'driver_names': 'driver', 'shift_hours': 'driver',
+        'past_week_hours': 'driver', 'daily_hours': 'driver', 'driver_depot': 'driver',
+        'depots': None,
+    }
+
+    def __init__(self, *, route_ids, route_codes, distance_cents, traffic_levels, base_time,
+                 order_ids, order_codes, value_cents, order_route_ids, delivery_time,
+                 driver_ids, driver_names, shift_hours, past_week_hours, daily_hours,
+                 depots, route_depot, order_depot, driver_depot,
+                 generation: int = 0, loaded_at=None):
+        self.route_ids = route_ids
+        self.route_codes: List[str] = route_codes
+        self.distance_cents = distance_cents
+        self.traffic_levels: List[str] = traffic_levels
+        self.base_time = base_time
+        self.order_ids = order_ids
+        self.order_codes: List[str] = order_codes
+        self.value_cents = value_cents
+        self.order_route_ids = order_route_ids
+        self.delivery_time = delivery_time
+        self.driver_ids = driver_ids
+        self.driver_names: List[str] = driver_names
+        self.shift_hours = shift_hours
+        self.past_week_hours = past_week_hours
+        self.daily_hours = daily_hours
+        # Sorted depot codes; the *_depot columns hold positions in this list
+        self.depots: List[str] = depots
+        self.route_depot = route_depot
+        self.order_depot = order_depot
+        self.driver_depot = driver_depot
+        self.generation = generation
+        self.loaded_at = loaded_at or timezone.now()
+        self._baselines: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, generation: int = 0, depot: Optional[str] = None) -> 'DatasetSnapshot':
+        """Read the tables; with ``depot``, only that depot's rows"""
+        scope = {} if depot is None else {'depot': depot}
+        routes = list(Route.objects.filter(**scope).order_by('id').values_list(
+            'id', 'route_id', 'distance_km', 'traffic_level', 'base_time', 'depot'
+        ))
+        orders = list(Order.objects.filter(**scope).order_by('id').values_list(
+            'id', 'order_id', 'value_rs', 'assigned_route_id', 'delivery_time', 'depot'
+        ))
+        drivers = list(Driver.objects.filter(**scope).order_by('id').values_list(
+            'id', 'name', 'current_shift_hours', 'past_7_day_work_hours', 'past_week_daily_hours', 'depot'
+        ))
+        depots = sorted({row[-1] for rows in (routes, orders, drivers) for row in rows})
+        return cls(
+            route_ids=_int_column((r[0] for r in routes), len(routes)),
+            route_codes=[r[1] for r in routes],
+            distance_cents=_int_column((to_cents(r[2]) for r in routes), len(routes)),
+            traffic_levels=[r[3] for r in routes],
+            base_time=_int_column((r[4] for r in routes), len(routes)),
+            order_ids=_int_column((o[0] for o in orders), len(orders)),
+            order_codes=[o[1] for o in orders],
+            value_cents=_int_column((to_cents(o[2]) for o in orders), len(orders)),
+            order_route_ids=_int_column((UNASSIGNED if o[3] is None else o[3] for o in orders), len(orders)),
+            delivery_time=_int_column((NO_DELIVERY_TIME if o[4] is None else o[4] for o in orders), len(orders)),
+            driver_ids=_int_column((d[0] for d in drivers), len(drivers)),
+            driver_names=[d[1] for d in drivers],
+            shift_hours=_int_column((to_cents(d[2]) for d in drivers), len(drivers)),
+            past_week_hours=_int_column((to_cents(d[3]) for d in drivers), len(drivers)),
+            daily_hours=_readonly(np.array(
+                [_daily_hours_cents(d[4], d[3]) for d in drivers], dtype=np.int64
+            ).reshape(len(drivers), DAYS_PER_WEEK)),
+            depots=depots,
+            route_depot=_depot_column(depots, [r[5] for r in routes]),
+            order_depot=_depot_column(depots, [o[5] for o in orders]),
+            driver_depot=_depot_column(depots, [d[5] for d in drivers]),
+            generation=generation,
+        )
+
+    def __getstate__(self):
+        # Shards are pickled to worker processes; the lock and the cached
+        # lookups stay behind
+        state = {name: value for name, value in self.__dict__.items() if name in self.COLUMNS}
+        state.update(generation=self.generation, loaded_at=self.loaded_at)
+        return state
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def shard(self, depot: str) -> 'DatasetSnapshot':
+        """The routes, orders and drivers of one depot.
+
+        Orders keep their route ids, so an order whose route belongs to
+        another depot has no route in the shard.
+        """
+        index = self.depots.index(depot)
+        rows = {kind: np.flatnonzero(getattr(self, f'{kind}_depot') == index) for kind in ('route', 'order', 'driver')}
+        columns = {'depots': [depot]}
+        for name, kind in self.COLUMNS.items():
+            if kind is None:
+                continue
+            value = getattr(self, name)
+            positions = rows[kind]
+            if name == f'{kind}_depot':
+                columns[name] = _readonly(np.zeros(positions.size, dtype=np.int64))
+            elif isinstance(value, list):
+                columns[name] = [value[i] for i in positions.tolist()]
+            else:
+                columns[name] = _readonly(value[positions])
+        return DatasetSnapshot(**columns, generation=self.generation, loaded_at=self.loaded_at)
+
+    @property
+    def total_orders(self) -> int:
+        return self.order_ids.size
+
+    @cached_property
+    def route_positions(self) -> Dict[str, int]:
+        return {code: i for i, code in enumerate(self.route_codes)}
+
+    @cached_property
+    def order_positions(self) -> Dict[str, int]:
+        return {code: i for i, code in enumerate(self.order_codes)}
+
+    @cached_property
+    def driver_positions(self) -> Dict[int, int]:
+        return {driver_id: i for i, driver_id in enumerate(self.driver_ids.tolist())}
+
+    @cached_property
+    def _order_route_index(self):
+        """Row in the route columns for every order, and which orders have one"""
+        index = np.searchsorted(self.route_ids, self.order_route_ids)
+        found = index < self.route_ids.size
+        found[found] = self.route_ids[index[found]] == self.order_route_ids[found]
+        return _readonly(index), _readonly(found)
+
+    def evaluate(self, plan: EvaluationPlan) -> Evaluation:
+        index, found = self._order_route_index
+        routes = plan.route_columns(self.traffic_levels, self.distance_cents, self.base_time)
+        route_index = index[found]
+        return Evaluation(
+            assigned=found,
+            route_index=route_index,
+            routes=routes,
+            results=plan.evaluate(routes, route_index, self.value_cents[found]),
+        )
+
+    def event_inputs(self, plan: EvaluationPlan) -> Dict[str, Any]:
+        """Dispatch order and per-order route data for evaluate_events(), reusable across days"""
+        index, found = self._order_route_index
+        candidates = np.flatnonzero(found)
+        route_of = index[candidates]
+        base_minutes = self.base_time[route_of]
+        requested = self.delivery_time[candidates]
+        deadline = np.where(requested == NO_DELIVERY_TIME, base_minutes, requested)
+        return {
+            'routes': plan.route_columns(self.traffic_levels, self.distance_cents, self.base_time),
+            'hourly_multipliers': plan.hourly_multipliers(self.traffic_levels),
+            'candidates': candidates,
+            'route_of': route_of,
+            'base_minutes': base_minutes,
+            'deadline': deadline,
+            'priority': np.lexsort((self.order_ids[candidates], deadline)),
+        }
+
+    def evaluate_events(self, plan: EvaluationPlan, num_drivers: int, shift_minutes: float,
+                        start_minute: float, speed_factors: Optional[Sequence[float]] = None,
+                        shift_limits: Optional[Sequence[float]] = None,
+                        inputs: Optional[Dict[str, Any]] = None) -> Evaluation:
+        """Event-mode evaluation: ``num_drivers`` drivers deliver the orders over the day.
+
+        ``start_minute`` is the run's start time as minutes after midnight.
+        Orders are late when delivered more than the rule set's late threshold
+        after their requested delivery_time (after the route's base time when
+        they have none), both counted from the start time. ``speed_factors``
+        and ``shift_limits`` are per driver, see ``dispatch_orders()``.
+        """
+        if inputs is None:
+            inputs = self.event_inputs(plan)
+        candidates = inputs['candidates']
+        route_of = inputs['route_of']
+        deadline = inputs['deadline']
+
+        driver, arrival, driver_minutes = dispatch_orders(
+            priority=inputs['priority'],
+            base_minutes=inputs['base_minutes'],
+            route_of=route_of,
+            hourly_multipliers=inputs['hourly_multipliers'],
+            num_drivers=num_drivers,
+            shift_minutes=shift_minutes,
+            start_minute=start_minute,
+            speed_factors=speed_factors,
+            shift_limits=shift_limits,
+        )
+        delivered = driver != UNDELIVERED
+        assigned = np.zeros(self.total_orders, dtype=bool)
+        assigned[candidates[delivered]] = True
+        undelivered = np.zeros(self.total_orders, dtype=bool)
+        undelivered[candidates[~delivered]] = True
+
+        route_index = route_of[delivered]
+        arrival = arrival[delivered]
+        routes = inputs['routes']
+        return Evaluation(
+            assigned=assigned,
+            route_index=route_index,
+            routes=routes,
+            results=plan.order_results(
+                arrival * 60 > deadline[delivered] * 60 + plan.late_threshold_seconds,
+                np.floor(arrival),
+                routes['fuel_cost'][route_index],
+                self.value_cents[assigned],
+            ),
+            undelivered=undelivered,
+            driver_minutes=driver_minutes,
+            driver=driver[delivered],
+        )
+
+    def driver_history(self, num_drivers: int) -> Tuple[List[str], np.ndarray]:
+        """Names and (num_drivers x 7) past daily hours; drivers beyond the Driver table start rested"""
+        known = min(num_drivers, self.driver_ids.size)
+        history = np.zeros((num_drivers, DAYS_PER_WEEK), dtype=np.float64)
+        history[:known] = self.daily_hours[:known] / 100
+        names = self.driver_names[:known] + [f"Driver {i + 1}" for i in range(known, num_drivers)]
+        return names, history
+
+    def evaluate_day(self, plan: EvaluationPlan, num_drivers: int, shift_minutes: float, start_minute: float,
+                     history: Optional[np.ndarray] = None, inputs: Optional[Dict[str, Any]] = None) -> Evaluation:
+        """Event-mode evaluation of one day, with the drivers' fatigue and weekly hours.
+
+        ``history`` is the drivers' hours on the seven days before, oldest
+        first (``driver_history()`` by default). Drivers fatigued by yesterday
+        are slower and drivers near the weekly limit work less or rest, see
+        ``driver_limits()``. Every event-mode run goes through here.
+        """
+        if history is None:
+            history = self.driver_history(num_drivers)[1]
+        fatigued, allowance = driver_limits(plan, history, shift_minutes / MINUTES_PER_HOUR)
+        return self.evaluate_events(
+            plan, num_drivers, shift_minutes, start_minute,
+            speed_factors=np.where(fatigued, plan.fatigue_time_factor, 1.0).tolist(),
+            shift_limits=(allowance * MINUTES_PER_HOUR).tolist(),
+            inputs=inputs,
+        )
+
+    def baseline(self, plan: EvaluationPlan) -> Dict[str, Any]:
+        """KPIs of the unmodified snapshot, computed once per rule set version"""
+        with self._lock:
+            kpis = self._baselines.get(plan.version)
+        if kpis is None:
+            kpis = summarize(self.evaluate(plan), self.total_orders)
+            with self._lock:
+                self._baselines[plan.version] = kpis
+        return kpis
+
+    def with_overrides(self, routes: Sequence[Dict[str, Any]] = (), orders: Sequence[Dict[str, Any]] = (),
+                       drivers: Sequence[Dict[str, Any]] = ()) -> 'DatasetSnapshot':
+        """New snapshot with the given changes; unchanged columns are shared, not copied.
+
+        Routes and orders are addressed by their codes (``route_id``,
+        ``order_id``), drivers by ``id``. Raises KeyError for unknown ones.
+        """
+        columns = {name: getattr(self, name) for name in self.COLUMNS}
+        copied = set()
+
+        def column(name):
+            if name not in copied:
+                columns[name] = list(columns[name]) if isinstance(columns[name], list) else columns[name].copy()
+                copied.add(name)
+            return columns[name]
+
+        for override in routes:
+            position = self._position(self.route_positions, override['route_id'], 'route')
+            if 'distance_km' in override:
+                column('distance_cents')[position] = to_cents(override['distance_km'])
+            if 'traffic_level' in override:
+                column('traffic_levels')[position] = override['traffic_level']
+            if 'base_time' in override:
+                column('base_time')[position] = override['base_time']
+
+        for override in orders:
+            position = self._position(self.order_positions, override['order_id'], 'order')
+            if 'value_rs' in override:
+                column('value_cents')[position] = to_cents(override['value_rs'])
+            if 'assigned_route' in override:
+                code = override['assigned_route']
+                route_id = UNASSIGNED if code is None else int(
+                    self.route_ids[self._position(self.route_positions, code, 'route')]
+                )
+                column('order_route_ids')[position] = route_id
+
+        for override in drivers:
+            position = self._position(self.driver_positions, override['id'], 'driver')
+            if 'past_7_day_work_hours' in override:
+                column('past_week_hours')[position] = to_cents(override['past_7_day_work_hours'])
+                column('daily_hours')[position] = _daily_hours_cents(None, override['past_7_day_work_hours'])
+            if 'past_week_daily_hours' in override:
+                column('daily_hours')[position] = _daily_hours_cents(override['past_week_daily_hours'], None)
+
+        for name in copied:
+            if isinstance(columns[name], np.ndarray):
+                _readonly(columns[name])
+        snapshot = DatasetSnapshot(**columns, generation=self.generation, loaded_at=self.loaded_at)
+
+        # Codes and ids are never overridden, so lookups built on them carry over
+        inherited = ['route_positions', 'order_positions', 'driver_positions']
+        if 'order_route_ids' not in copied:
+            inherited.append('_order_route_index')
+        for name in inherited:
+            if name in self.__dict__:
+                snapshot.__dict__[name] = self.__dict__[name]
+        return snapshot
+
+    @staticmethod
+    def _position(positions: Dict[Any, int], key: Any, kind: str) -> int:
+        try:
+            return positions[key]
+        except KeyError:
+            raise KeyError(f'Unknown {kind} {key!r}') from None
+
+
+def summarize(evaluation: Evaluation, total_orders: int) -> Dict[str, Any]:
+    """Run KPIs; orders without a route count towards total_orders as not on time"""
+    results = evaluation.results
+    assigned_orders = results['is_late'].size
+    on_time_deliveries = int((~results['is_late']).sum())
+    return {
+        'total_profit': from_units(results['profit'].sum()),
+        'efficiency_score': (on_time_deliveries / total_orders) * 100 if total_orders > 0 else 0,
+        'on_time_deliveries': on_time_deliveries,
+        'late_deliveries': total_orders - on_time_deliveries,
+        'total_fuel_cost': from_units(results['fuel_cost'].sum()),
+        'total_orders': total_orders,
+        'avg_delivery_time': float(results['delivery_minutes'].sum()) / assigned_orders if assigned_orders else 0,
+        'high_value_orders': int(results['high_value'].sum()),
+    }
+
+
+_snapshot: Optional[DatasetSnapshot] = None
+_snapshot_expires = 0.0
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot() -> DatasetSnapshot:
+    """The process-wide shared snapshot, reloaded when the dataset changed"""
+    global _snapshot, _snapshot_expires
+    generation = cache.get(GENERATION_KEY, 0)
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot.generation != generation or time.monotonic() >= _snapshot_expires:
+            _snapshot = DatasetSnapshot.load(generation)
+            _snapshot_expires = time.monotonic() + settings.SCENARIO_SNAPSHOT_TTL
+        return _snapshot
+
+
+def _next_generation() -> None:
+    cache.add(GENERATION_KEY, 0, timeout=None)
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, timeout=None)
+
+
+def invalidate_snapshot(sender, **kwargs) -> None:
+    """post_save/post_delete receiver for Driver, Route and Order"""
+    # Once committed: a snapshot loaded before that would be cached as current
+    transaction.on_commit(_next_generation)
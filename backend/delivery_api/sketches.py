@@ -0,0 +1,223 @@
+"""
+Mergeable quantile sketches of delivery time and profit per run.
+
+A sketch summarises a set of values as at most a few hundred weighted
+centroids, in the manner of the merging t-digest: the sorted values are cut
+into centroids that each span at most one unit of the scale function
+``k(q) = COMPRESSION / (2 pi) * asin(2q - 1)``, so centroids are large around
+the median and hold single values in the tails, which keeps p99 close to
+exact. Merging sketches pools their centroids and cuts them again, so
+fleet-wide and multi-run percentiles come from stored sketches without
+reading any orders.
+
+Every run has sketches of ``delivery_minutes`` and ``profit`` (rupees) for
+the whole run, per driver (the outcome store's ``driver`` column, as in
+the driver performance view) and per route. They are built from the outcome
+columns when the run is committed and stored as ``sketches.npz`` next to the
+columns in the run's outcome store directory (see outcome_store.py). Runs
+without the file have it built from their outcome columns on first read.
+"""
+import logging
+import os
+import uuid
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from . import outcome_store
+from .models import SimulationRun
+from .outcome_store import MISSING_ID
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION = 200
+PERCENTILES = (50, 90, 99)
+KINDS = ('run', 'driver', 'route')
+METRICS = ('delivery_minutes', 'profit')
+FILE_NAME = 'sketches.npz'
+FIELDS = ('keys', 'offsets', 'means', 'weights', 'minimum', 'maximum')
+
+RunSketches = Dict[Tuple[str, str], 'SketchSet']
+
+
+@dataclass
+class SketchSet:
+    """One sketch per group key, centroids stored back to back.
+
+    The centroids of ``keys[i]`` are ``means``/``weights`` from ``offsets[i]``
+    to ``offsets[i + 1]``, in ascending order of mean.
+    """
+    keys: np.ndarray      # int64, ascending
+    offsets: np.ndarray   # int64, len(keys) + 1
+    means: np.ndarray     # float64
+    weights: np.ndarray   # float64
+    minimum: np.ndarray   # float64 per key
+    maximum: np.ndarray   # float64 per key
+
+    @classmethod
+    def build(cls, keys: np.ndarray, values: np.ndarray) -> 'SketchSet':
+        """Sketch ``values`` grouped by ``keys``"""
+        keys = np.asarray(keys, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        return cls._from_centroids(keys, values, np.ones(values.size), keys, values, values)
+
+    @classmethod
+    def merge(cls, sketch_sets: Iterable['SketchSet']) -> 'SketchSet':
+        """Merge sketches key by key"""
+        sketch_sets = list(sketch_sets)
+        return cls._from_centroids(
+            np.concatenate([np.repeat(s.keys, np.diff(s.offsets)) for s in sketch_sets]),
+            np.concatenate([s.means for s in sketch_sets]),
+            np.concatenate([s.weights for s in sketch_sets]),
+            np.concatenate([s.keys for s in sketch_sets]),
+            np.concatenate([s.minimum for s in sketch_sets]),
+            np.concatenate([s.maximum for s in sketch_sets]),
+        )
+
+    @classmethod
+    def _from_centroids(cls, keys, means, weights, group_keys, minimum, maximum) -> 'SketchSet':
+        keys = np.asarray(keys, dtype=np.int64)
+        order = np.lexsort((means, keys))
+        keys, means, weights = keys[order], np.asarray(means, dtype=np.float64)[order], weights[order]
+
+        group_starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if keys.size else np.empty(0, np.int64)
+        sizes = np.diff(np.r_[group_starts, keys.size])
+        cumulative = np.cumsum(weights)
+        before = np.r_[0.0, cumulative][group_starts]
+        total = np.r_[cumulative, 0.0][group_starts + sizes - 1] - before
+        # Quantile of each centroid's midpoint within its group, and the unit
+        # of the scale function it falls in
+        q = (cumulative - weights / 2 - np.repeat(before, sizes)) / np.repeat(total, sizes)
+        k = np.floor(COMPRESSION / (2 * np.pi) * np.arcsin(np.clip(2 * q - 1, -1, 1)))
+
+        starts = np.flatnonzero(np.r_[True, (keys[1:] != keys[:-1]) | (k[1:] != k[:-1])]) if keys.size \
+            else np.empty(0, np.int64)
+        merged_weights = np.add.reduceat(weights, starts) if starts.size else np.empty(0)
+        merged_means = np.add.reduceat(means * weights, starts) / merged_weights if starts.size else np.empty(0)
+
+        unique_keys, inverse = np.unique(np.asarray(group_keys, dtype=np.int64), return_inverse=True)
+        group_min = np.full(unique_keys.size, np.inf)
+        group_max = np.full(unique_keys.size, -np.inf)
+        np.minimum.at(group_min, inverse, minimum)
+        np.maximum.at(group_max, inverse, maximum)
+        # Keys with no values (every input empty) carry no centroids
+        present = np.isin(unique_keys, keys[group_starts])
+        return cls(
+            keys=unique_keys[present],
+            offsets=np.r_[np.searchsorted(starts, group_starts), starts.size].astype(np.int64),
+            means=merged_means,
+            weights=merged_weights,
+            minimum=group_min[present],
+            maximum=group_max[present],
+        )
+
+    def count(self, key: int) -> int:
+        i = self._index(key)
+        return 0 if i is None else int(round(self.weights[self.offsets[i]:self.offsets[i + 1]].sum()))
+
+    def quantiles(self, key: int, qs: Iterable[float]) -> Optional[np.ndarray]:
+        """Interpolated quantiles (0..1) of one key's values; None without values"""
+        i = self._index(key)
+        if i is None:
+            return None
+        means = self.means[self.offsets[i]:self.offsets[i + 1]]
+        weights = self.weights[self.offsets[i]:self.offsets[i + 1]]
+        cumulative = np.cumsum(weights)
+        total = cumulative[-1]
+        # Each centroid sits at the middle of its weight; the extremes pin the ends
+        positions = np.r_[0.0, cumulative - weights / 2, total]
+        values = np.r_[self.minimum[i], means, self.maximum[i]]
+        return np.interp(np.asarray(list(qs), dtype=np.float64) * total, positions, values)
+
+    def percentiles(self, key: int) -> Optional[Dict[str, float]]:
+        values = self.quantiles(key, (p / 100 for p in PERCENTILES))
+        if values is None:
+            return None
+        return {f'p{p}': round(float(v), 2) for p, v in zip(PERCENTILES, values)}
+
+    def _index(self, key: int) -> Optional[int]:
+        i = int(np.searchsorted(self.keys, key))
+        return i if i < self.keys.size and self.keys[i] == key else None
+
+
+def build_run_sketches(columns: Dict[str, np.ndarray]) -> RunSketches:
+    """Sketches of one run's outcome columns (outcome_store.COLUMNS)"""
+    count = columns['order'].size
+    routes = np.asarray(columns['route'])
+    routed = routes != MISSING_ID
+    keys = {
+        'run': np.zeros(count, dtype=np.int64),
+        'driver': np.asarray(columns['driver'], dtype=np.int64),
+        'route': routes,
+    }
+    values = {
+        'delivery_minutes': np.asarray(columns['delivery_minutes'], dtype=np.float64),
+        'profit': np.asarray(columns['profit'], dtype=np.float64) / 100,
+    }
+    sketches = {}
+    for kind in KINDS:
+        for metric in METRICS:
+            # Like the performance views: delivery times only count for orders
+            # with a route, and only routed orders have a route group
+            rows = routed if kind == 'route' or metric == 'delivery_minutes' else slice(None)
+            sketches[kind, metric] = SketchSet.build(keys[kind][rows], values[metric][rows])
+    return sketches
+
+
+def _path(simulation_run: SimulationRun) -> str:
+    return os.path.join(outcome_store.run_dir(simulation_run), FILE_NAME)
+
+
+def write(simulation_run: SimulationRun, columns: Dict[str, np.ndarray]) -> RunSketches:
+    """Build a run's sketches and store them with its outcome columns"""
+    sketches = build_run_sketches(columns)
+    path = _path(simulation_run)
+    # Only alongside stored columns: creating the run directory here would
+    # make the outcome store treat the run as written
+    if settings.OUTCOME_STORE_ENABLED and os.path.isdir(os.path.dirname(path)) and not os.path.exists(path):
+        staging = f'{path}.tmp-{uuid.uuid4().hex}'
+        try:
+            with open(staging, 'wb') as file:
+                np.savez(file, **{
+                    f'{kind}.{metric}.{field}': getattr(sketch, field)
+                    for (kind, metric), sketch in sketches.items() for field in FIELDS
+                })
+            os.replace(staging, path)
+        finally:
+            if os.path.exists(staging):
+                os.remove(staging)
+    return sketches
+
+
+def write_quietly(simulation_run: SimulationRun, columns: Dict[str, np.ndarray]) -> None:
+    """write() for callers that must not fail; the sketches are rebuilt on first read"""
+    try:
+        write(simulation_run, columns)
+    except Exception as e:
+        logger.warning("Could not store quantile sketches for run %s: %s", simulation_run.run_id, e)
+
+
+def load(simulation_run: SimulationRun) -> RunSketches:
+    """A run's sketches, built from its outcome columns if they aren't stored"""
+    if settings.OUTCOME_STORE_ENABLED:
+        try:
+            with np.load(_path(simulation_run)) as stored:
+                return {
+                    (kind, metric): SketchSet(**{field: stored[f'{kind}.{metric}.{field}'] for field in FIELDS})
+                    for kind in KINDS for metric in METRICS
+                }
+        except FileNotFoundError:
+            pass
+    columns = outcome_store.load(simulation_run)
+    try:
+        return write(simulation_run, columns)
+    except OSError as e:
+        logger.warning("Could not store quantile sketches for run %s: %s", simulation_run.run_id, e)
+        return build_run_sketches(columns)
+
+
+def merge_runs(runs: List[RunSketches], kind: str) -> Dict[str, SketchSet]:
+    """Per metric, the runs' ``kind`` sketches merged key by key"""
+    return {metric: SketchSet.merge(sketches[kind, metric] for sketches in runs) for metric in METRICS}
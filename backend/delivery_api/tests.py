@@ -1,3 +1,916 @@
-from django.test import TestCase
+import copy
+import json
+import logging
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import Count, Q, Sum
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import admission, change_feed, docs, logs, outcome_store, rules, simulation
+from .async_views import (
+    AsyncDriverPerformanceView,
+    AsyncHistoricalDataView,
+    AsyncRoutePerformanceView,
+    AsyncSimulationRunListView,
+)
+from .authentication import CachedJWTAuthentication, user_cache
+from .event_simulation import UNDELIVERED, dispatch_orders
+from .models import Change, Driver, IdempotencyRecord, Order, OrderOutcome, Route, RuleSet, SimulationRun
+from .optimizer import PREFER_HOURS, Evaluator, search
+from .route_stats import route_kpis
+from .rules import EvaluationPlan, from_units, get_active_rule_set, get_plan, to_cents
+from .sharding import evaluate_shards
+from .sketches import build_run_sketches, merge_runs
+from .simulation import DatasetSnapshot, summarize
+from .views import DriverViewSet, OrderViewSet, RouteViewSet, RuleSetViewSet, SimulationRunViewSet
+
+
+class SampleDataTestCase(TestCase):
+    """The drivers, routes and orders CSVs shipped in backend/"""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('loaddata', data_dir=str(settings.BASE_DIR), stdout=StringIO())
+        cls.plan = get_plan(get_active_rule_set())
+
+    def setUp(self):
+        super().setUp()
+        # Test transactions never commit, so the shared snapshot isn't reloaded on its own
+        simulation._next_generation()
+        # Rolled-back rule sets free their version numbers for the next test's
+        rules._plans.clear()
+
+
+class APITestCase(TestCase):
+    """Requests go over HTTPS, since SECURE_SSL_REDIRECT is on unless DEBUG"""
+
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create_user('dispatcher', password='first-password')
+        self.client = APIClient()
+
+    def login(self, password: str) -> str:
+        response = self.client.post(
+            '/api/login/', {'username': 'dispatcher', 'password': password}, secure=True
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()['access']
+
+    def get(self, path: str, token: str, **params):
+        return self.client.get(path, params, secure=True, HTTP_AUTHORIZATION=f'Bearer {token}')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite concurrency profile')
+class SQLiteProfileTests(SimpleTestCase):
+    """Connections to a database file get the WAL profile from settings.DATABASES"""
+
+    def connect(self, path: str):
+        default = connections['default']
+        wrapper = type(default)({**copy.deepcopy(default.settings_dict), 'NAME': path}, alias='profile')
+        self.addCleanup(wrapper.close)
+        wrapper.ensure_connection()
+        return wrapper
+
+    def pragma(self, wrapper, name: str):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_readers_are_served_while_a_write_is_open(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'profile.sqlite3')
+        writer, reader = self.connect(path), self.connect(path)
+        self.assertEqual(self.pragma(writer, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(writer, 'synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma(reader, 'busy_timeout'), settings.DATABASES['default']['OPTIONS']['timeout'] * 1000)
+
+        with writer.cursor() as cursor:
+            cursor.execute('CREATE TABLE counter (value INTEGER)')
+            cursor.execute('INSERT INTO counter VALUES (1)')
+        writer.set_autocommit(False)
+        self.addCleanup(writer.rollback)
+        with writer.cursor() as cursor:
+            cursor.execute('UPDATE counter SET value = 2')
+        # The open write neither blocks the reader nor shows through
+        with reader.cursor() as cursor:
+            cursor.execute('SELECT value FROM counter')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+class StartupProfileTests(TestCase):
+    """The lazily imported docs and admin still resolve"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.schema_dir = directory.name
+        schema_settings = override_settings(OPENAPI_SCHEMA_DIR=self.schema_dir)
+        schema_settings.enable()
+        self.addCleanup(schema_settings.disable)
+        docs._schemas.clear()
+        self.addCleanup(docs._schemas.clear)
+
+    def test_schema_is_generated_without_a_build(self):
+        response = self.client.get('/api/schema/', {'format': 'json'}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('/api/orders/', json.loads(response.content)['paths'])
+
+    def test_schema_is_served_from_the_build_output(self):
+        content = b'{"openapi": "3.0.3", "paths": {}}'
+        with open(os.path.join(self.schema_dir, 'schema.json'), 'wb') as file:
+            file.write(content)
+        response = self.client.get('/api/schema/', HTTP_ACCEPT='application/json', secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, content)
+        self.assertTrue(response['Content-Type'].startswith('application/vnd.oai.openapi+json'))
+
+    def test_admin_registers_models_on_first_request(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='admin-password'))
+        self.assertEqual(self.client.get('/admin/', secure=True).status_code, 200)
+        for model in ('order', 'driver', 'route', 'simulationrun', 'ruleset'):
+            with self.subTest(model=model):
+                self.assertEqual(self.client.get(f'/admin/delivery_api/{model}/', secure=True).status_code, 200)
+
+    def test_startup_does_not_import_the_docs_or_admin_modules(self):
+        script = (
+            'import sys, django; django.setup(); import greencart.urls; '
+            'print(sorted(m for m in ("drf_spectacular.openapi", "drf_spectacular.views", "delivery_api.admin") '
+            'if m in sys.modules))'
+        )
+        result = subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR, capture_output=True,
+                                text=True, env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'greencart.settings'})
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), '[]')
+
+
+class CachedJWTAuthenticationTests(APITestCase):
+    def test_password_change_revokes_cached_token(self):
+        old_token = self.login('first-password')
+        self.assertEqual(self.get('/api/drivers/', old_token).status_code, 200)
+
+        self.user.set_password('second-password')
+        self.user.save()
+        new_token = self.login('second-password')
+        # Refills the cache with the user as it is after the change
+        self.assertEqual(self.get('/api/drivers/', new_token).status_code, 200)
+
+        response = self.get('/api/drivers/', old_token)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['code'], 'password_changed')
+        self.assertEqual(self.get('/api/drivers/', new_token).status_code, 200)
+
+    def test_deactivated_user_is_refused(self):
+        token = self.login('first-password')
+        self.assertEqual(self.get('/api/drivers/', token).status_code, 200)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get('/api/drivers/', token).status_code, 401)
+
+
+    def test_each_request_gets_its_own_user(self):
+        token = self.login('first-password')
+        authenticator = CachedJWTAuthentication()
+        validated = authenticator.get_validated_token(token)
+        first = authenticator.get_user(validated)
+        first.cached_permissions = {'set by one request'}
+        first.first_name = 'Changed'
+        second = authenticator.get_user(validated)
+        third = authenticator.get_user(validated)
+        self.assertIsNot(second, third)
+        self.assertFalse(hasattr(second, 'cached_permissions'))
+        self.assertEqual(second.first_name, '')
+        self.assertEqual(second.pk, self.user.pk)
+
+class FleetSearchTests(SampleDataTestCase):
+    DRIVERS = (1, 10)
+    HOURS = (1, 24)
+
+    def test_search_matches_brute_force(self):
+        # Rested drivers are interchangeable, so adding one never makes the day
+        # worse, as the search assumes (see the optimizer's docstring)
+        Driver.objects.update(past_week_daily_hours=[0] * 7, past_7_day_work_hours=0)
+        evaluator = Evaluator(DatasetSnapshot.load(), self.plan, 7.5 * 60)
+        cells = [
+            (num_drivers, max_hours_per_day)
+            for num_drivers in range(self.DRIVERS[0], self.DRIVERS[1] + 1)
+            for max_hours_per_day in range(self.HOURS[0], self.HOURS[1] + 1)
+        ]
+        for metric in ('efficiency_score', 'total_profit'):
+            grid = {cell: float(evaluator.kpis(*cell)[0][metric]) for cell in cells}
+            for target in sorted(set(grid.values())):
+                feasible = [cell for cell, value in grid.items() if value >= target]
+                for prefer, key in ((None, None), (PREFER_HOURS, lambda cell: (cell[1], cell[0]))):
+                    kwargs = {'prefer': prefer} if prefer else {}
+                    plan = search(evaluator, metric=metric, target=target,
+                                  drivers=self.DRIVERS, hours=self.HOURS, **kwargs)['plan']
+                    with self.subTest(metric=metric, target=target, prefer=prefer):
+                        self.assertEqual(
+                            (plan['num_drivers'], plan['max_hours_per_day']), min(feasible, key=key)
+                        )
+
+
+@override_settings(OUTCOME_STORE_ENABLED=False)
+class HorizonTests(SampleDataTestCase, APITestCase):
+    BODY = {'num_drivers': 3, 'start_time': '2025-01-01 09:00:00', 'max_hours_per_day': 10}
+
+    def post(self, path, body):
+        response = self.client.post(path, body, format='json', secure=True,
+                                    HTTP_AUTHORIZATION=f'Bearer {self.login("first-password")}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_days_roll_the_seven_day_window_forward(self):
+        drivers = list(Driver.objects.order_by('id')[:3])
+        data = self.post('/api/simulate/horizon/', {**self.BODY, 'days': 3})
+        self.assertEqual([day['day'] for day in data['daily']], [1, 2, 3])
+
+        # The first day is an ordinary event-mode simulation
+        run = self.post('/api/simulate/', {**self.BODY, 'mode': 'event'})
+        first = data['daily'][0]
+        for field in ('total_profit', 'efficiency_score', 'on_time_deliveries', 'late_deliveries'):
+            self.assertAlmostEqual(float(first[field]), float(run[field]), places=2, msg=field)
+
+        # Each day's hours are appended to the window and the oldest dropped
+        self.assertEqual(len(data['drivers']), 3)
+        for driver, state in zip(drivers, data['drivers']):
+            self.assertEqual(state['name'], driver.name)
+            history = state['last_7_days_hours']
+            self.assertEqual(history[:4], [round(float(h), 2) for h in driver.past_week_daily_hours[3:]])
+        for day, column in zip(data['daily'], range(4, 7)):
+            self.assertAlmostEqual(sum(state['last_7_days_hours'][column] for state in data['drivers']),
+                                   day['driver_hours'], places=1)
+        # Drivers who worked past the 8-hour fatigue threshold on day 1 are fatigued on day 2
+        over_threshold = sum(state['last_7_days_hours'][4] > 8 for state in data['drivers'])
+        self.assertGreater(over_threshold, 0)
+        self.assertGreaterEqual(data['daily'][1]['drivers_fatigued'], over_threshold)
+
+
+class FleetOptimizationAPITests(SampleDataTestCase, APITestCase):
+    def test_endpoint_finds_the_smallest_feasible_fleet_on_the_sample_data(self):
+        token = self.login('first-password')
+        evaluator = Evaluator(DatasetSnapshot.load(), self.plan, 9 * 60)
+        scores = [float(evaluator.kpis(num_drivers, 8)[0]['efficiency_score']) for num_drivers in range(1, 11)]
+        # More drivers never lower the score on this data, so bisection applies
+        self.assertEqual(scores, sorted(scores))
+        for target in sorted(set(scores)):
+            response = self.client.post('/api/simulate/optimize/', {
+                'metric': 'efficiency_score', 'target': target, 'start_time': '2025-01-01 09:00:00',
+                'max_drivers': 10, 'min_hours_per_day': 8, 'max_hours_per_day': 8,
+            }, format='json', secure=True, HTTP_AUTHORIZATION=f'Bearer {token}')
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            with self.subTest(target=target):
+                self.assertTrue(data['feasible'])
+                self.assertEqual(data['plan']['num_drivers'], 1 + next(i for i, s in enumerate(scores) if s >= target))
+                self.assertEqual(data['plan']['max_hours_per_day'], 8)
+                # Bisection over 10 driver counts
+                self.assertLessEqual(data['simulations'], 5)
+
+
+@override_settings(ADMISSION_CONTROL_ENABLED=True, ADMISSION_CONTROL={
+    'simulation': {'limit': 1, 'queue_size': 1, 'queue_timeout': 0.2, 'lease': 60},
+})
+class AdmissionControlTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        admission._controllers.clear()
+        self.addCleanup(admission._controllers.clear)
+        self.token = self.login('first-password')
+        # Another request holds the only slot
+        self.controller = admission.get_controller('simulation')
+        self.slot = self.controller.acquire()
+
+    def simulate(self, **extra):
+        return self.client.post('/api/simulate/', {}, format='json', secure=True,
+                                HTTP_AUTHORIZATION=f'Bearer {self.token}', **extra)
+
+    def test_sync_worker_is_rejected_without_waiting(self):
+        # The test client, like gunicorn's sync worker, isn't multithreaded
+        response = self.simulate()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.controller.stats()['rejected_queue_full'], 1)
+
+    def test_threaded_worker_waits_then_times_out(self):
+        response = self.simulate(**{'wsgi.multithread': True})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.controller.stats()['rejected_timeout'], 1)
+
+    def test_full_queue_is_rejected(self):
+        ticket = self.controller._take(self.controller._queue_keys, 60)
+        self.addCleanup(cache.delete, ticket)
+        response = self.simulate(**{'wsgi.multithread': True})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_request_is_admitted_once_the_slot_is_free(self):
+        self.controller.release(self.slot)
+        # Admitted: the empty body fails validation in the view
+        self.assertEqual(self.simulate().status_code, 400)
+        self.assertEqual(self.controller.stats()['in_flight'], 0)
+
+
+class ScenarioTests(SampleDataTestCase, APITestCase):
+    EVENT = {'mode': 'event', 'num_drivers': 3, 'start_time': '2025-01-01 08:00:00', 'max_hours_per_day': 8}
+
+    def scenario(self, body):
+        return self.client.post('/api/scenarios/', body, format='json', secure=True,
+                                HTTP_AUTHORIZATION=f'Bearer {self.login("first-password")}')
+
+    def test_driver_overrides_are_rejected_in_batch_mode(self):
+        driver = Driver.objects.order_by('id').first()
+        response = self.scenario({'drivers': [{'id': driver.id, 'past_7_day_work_hours': '70'}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('drivers', response.json())
+
+    def test_driver_overrides_change_event_mode_kpis(self):
+        driver = Driver.objects.order_by('id').first()
+        # A week at the weekly limit leaves no hours for the day
+        response = self.scenario({**self.EVENT, 'drivers': [{'id': driver.id, 'past_7_day_work_hours': '70'}]})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['mode'], 'event')
+        self.assertEqual(data['kpi_deltas']['drivers_resting'], 1)
+        self.assertLess(data['kpi_deltas']['driver_hours'], 0)
+
+    @override_settings(OUTCOME_STORE_ENABLED=False)
+    def test_event_scenario_without_overrides_reproduces_the_simulation(self):
+        body = {**self.EVENT, 'start_time': '2025-01-01 09:00:00', 'max_hours_per_day': 4}
+        kpis = self.scenario(body).json()['kpis']
+        run = self.client.post('/api/simulate/', body, format='json', secure=True,
+                               HTTP_AUTHORIZATION=f'Bearer {self.login("first-password")}').json()
+        for field in ('total_profit', 'efficiency_score', 'on_time_deliveries', 'late_deliveries',
+                      'undelivered_orders'):
+            self.assertAlmostEqual(float(kpis[field]), float(run[field]), places=2, msg=field)
+
+    def test_event_mode_needs_the_day_parameters(self):
+        response = self.scenario({'mode': 'event'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'num_drivers', 'start_time', 'max_hours_per_day'})
+
+
+class ShardingTests(SampleDataTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # A second depot next to the sample data's
+        route = Route.objects.create(route_id='N1', depot='north', distance_km=12, traffic_level='High', base_time=45)
+        for i in range(10):
+            Order.objects.create(order_id=f'N{i}', depot='north', value_rs=400 + 150 * i,
+                                 assigned_route=route, delivery_time=30 + 10 * i)
+        Driver.objects.create(name='North', depot='north', current_shift_hours=4, past_7_day_work_hours=30)
+
+    def test_sharded_batch_kpis_equal_unsharded(self):
+        snapshot = DatasetSnapshot.load()
+        self.assertEqual(snapshot.depots, ['main', 'north'])
+        unsharded = snapshot.evaluate(self.plan)
+        sharded, shard_kpis = evaluate_shards(snapshot, self.plan, events=False, num_drivers=5,
+                                              shift_minutes=8 * 60, start_minute=9 * 60)
+        self.assertEqual(set(shard_kpis), {'main', 'north'})
+        self.assertEqual(summarize(sharded, snapshot.total_orders), summarize(unsharded, snapshot.total_orders))
+        np.testing.assert_array_equal(sharded.assigned, unsharded.assigned)
+        for name, column in unsharded.results.items():
+            np.testing.assert_array_equal(sharded.results[name], column, err_msg=name)
+
+
+@override_settings(OUTCOME_STORE_ENABLED=False)
+class AsyncViewTests(SampleDataTestCase, APITestCase):
+    """The ASGI views answer exactly like the sync views they replace"""
+
+    def test_async_views_match_the_sync_views(self):
+        token = self.login('first-password')
+        run_id = self.client.post('/api/simulate/', {'num_drivers': 3, 'start_time': '2025-01-01 09:00:00',
+                                                     'max_hours_per_day': 8},
+                                  format='json', secure=True, HTTP_AUTHORIZATION=f'Bearer {token}').json()['run_id']
+        factory = RequestFactory()
+        for path, view, params in [
+            ('/api/analytics/historical-data/', AsyncHistoricalDataView, {}),
+            ('/api/analytics/historical-data/', AsyncHistoricalDataView, {'depot': 'main'}),
+            ('/api/analytics/driver-performance/', AsyncDriverPerformanceView, {'run_id': run_id}),
+            ('/api/analytics/route-performance/', AsyncRoutePerformanceView, {'run_id': run_id}),
+            ('/api/analytics/route-performance/', AsyncRoutePerformanceView, {'run_id': 'missing'}),
+            ('/api/simulation-runs/', AsyncSimulationRunListView, {}),
+        ]:
+            with self.subTest(path=path, params=params):
+                expected = self.get(path, token, **params)
+                request = factory.get(path, params, secure=True, HTTP_AUTHORIZATION=f'Bearer {token}')
+                response = async_to_sync(view.as_view())(request)
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(response.content, expected.content)
+                self.assertEqual(response.get(change_feed.VERSION_HEADER), expected.get(change_feed.VERSION_HEADER))
+
+    def test_async_views_require_authentication(self):
+        request = RequestFactory().get('/api/analytics/historical-data/', secure=True)
+        response = async_to_sync(AsyncHistoricalDataView.as_view())(request)
+        self.assertEqual(response.status_code, self.get('/api/analytics/historical-data/', 'invalid').status_code)
+
+
+class FastListTests(SampleDataTestCase, APITestCase):
+    def test_list_responses_match_the_serializers(self):
+        token = self.login('first-password')
+        self.client.post('/api/simulate/', {'num_drivers': 3, 'start_time': '2025-01-01 09:00:00',
+                                            'max_hours_per_day': 8},
+                         format='json', secure=True, HTTP_AUTHORIZATION=f'Bearer {token}')
+        # Nulls, an unassigned order and a second rule set
+        Order.objects.create(order_id='unassigned', value_rs=Decimal('12.50'))
+        RuleSet.objects.create(name='Second', late_penalty=Decimal('75.00'))
+        for path, viewset in [('/api/orders/', OrderViewSet), ('/api/drivers/', DriverViewSet),
+                              ('/api/routes/', RouteViewSet), ('/api/simulation-runs/', SimulationRunViewSet),
+                              ('/api/rule-sets/', RuleSetViewSet)]:
+            with self.subTest(path=path):
+                response = self.get(path, token)
+                self.assertEqual(response.status_code, 200)
+                expected = viewset.serializer_class(viewset.queryset.all(), many=True).data
+                self.assertEqual(response.content, JSONRenderer().render(expected))
+
+
+class OutcomeStoreTests(SampleDataTestCase, APITestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        store = override_settings(OUTCOME_STORE_ENABLED=True, OUTCOME_STORE_DIR=directory.name)
+        store.enable()
+        self.addCleanup(store.disable)
+
+    def simulate(self, **body) -> SimulationRun:
+        token = self.login('first-password')
+        # The columns are written once the run commits
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/simulate/', {'start_time': '2025-01-01 09:00:00', **body},
+                                        format='json', secure=True, HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 200)
+        run = SimulationRun.objects.get(run_id=response.json()['run_id'])
+        self.assertTrue(os.path.isdir(outcome_store.run_dir(run)))
+        return run
+
+    def assert_store_matches_table(self, run: SimulationRun):
+        stored = outcome_store.load(run)
+        table = outcome_store.load_from_table(run)
+        self.assertEqual(set(stored), set(table))
+        for name, column in table.items():
+            self.assertEqual(stored[name].dtype, column.dtype, name)
+            np.testing.assert_array_equal(stored[name], column, err_msg=name)
+        return stored
+
+    def test_batch_run_columns_match_the_outcome_table(self):
+        run = self.simulate(num_drivers=3, max_hours_per_day=8)
+        stored = self.assert_store_matches_table(run)
+        np.testing.assert_array_equal(stored['driver'], outcome_store.round_robin_drivers(stored['order'].size, 3))
+
+    def test_event_run_columns_match_the_outcome_table(self):
+        run = self.simulate(mode='event', num_drivers=3, max_hours_per_day=4)
+        self.assert_store_matches_table(run)
+
+
+@override_settings(OUTCOME_STORE_ENABLED=False)
+class RunDiffTests(SampleDataTestCase, APITestCase):
+    def simulate(self, token, rule_set: RuleSet) -> str:
+        response = self.client.post('/api/simulate/', {
+            'num_drivers': 3, 'start_time': '2025-01-01 09:00:00', 'max_hours_per_day': 8,
+            'rule_set_version': rule_set.version,
+        }, format='json', secure=True, HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['run_id']
+
+    @staticmethod
+    def route_totals(run_id: str):
+        rows = OrderOutcome.objects.filter(simulation_run__run_id=run_id).values('route__route_id').annotate(
+            orders=Count('id'), late=Count('id', filter=Q(is_late=True)), profit=Sum('profit')
+        )
+        return {row['route__route_id']: row for row in rows}
+
+    def test_route_changes_match_the_outcome_rows(self):
+        token = self.login('first-password')
+        base_rules = get_active_rule_set()
+        # Fewer late deliveries, but each costs more
+        compare_rules = RuleSet.objects.create(late_threshold_minutes=30, late_penalty=Decimal('120.00'),
+                                               high_value_bonus_rate=Decimal('0.25'))
+        base_run, compare_run = self.simulate(token, base_rules), self.simulate(token, compare_rules)
+
+        response = self.get('/api/analytics/run-diff/', token, base_run_id=base_run, compare_run_id=compare_run)
+        self.assertEqual(response.status_code, 200)
+        route_changes = {change['route_id']: change for change in response.json()['route_changes']}
+        base, compare = self.route_totals(base_run), self.route_totals(compare_run)
+        self.assertEqual(set(route_changes), set(base) | set(compare))
+        self.assertTrue(any(change['late_delta'] for change in route_changes.values()))
+        for route_id, change in route_changes.items():
+            with self.subTest(route=route_id):
+                self.assertEqual(change['base_orders'], base[route_id]['orders'])
+                self.assertEqual(change['compare_late'], compare[route_id]['late'])
+                self.assertEqual(change['late_delta'], compare[route_id]['late'] - base[route_id]['late'])
+                self.assertEqual(change['base_profit'], float(base[route_id]['profit']))
+                self.assertEqual(change['compare_profit'], float(compare[route_id]['profit']))
+                self.assertEqual(change['profit_delta'], float(compare[route_id]['profit'] - base[route_id]['profit']))
+
+
+class ProjectedKPITests(SampleDataTestCase, APITestCase):
+    def projected(self, **params):
+        return self.get('/api/analytics/projected-kpis/', self.login('first-password'), **params)
+
+    def test_depot_kpis_come_from_the_depot_shard(self):
+        route = Route.objects.create(route_id='N1', depot='north', distance_km=12, traffic_level='High', base_time=45)
+        Order.objects.create(order_id='N0', depot='north', value_rs=1500, assigned_route=route, delivery_time=30)
+        simulation._next_generation()
+        snapshot = DatasetSnapshot.load(depot='north')
+        expected = summarize(snapshot.evaluate(self.plan), snapshot.total_orders)
+
+        response = self.projected(depot='north')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['depot'], 'north')
+        self.assertEqual(response.json()['kpis']['total_orders'], 1)
+        self.assertAlmostEqual(response.json()['kpis']['total_profit'], float(expected['total_profit']), places=2)
+        self.assertEqual(self.projected(depot='nowhere').status_code, 404)
+
+    def assert_kpis_match(self):
+        simulation._next_generation()
+        snapshot = DatasetSnapshot.load()
+        self.assertEqual(route_kpis(self.plan), summarize(snapshot.evaluate(self.plan), snapshot.total_orders))
+
+    def test_route_statistics_follow_every_kind_of_order_write(self):
+        self.assert_kpis_match()
+        first, second = Route.objects.order_by('id')[:2]
+        order = Order.objects.create(order_id='new', value_rs=Decimal('2500.00'), assigned_route=first)
+        self.assert_kpis_match()
+        order.value_rs = Decimal('800.00')
+        order.save()
+        self.assert_kpis_match()
+        order.assigned_route = second
+        order.save(update_fields=['assigned_route'])
+        self.assert_kpis_match()
+        Order.objects.get(pk=order.pk).delete()
+        self.assert_kpis_match()
+
+        # The admin's set-based actions, which send no Order signals
+        self.client.force_login(User.objects.create_superuser('admin', password='admin-password'))
+        changelist = '/admin/delivery_api/order/'
+        on_first = list(Order.objects.filter(assigned_route=first).values_list('pk', flat=True))
+        response = self.client.post(changelist, {'action': 'unassign_route', '_selected_action': on_first},
+                                    secure=True)
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Order.objects.filter(assigned_route=first).exists())
+        self.assert_kpis_match()
+        # Unassigned and assigned orders together
+        selected = on_first + list(Order.objects.filter(assigned_route=second).values_list('pk', flat=True))
+        response = self.client.post(changelist, {'action': 'delete_selected', '_selected_action': selected,
+                                                 'post': 'yes'}, secure=True)
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Order.objects.filter(pk__in=selected).exists())
+        self.assert_kpis_match()
+
+    def test_saving_a_loaded_order_reads_no_previous_values(self):
+        order = Order.objects.filter(assigned_route__isnull=False).first()
+        order.value_rs += 1
+        with CaptureQueriesContext(connection) as queries:
+            order.save()
+        self.assertFalse([q['sql'] for q in queries if q['sql'].startswith('SELECT') and 'delivery_api_order' in q['sql']])
+
+
+@override_settings(OUTCOME_STORE_ENABLED=False)
+class ConcurrentSimulationTests(SampleDataTestCase, APITestCase):
+    BODY = {'num_drivers': 3, 'start_time': '2025-01-01 09:00:00', 'max_hours_per_day': 8}
+
+    def simulate(self, **body):
+        response = self.client.post('/api/simulate/', {**self.BODY, **body}, format='json', secure=True,
+                                    HTTP_AUTHORIZATION=f'Bearer {self.login("first-password")}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['run_id']
+
+    def test_runs_started_in_the_same_second_get_distinct_ids(self):
+        started = timezone.now().replace(microsecond=0)
+        with mock.patch('delivery_api.views.timezone.now', return_value=started):
+            # Different bodies: with the clock stopped, an identical request would look
+            # like it arrived while the first was in flight and get its response
+            run_ids = [self.simulate(), self.simulate(num_drivers=4)]
+        self.assertNotEqual(*run_ids)
+        self.assertEqual(SimulationRun.objects.filter(run_id__in=run_ids).count(), 2)
+
+    def test_a_run_does_not_overwrite_results_of_a_later_run(self):
+        self.simulate()
+        # A run that started after the next one has already published
+        later = timezone.now() + timedelta(hours=1)
+        Order.objects.update(simulation_run_at=later)
+        published = dict(Order.objects.values_list('pk', 'profit'))
+
+        stricter = RuleSet.objects.create(late_threshold_minutes=0, late_penalty=Decimal('500.00'))
+        run_id = self.simulate(rule_set_version=stricter.version)
+        self.assertEqual(dict(Order.objects.values_list('pk', 'profit')), published)
+        self.assertFalse(Order.objects.exclude(simulation_run_at=later).exists())
+        # The run itself is still recorded in full
+        outcomes = dict(OrderOutcome.objects.filter(simulation_run__run_id=run_id).values_list('order_id', 'profit'))
+        self.assertEqual(set(outcomes), set(published))
+        self.assertNotEqual(outcomes, published)
+
+
+@override_settings(OUTCOME_STORE_ENABLED=False)
+class IdempotencyTests(SampleDataTestCase, APITestCase):
+    def test_replay_is_byte_identical(self):
+        token = self.login('first-password')
+        body = {'num_drivers': 3, 'start_time': '2025-01-01 09:00:00', 'max_hours_per_day': 8}
+
+        def simulate():
+            return self.client.post('/api/simulate/', body, format='json', secure=True,
+                                    HTTP_AUTHORIZATION=f'Bearer {token}', HTTP_IDEMPOTENCY_KEY='run-once')
+
+        first = simulate()
+        self.assertEqual(first.status_code, 200)
+        replay = simulate()
+        self.assertEqual(replay.status_code, 200)
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(replay.content, first.content)
+        self.assertEqual(SimulationRun.objects.count(), 1)
+
+    def test_duplicate_in_flight_on_sync_worker_is_rejected_without_waiting(self):
+        token = self.login('first-password')
+        body = {'num_drivers': 3, 'start_time': '2025-01-01 09:00:00', 'max_hours_per_day': 8}
+
+        def simulate(**extra):
+            return self.client.post('/api/simulate/', body, format='json', secure=True,
+                                    HTTP_AUTHORIZATION=f'Bearer {token}', HTTP_IDEMPOTENCY_KEY='run-once', **extra)
+
+        self.assertEqual(simulate().status_code, 200)
+        # Make the original look like it is still running
+        IdempotencyRecord.objects.filter(key='run-once').update(completed=False)
+        started = time.monotonic()
+        response = simulate()
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+
+        with self.settings(IDEMPOTENCY_WAIT_TIMEOUT=0.3):
+            started = time.monotonic()
+            response = simulate(**{'wsgi.multithread': True})
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(SimulationRun.objects.count(), 1)
+
+
+class ChangeFeedTests(APITestCase):
+    def test_since_returns_tombstones_until_pruned(self):
+        token = self.login('first-password')
+        kept = Driver.objects.create(name='Kept', current_shift_hours=0, past_7_day_work_hours=0)
+        gone = Driver.objects.create(name='Gone', current_shift_hours=0, past_7_day_work_hours=0)
+        listing = self.get('/api/drivers/', token)
+        version = int(listing['Change-Version'])
+
+        self.assertEqual(self.client.delete(f'/api/drivers/{gone.id}/', secure=True,
+                                            HTTP_AUTHORIZATION=f'Bearer {token}').status_code, 204)
+        kept.name = 'Renamed'
+        kept.save()
+
+        changes = self.get('/api/drivers/', token, since=version).json()
+        self.assertEqual(changes['deleted'], [gone.id])
+        self.assertEqual([row['id'] for row in changes['results']], [kept.id])
+        self.assertGreater(changes['version'], version)
+        # Nothing changed since the returned version
+        self.assertEqual(self.get('/api/drivers/', token, since=changes['version']).json()['deleted'], [])
+
+        Change.objects.filter(version__lte=changes['version']).update(created_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(change_feed.prune(days=1), 1)
+        self.assertEqual(self.get('/api/drivers/', token, since=version).status_code, 410)
+        self.assertEqual(self.get('/api/drivers/', token, since=changes['version']).status_code, 200)
+
+
+    def test_writes_take_the_version_only_at_the_end_of_their_change(self):
+        before = change_feed.current_version()
+        with Change.scope() as change:
+            first = Driver.objects.create(name='First', current_shift_hours=0, past_7_day_work_hours=0)
+            second = Driver.objects.create(name='Second', current_shift_hours=0, past_7_day_work_hours=0)
+            deleted = first.pk
+            first.delete()
+            # The writes took no version, so they held no counter lock
+            self.assertEqual(change_feed.current_version(), before)
+            self.assertIsNone(Change.objects.get(pk=change).version)
+        self.assertEqual(change_feed.current_version(), before + 1)
+        self.assertEqual(Change.objects.get(pk=change).version, before + 1)
+        self.assertEqual(Driver.objects.get(pk=second.pk).sync_version, change)
+        self.assertEqual(change_feed.deleted_since(Driver, before), [deleted])
+        self.assertEqual(list(change_feed.changed_since(Driver.objects.all(), before)), [second])
+        self.assertEqual(change_feed.deleted_since(Driver, before + 1), [])
+
+    def test_depot_feed_reports_rows_moved_out_as_deleted(self):
+        token = self.login('first-password')
+        moved = Driver.objects.create(name='Moved', depot='north', current_shift_hours=0, past_7_day_work_hours=0)
+        stays = Driver.objects.create(name='Stays', depot='north', current_shift_hours=0, past_7_day_work_hours=0)
+        version = int(self.get('/api/drivers/', token, depot='north')['Change-Version'])
+
+        moved.depot = 'south'
+        moved.save()
+        stays.name = 'Still here'
+        stays.save(update_fields=['name'])
+
+        north = self.get('/api/drivers/', token, depot='north', since=version).json()
+        self.assertEqual(north['deleted'], [moved.id])
+        self.assertEqual([row['id'] for row in north['results']], [stays.id])
+        south = self.get('/api/drivers/', token, depot='south', since=version).json()
+        self.assertEqual(south['deleted'], [])
+        self.assertEqual([row['id'] for row in south['results']], [moved.id])
+        # Not a delete for the unfiltered feed
+        self.assertEqual(self.get('/api/drivers/', token, since=version).json()['deleted'], [])
+
+        # Moved back: listed again after its removal
+        moved.depot = 'north'
+        moved.save()
+        north = self.get('/api/drivers/', token, depot='north', since=version).json()
+        self.assertEqual(north['deleted'], [moved.id])
+        self.assertEqual({row['id'] for row in north['results']}, {moved.id, stays.id})
+
+
+class EvaluationPlanTests(SimpleTestCase):
+    """The integer plan against the rules evaluated in Decimal, order by order"""
+    ROUTES = [
+        # traffic level, distance km, base time
+        ('High', Decimal('12.35'), 20),
+        ('High', Decimal('7.10'), 45),
+        ('Medium', Decimal('3.99'), 50),
+        ('Medium', Decimal('25.00'), 60),
+        ('Low', Decimal('9.87'), 30),
+        ('low', Decimal('0.01'), 5),
+    ]
+    VALUES = ['0.01', '250.50', '999.99', '1000.00', '1000.01', '1234.56', '5000.00', '99999.99']
+
+    def expected(self, rule_set, level, distance, base_time, value):
+        levels = {name.lower(): level_rules for name, level_rules in rule_set.traffic_levels.items()}
+        level_rules = levels.get(level.lower(), {})
+        surcharge = Decimal(level_rules.get('fuel_surcharge_per_km', '0'))
+        multiplier = Decimal(str(level_rules.get('time_multiplier', 1.0)))
+        is_late = base_time * multiplier > base_time + rule_set.late_threshold_minutes
+        fuel = distance * (rule_set.fuel_cost_per_km + surcharge)
+        penalty = rule_set.late_penalty if is_late else Decimal(0)
+        bonus = value * rule_set.high_value_bonus_rate if value > rule_set.high_value_threshold and not is_late else Decimal(0)
+        return {'is_late': is_late, 'fuel_cost': fuel, 'penalty': penalty, 'bonus': bonus,
+                'profit': value + bonus - penalty - fuel}
+
+    def check(self, rule_set):
+        plan = EvaluationPlan(rule_set)
+        routes = plan.route_columns(
+            [r[0] for r in self.ROUTES],
+            np.array([to_cents(r[1]) for r in self.ROUTES], dtype=np.int64),
+            np.array([r[2] for r in self.ROUTES], dtype=np.int64),
+        )
+        pairs = [(route, Decimal(value)) for route in range(len(self.ROUTES)) for value in self.VALUES]
+        results = plan.evaluate(
+            routes,
+            np.array([route for route, _ in pairs]),
+            np.array([to_cents(value) for _, value in pairs], dtype=np.int64),
+        )
+        for i, (route, value) in enumerate(pairs):
+            expected = self.expected(rule_set, *self.ROUTES[route], value)
+            with self.subTest(route=self.ROUTES[route], value=value):
+                self.assertEqual(bool(results['is_late'][i]), expected['is_late'])
+                for column in ('fuel_cost', 'penalty', 'bonus', 'profit'):
+                    self.assertEqual(from_units(results[column][i]), expected[column], column)
+        # Both outcomes occur, and bonuses on either side of the threshold
+        self.assertTrue(results['is_late'].any() and not results['is_late'].all())
+        self.assertTrue((results['bonus'] > 0).any())
+
+    def test_default_rules(self):
+        self.check(RuleSet())
+
+    def test_custom_rules(self):
+        self.check(RuleSet(
+            fuel_cost_per_km=Decimal('4.35'),
+            traffic_levels={
+                'High': {'fuel_surcharge_per_km': '3.15', 'time_multiplier': 1.75},
+                'medium': {'fuel_surcharge_per_km': '0.45', 'time_multiplier': 1.2},
+                'low': {'fuel_surcharge_per_km': '0.00', 'time_multiplier': 0.9},
+            },
+            late_threshold_minutes=7,
+            late_penalty=Decimal('37.25'),
+            high_value_threshold=Decimal('999.99'),
+            high_value_bonus_rate=Decimal('0.15'),
+        ))
+
+
+class LoggingTests(SimpleTestCase):
+    @staticmethod
+    def record(msg, *args, level=logging.WARNING, name='delivery_api.views', exc_info=None):
+        return logging.LogRecord(name, level, __file__, 1, msg, args, exc_info)
+
+    def test_sampling_filter_passes_a_burst_per_template_and_window(self):
+        sampling = logs.SamplingFilter(burst=2, interval=60)
+        with mock.patch('delivery_api.logs.time.monotonic', return_value=1000.0) as clock:
+            passed = [sampling.filter(self.record('Run %s failed', i)) for i in range(5)]
+            self.assertEqual(passed, [True, True, False, False, False])
+            # Other templates, and anything but warnings, have their own budget
+            self.assertTrue(sampling.filter(self.record('Route %s missing', 1)))
+            self.assertTrue(all(sampling.filter(self.record('Run %s failed', 1, level=logging.ERROR))
+                                for _ in range(5)))
+
+            clock.return_value = 1060.0
+            record = self.record('Run %s failed', 5)
+            self.assertTrue(sampling.filter(record))
+            self.assertEqual(record.getMessage(), 'Run 5 failed (3 similar messages suppressed)')
+            self.assertTrue(sampling.filter(self.record('Run %s failed', 6)))
+            self.assertFalse(sampling.filter(self.record('Run %s failed', 7)))
+
+    def test_queued_records_are_formatted_by_the_listener(self):
+        handler = logs.NonBlockingQueueHandler(queue.Queue())
+        handler.setFormatter(mock.Mock(side_effect=AssertionError('formatted in the logging thread')))
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            exc_info = sys.exc_info()
+        args = ['first']
+        handler.handle(self.record('Got %s', args, exc_info=exc_info))
+        args.append('second')
+
+        queued = handler.queue.get_nowait()
+        self.assertEqual(queued.getMessage(), "Got ['first']")
+        self.assertIs(queued.exc_info, exc_info)
+        formatted = logging.Formatter('%(levelname)s %(message)s').format(queued)
+        self.assertTrue(formatted.startswith("WARNING Got ['first']\nTraceback"))
+        self.assertEqual(formatted.count('ValueError: boom'), 1)
+
+
+class DispatchTests(SimpleTestCase):
+    def test_order_goes_to_a_later_driver_who_is_back_in_time(self):
+        # Route 0 is slow in the first hour; route 1 never is
+        multipliers = np.ones((2, 24))
+        multipliers[0, 0] = 5.0
+        driver, arrival, _ = dispatch_orders(
+            priority=np.array([0, 1]), base_minutes=np.array([30.0, 20.0]), route_of=np.array([1, 0]),
+            hourly_multipliers=multipliers, num_drivers=2, shift_minutes=100, start_minute=0,
+        )
+        # Driver 1 is free first but would be back at 120; driver 0 is back
+        # from the first order at 60 and out of the slow hour
+        self.assertEqual(driver.tolist(), [0, 0])
+        self.assertEqual(arrival.tolist(), [30.0, 80.0])
+
+    def test_order_nobody_can_fit_is_undelivered(self):
+        driver, _, _ = dispatch_orders(
+            priority=np.array([0]), base_minutes=np.array([60.0]), route_of=np.array([0]),
+            hourly_multipliers=np.ones((1, 24)), num_drivers=3, shift_minutes=100, start_minute=0,
+        )
+        self.assertEqual(driver.tolist(), [UNDELIVERED])
+
+
+class SketchTests(SimpleTestCase):
+    @staticmethod
+    def columns(delivery_minutes, driver):
+        count = len(delivery_minutes)
+        return {
+            'order': np.arange(count, dtype=np.int64),
+            'route': np.ones(count, dtype=np.int64),
+            'profit': np.full(count, 10000, dtype=np.int64),
+            'fuel_cost': np.zeros(count, dtype=np.int64),
+            'is_late': np.zeros(count, dtype=bool),
+            'delivery_minutes': np.asarray(delivery_minutes, dtype=np.int32),
+            'driver': np.asarray(driver, dtype=np.int32),
+        }
+
+    def test_quantiles_are_close_to_exact_percentiles(self):
+        rng = np.random.default_rng(7)
+        count = 20000
+        # Skewed, like order profits and delivery times
+        profit = np.rint(rng.lognormal(7, 1.0, count) * 100).astype(np.int64)
+        minutes = np.rint(rng.lognormal(4, 0.6, count)).astype(np.int32)
+        columns = {**self.columns(minutes, rng.integers(0, 10, count)), 'profit': profit}
+        sketches = build_run_sketches(columns)
+        exact_profit = profit / 100
+        for quantile, tolerance in ((50, 0.01), (90, 0.01), (99, 0.025)):
+            expected = np.percentile(exact_profit, quantile)
+            self.assertAlmostEqual(sketches['run', 'profit'].percentiles(0)[f'p{quantile}'], expected,
+                                   delta=expected * tolerance)
+            # Whole minutes add up to a minute of discretization
+            expected = np.percentile(minutes, quantile)
+            self.assertAlmostEqual(sketches['run', 'delivery_minutes'].percentiles(0)[f'p{quantile}'], expected,
+                                   delta=expected * tolerance + 1)
+
+        # Merging two halves' sketches estimates the whole as well
+        halves = [build_run_sketches({name: column[part] for name, column in columns.items()})
+                  for part in (slice(None, count // 2), slice(count // 2, None))]
+        merged = merge_runs(halves, 'run')['profit'].percentiles(0)
+        for quantile, tolerance in ((50, 0.01), (90, 0.01), (99, 0.025)):
+            expected = np.percentile(exact_profit, quantile)
+            self.assertAlmostEqual(merged[f'p{quantile}'], expected, delta=expected * tolerance)
+
+    def test_driver_sketches_follow_the_dispatching_driver(self):
+        # Driver 0 delivered the first three orders, driver 1 the last two
+        sketches = build_run_sketches(self.columns([10, 20, 30, 200, 400], [0, 0, 0, 1, 1]))
+        self.assertEqual(sketches['driver', 'delivery_minutes'].percentiles(0)['p50'], 20.0)
+        self.assertEqual(sketches['driver', 'delivery_minutes'].percentiles(1)['p50'], 300.0)
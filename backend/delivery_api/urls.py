@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from django.conf import settings
+from django.views.decorators.csrf import csrf_exempt
 from .views import (
     DriverViewSet, 
     RouteViewSet, 
@@ -8,9 +9,17 @@ from .views import (
     SimulationAPIView,
     LoginAPIView,
     SimulationRunViewSet,
+    RuleSetViewSet,
     HistoricalDataAPIView,
     DriverPerformanceAPIView,
-    RoutePerformanceAPIView
+    RoutePerformanceAPIView,
+    RunDiffAPIView,
+    RunPercentilesAPIView,
+    ScenarioAPIView,
+    ProjectedKPIAPIView,
+    HorizonSimulationAPIView,
+    FleetOptimizationAPIView,
+    AdmissionMetricsAPIView
 )
 
 router = DefaultRouter()
@@ -18,12 +27,41 @@ router.register(r'drivers', DriverViewSet)
 router.register(r'routes', RouteViewSet)
 router.register(r'orders', OrderViewSet)
 router.register(r'simulation-runs', SimulationRunViewSet)
+router.register(r'rule-sets', RuleSetViewSet)
 
-urlpatterns = [
+if settings.ASYNC_VIEWS:
+    # ASGI deployments serve the read-heavy endpoints from async views so a
+    # slow analytics query doesn't pin a worker thread (see async_views.py)
+    from .async_views import (
+        AsyncHistoricalDataView,
+        AsyncDriverPerformanceView,
+        AsyncRoutePerformanceView,
+        AsyncSimulationRunListView
+    )
+    historical_data_view = AsyncHistoricalDataView.as_view()
+    driver_performance_view = AsyncDriverPerformanceView.as_view()
+    route_performance_view = AsyncRoutePerformanceView.as_view()
+    read_patterns = [
+        path('simulation-runs/', csrf_exempt(AsyncSimulationRunListView.as_view()), name='simulationrun-list'),
+    ]
+else:
+    historical_data_view = HistoricalDataAPIView.as_view()
+    driver_performance_view = DriverPerformanceAPIView.as_view()
+    route_performance_view = RoutePerformanceAPIView.as_view()
+    read_patterns = []
+
+urlpatterns = read_patterns + [
     path('', include(router.urls)),
     path('simulate/', SimulationAPIView.as_view(), name='simulate'),
+    path('simulate/horizon/', HorizonSimulationAPIView.as_view(), name='simulate-horizon'),
+    path('simulate/optimize/', FleetOptimizationAPIView.as_view(), name='simulate-optimize'),
     path('login/', LoginAPIView.as_view(), name='login'),
-    path('analytics/historical-data/', HistoricalDataAPIView.as_view(), name='historical-data'),
-    path('analytics/driver-performance/', DriverPerformanceAPIView.as_view(), name='driver-performance'),
-    path('analytics/route-performance/', RoutePerformanceAPIView.as_view(), name='route-performance'),
+    path('analytics/historical-data/', historical_data_view, name='historical-data'),
+    path('analytics/driver-performance/', driver_performance_view, name='driver-performance'),
+    path('analytics/route-performance/', route_performance_view, name='route-performance'),
+    path('analytics/run-diff/', RunDiffAPIView.as_view(), name='run-diff'),
+    path('analytics/percentiles/', RunPercentilesAPIView.as_view(), name='run-percentiles'),
+    path('analytics/projected-kpis/', ProjectedKPIAPIView.as_view(), name='projected-kpis'),
+    path('scenarios/', ScenarioAPIView.as_view(), name='scenarios'),
+    path('metrics/admission/', AdmissionMetricsAPIView.as_view(), name='admission-metrics'),
 ]
\ No newline at end of file
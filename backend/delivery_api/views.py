@@ -1,7 +1,8 @@
-from rest_framework import viewsets, status, permissions
+from rest_framework import viewsets, status, permissions, mixins
+from rest_framework.decorators import action
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.exceptions import ValidationError, ParseError, NotFound
 from rest_framework.authentication import TokenAuthentication
 from django.utils import timezone
@@ -11,49 +12,206 @@ from django.conf import settings
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional, Union
 from decimal import Decimal
+from itertools import repeat
 import logging
+import time
+import uuid
+import numpy as np
 from django.views.generic import TemplateView
 from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from .models import Driver, Route, Order, SimulationRun
+from .models import Change, Driver, Route, Order, SimulationRun, OrderOutcome, RuleSet
+from .rules import activate_rule_set, from_units, get_active_rule_set, get_plan
+from .simulation import DatasetSnapshot, get_snapshot, summarize
+from .route_stats import route_kpis
+from .horizon import simulate_horizon
+from .optimizer import get_evaluator, search
+from .sharding import evaluate_shards
+from .run_diff import diff_runs
+from . import change_feed, outcome_store, sketches
+from .locking import advisory_lock
+from .idempotency import IdempotencyMixin
+from .admission import AdmissionMixin, admission_stats
 from .serializers import (
     DriverSerializer, 
     RouteSerializer, 
     OrderSerializer, 
     SimulationResultSerializer,
     SimulationRunSerializer,
+    RuleSetSerializer,
+    ScenarioSerializer,
+    HorizonSerializer,
+    FleetOptimizationSerializer,
     DriverPerformanceSerializer,
-    RoutePerformanceSerializer
+    RoutePerformanceSerializer,
+    get_row_builder
 )
 
 logger = logging.getLogger(__name__)
 
-class DriverViewSet(viewsets.ModelViewSet):
+
+class FastListMixin:
+    """Serve unpaginated list() responses through a compiled ValuesRowBuilder"""
+
+    def list(self, request, *args, **kwargs):
+        builder = get_row_builder(self.get_serializer_class())
+        if builder is None or self.paginator is not None:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(builder.build_rows(queryset))
+
+
+class DepotFilterMixin:
+    """Limit the queryset to one depot with ``?depot=`` (an indexed column)"""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        depot = self.request.query_params.get('depot')
+        return queryset.filter(depot=depot) if depot else queryset
+
+
+class ChangeFeedMixin:
+    """
+    Change feed on list() (see change_feed.py). Every list carries the
+    version it was read at in the Change-Version header; ``?since=<version>``
+    returns ``{'version', 'results', 'deleted'}`` with only the rows written
+    and the ids deleted after that version. With ``?depot=``, rows moved out
+    of the depot count as deleted.
+    """
+    # Foreign keys nested in the serializer output: their writes change these rows too
+    change_feed_related = ()
+
+    def list(self, request, *args, **kwargs):
+        # Read before the rows, so a write committed meanwhile is sent again rather than missed
+        version, pruned_through = change_feed.feed_state()
+        since = request.query_params.get('since')
+        if since is None:
+            response = super().list(request, *args, **kwargs)
+        else:
+            try:
+                since = int(since)
+                if since < 0:
+                    raise ValueError(since)
+            except ValueError:
+                return Response(
+                    {'error': 'Invalid since. Please provide the version of an earlier list response.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if since < pruned_through:
+                return Response(
+                    {'error': 'Deletes since this version are no longer kept. Please fetch the full list.'},
+                    status=status.HTTP_410_GONE
+                )
+            queryset = change_feed.changed_since(
+                self.filter_queryset(self.get_queryset()), since, self.change_feed_related
+            )
+            builder = get_row_builder(self.get_serializer_class())
+            rows = builder.build_rows(queryset) if builder is not None else self.get_serializer(queryset, many=True).data
+            response = Response({
+                'version': version,
+                'results': rows,
+                'deleted': change_feed.deleted_since(
+                    queryset.model, since, request.query_params.get('depot') or None
+                ),
+            })
+        response[change_feed.VERSION_HEADER] = str(version)
+        return response
+
+
+class DriverViewSet(IdempotencyMixin, DepotFilterMixin, ChangeFeedMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Driver.objects.all()
     serializer_class = DriverSerializer
 
-class RouteViewSet(viewsets.ModelViewSet):
+class RouteViewSet(IdempotencyMixin, DepotFilterMixin, ChangeFeedMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Route.objects.all()
     serializer_class = RouteSerializer
 
-class OrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.all()
+class OrderViewSet(IdempotencyMixin, DepotFilterMixin, ChangeFeedMixin, FastListMixin, viewsets.ModelViewSet):
+    queryset = Order.objects.select_related('assigned_route')
     serializer_class = OrderSerializer
+    change_feed_related = ('assigned_route',)
+
+
+def resolve_rule_set(version) -> tuple:
+    """(rule_set, None) for the requested or active version, else (None, error response)"""
+    try:
+        if version in (None, ''):
+            rule_set = get_active_rule_set()
+            if rule_set is None:
+                return None, Response(
+                    {'error': 'No active rule set. Activate one under /api/rule-sets/.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            return rule_set, None
+        return RuleSet.objects.get(version=int(version)), None
+    except (ValueError, TypeError):
+        return None, Response(
+            {'error': 'Invalid rule_set_version. Please provide a valid integer.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except RuleSet.DoesNotExist:
+        return None, Response(
+            {'error': 'Rule set not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
 
 
-class SimulationAPIView(APIView):
+class RuleSetViewSet(IdempotencyMixin, FastListMixin, mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                     mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    Versioned simulation rules. Versions can't be edited or deleted; POST
+    creates the next version from the active one plus the fields given, and
+    activates it when ``is_active`` is true.
+    """
+    queryset = RuleSet.objects.all()
+    serializer_class = RuleSetSerializer
+    permission_classes = [IsAuthenticated]
+
+    def perform_create(self, serializer):
+        activate = serializer.validated_data.pop('is_active', False)
+        with transaction.atomic():
+            rule_set = serializer.save(created_by=self.request.user)
+            if activate:
+                activate_rule_set(rule_set)
+
+    @action(detail=True, methods=['post'])
+    def activate(self, request, pk=None):
+        """Switch simulations to this version (also used to roll back)"""
+        rule_set = self.get_object()
+        activate_rule_set(rule_set)
+        return Response(self.get_serializer(rule_set).data)
+
+
+class SimulationAPIView(AdmissionMixin, IdempotencyMixin, APIView):
     # Use IsAuthenticated to ensure only logged-in users can run simulations
     permission_classes = [IsAuthenticated]
+    # Identical simulate requests in flight share one run, with or without a key
+    idempotency_single_flight = True
+    admission_class = 'simulation'
+
+    # Order columns holding the latest published simulation result
+    RESULT_FIELDS = [
+        'fuel_cost', 'penalty', 'is_late', 'delivery_timestamp',
+        'bonus', 'profit', 'simulation_run_at'
+    ]
+    # Order IDs quoted in the warning about orders without a route
+    UNROUTED_EXAMPLES = 5
 
-    @transaction.atomic
     def post(self, request, *args, **kwargs):
         # 1. Data Validation [cite: 82]
         try:
             num_drivers = int(request.data.get('num_drivers'))
             start_time_str = request.data.get('start_time')
             max_hours_per_day = int(request.data.get('max_hours_per_day'))
+            mode = request.data.get('mode', SimulationRun.MODE_BATCH)
+            depot = request.data.get('depot') or None
 
+            if mode not in dict(SimulationRun.MODE_CHOICES):
+                return Response(
+                    {'error': f"Invalid mode. Use one of: {', '.join(dict(SimulationRun.MODE_CHOICES))}."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             if num_drivers <= 0 or max_hours_per_day <= 0:
                 return Response(
                     {'error': 'Invalid parameters. num_drivers and max_hours_per_day must be positive integers.'},
@@ -65,20 +223,30 @@ class SimulationAPIView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # 2. Get data
-        all_routes = Route.objects.all()
-        all_orders = list(Order.objects.all())
+        # Company rules: the requested version, or the active one
+        rule_set, error_response = resolve_rule_set(request.data.get('rule_set_version'))
+        if error_response is not None:
+            return error_response
+        plan = get_plan(rule_set)
 
-        total_profit = Decimal('0')
-        on_time_deliveries = 0
-        total_deliveries = len(all_orders)
-        total_fuel_cost = Decimal('0')
+        # 2. Get data as columns. Always a fresh snapshot: the results are
+        # published back onto these Order rows. A run limited to one depot
+        # reads only that depot's rows.
+        snapshot = DatasetSnapshot.load(depot=depot)
+        if depot is not None and depot not in snapshot.depots:
+            return Response(
+                {'error': 'Depot not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        outcomes = []
+        processed_orders = []
 
         # Create a timestamp for this simulation run 
         simulation_timestamp = timezone.now()
         
-        # Generate unique run ID
-        run_id = f"SIM_{simulation_timestamp.strftime('%Y%m%d_%H%M%S')}"
+        # Generate unique run ID; the random suffix keeps runs started in the
+        # same second from colliding
+        run_id = f"SIM_{simulation_timestamp.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
 
         try:
             # Parse the datetime string
@@ -102,106 +270,145 @@ class SimulationAPIView(APIView):
                 )
                 
             # 3. Apply company rules & calculate KPIs [cite: 89]
-            logger.info(f"Processing {len(all_orders)} orders with start_time: {start_time}")
-            for order in all_orders:
-                route = order.assigned_route
-                if not route:
-                    logger.warning(f"Order {order.order_id} has no assigned route, skipping")
-                    continue
-
-                # a. Calculate Fuel Cost [cite: 94]
-                fuel_cost_per_km = Decimal('5')
-                if route.traffic_level.lower() == 'high':
-                    fuel_cost_per_km += Decimal('2')
-                
-                order.fuel_cost = route.distance_km * fuel_cost_per_km
-                total_fuel_cost += order.fuel_cost
+            started = time.perf_counter()
+            # Each depot is simulated on its own and the results merged
+            evaluation, shard_kpis = evaluate_shards(
+                snapshot, plan,
+                events=mode == SimulationRun.MODE_EVENT,
+                num_drivers=num_drivers,
+                shift_minutes=max_hours_per_day * 60,
+                start_minute=start_time.hour * 60 + start_time.minute + start_time.second / 60
+            )
+            unrouted = ~evaluation.assigned
+            if evaluation.undelivered is not None:
+                unrouted &= ~evaluation.undelivered
+                undelivered_orders = int(evaluation.undelivered.sum())
+                if undelivered_orders:
+                    logger.warning("%d orders could not be delivered by %d drivers within %d hours",
+                                   undelivered_orders, num_drivers, max_hours_per_day)
+            # One record for the run, not one per order
+            unrouted_orders = int(unrouted.sum())
+            if unrouted_orders and logger.isEnabledFor(logging.WARNING):
+                examples = [snapshot.order_codes[i] for i in np.flatnonzero(unrouted)[:self.UNROUTED_EXAMPLES].tolist()]
+                logger.warning("%d orders have no assigned route, skipping (%s%s)", unrouted_orders,
+                               ', '.join(examples), ', ...' if unrouted_orders > len(examples) else '')
 
-                # b. Late Delivery Penalty & On-time check [cite: 91]
-                is_late = False
-                base_time_seconds = route.base_time * 60
-                
-                # Calculate actual delivery time based on traffic and distance
-                traffic_multiplier = 1.0
-                if route.traffic_level.lower() == 'high':
-                    traffic_multiplier = 1.5
-                elif route.traffic_level.lower() == 'medium':
-                    traffic_multiplier = 1.2
-                
-                delivery_time_seconds = base_time_seconds * traffic_multiplier
-                
-                if delivery_time_seconds > (base_time_seconds + 600): # 600 seconds = 10 minutes
-                    is_late = True
-                    order.penalty = Decimal('50')
-                else:
-                    order.penalty = Decimal('0')
-
-                if not is_late:
-                    on_time_deliveries += 1
-                order.is_late = is_late
-
-                # Calculate actual delivery timestamp
-                try:
-                    delivery_minutes = delivery_time_seconds // 60
-                    order.delivery_timestamp = start_time + timedelta(minutes=delivery_minutes)
-                    logger.debug(f"Order {order.order_id}: delivery_timestamp = {order.delivery_timestamp}")
-                except Exception as ts_error:
-                    logger.error(f"Error calculating delivery timestamp for order {order.order_id}: {ts_error}")
-                    order.delivery_timestamp = start_time + timedelta(minutes=30)  # Default 30 minutes
-
-                # c. High-Value Bonus [cite: 93]
-                order.bonus = 0
-                if order.value_rs > 1000 and not is_late:
-                    order.bonus = order.value_rs * Decimal('0.10')
-
-                # d. Overall Profit [cite: 98]
-                order.profit = order.value_rs + order.bonus - order.penalty - order.fuel_cost
-                total_profit += order.profit
-
-                # Save the results of this simulation run 
-                try:
-                    order.simulation_run_at = simulation_timestamp
-                    order.save()
-                    logger.debug(f"Successfully saved order {order.order_id}")
-                except Exception as save_error:
-                    logger.error(f"Error saving order {order.order_id}: {save_error}")
-                    # Continue with other orders even if one fails
+            # Orders share few distinct delivery times (one per route in
+            # batch mode); build each timestamp once
+            results = evaluation.results
+            delivery_minutes, timestamp_index = np.unique(results['delivery_minutes'], return_inverse=True)
+            delivery_timestamps = [start_time + timedelta(minutes=minutes) for minutes in delivery_minutes.tolist()]
+            # Batch mode doesn't dispatch: the outcome store spreads its
+            # orders over the drivers round robin
+            drivers = evaluation.driver
+            columns = zip(
+                snapshot.order_ids[evaluation.assigned].tolist(),
+                snapshot.order_route_ids[evaluation.assigned].tolist(),
+                timestamp_index.tolist(),
+                results['is_late'].tolist(),
+                results['delivery_minutes'].tolist(),
+                results['fuel_cost'].tolist(),
+                results['penalty'].tolist(),
+                results['bonus'].tolist(),
+                results['profit'].tolist(),
+                drivers.tolist() if drivers is not None else repeat(None),
+            )
+            for order_pk, route_pk, index, is_late, delivery_minutes, fuel_cost, penalty, bonus, profit, driver in columns:
+                fuel_cost = from_units(fuel_cost)
+                penalty = from_units(penalty)
+                bonus = from_units(bonus)
+                profit = from_units(profit)
+                outcomes.append(OrderOutcome(
+                    order_id=order_pk,
+                    route_id=route_pk,
+                    is_late=is_late,
+                    delivery_minutes=int(delivery_minutes),
+                    fuel_cost=fuel_cost,
+                    penalty=penalty,
+                    bonus=bonus,
+                    profit=profit,
+                    driver=driver
+                ))
+                processed_orders.append(Order(
+                    id=order_pk,
+                    fuel_cost=fuel_cost,
+                    penalty=penalty,
+                    is_late=is_late,
+                    delivery_timestamp=delivery_timestamps[index],
+                    bonus=bonus,
+                    profit=profit,
+                    simulation_run_at=simulation_timestamp
+                ))
 
             # 4. Calculate final KPIs
-            late_deliveries = total_deliveries - on_time_deliveries
-            efficiency_score = (on_time_deliveries / total_deliveries) * 100 if total_deliveries > 0 else 0
-            
-            # Calculate additional metrics
-            high_value_orders = Order.objects.filter(
-                simulation_run_at=simulation_timestamp,
-                value_rs__gt=1000
-            ).count()
+            kpis = summarize(evaluation, snapshot.total_orders)
+            total_profit = kpis['total_profit']
+            efficiency_score = kpis['efficiency_score']
+            on_time_deliveries = kpis['on_time_deliveries']
+            late_deliveries = kpis['late_deliveries']
+            total_fuel_cost = kpis['total_fuel_cost']
             
-            # Calculate average delivery time
-            delivery_times = []
-            for order in Order.objects.filter(simulation_run_at=simulation_timestamp):
-                if order.delivery_timestamp and order.assigned_route:
-                    delivery_time = (order.delivery_timestamp - start_time).total_seconds() / 60  # in minutes
-                    delivery_times.append(delivery_time)
-            
-            avg_delivery_time = sum(delivery_times) / len(delivery_times) if delivery_times else 0
-            
-            # 5. Save simulation run data
-            simulation_run = SimulationRun.objects.create(
-                run_id=run_id,
-                num_drivers=num_drivers,
-                start_time=start_time,
-                max_hours_per_day=max_hours_per_day,
-                total_profit=total_profit,
-                efficiency_score=efficiency_score,
-                on_time_deliveries=on_time_deliveries,
-                late_deliveries=late_deliveries,
-                total_fuel_cost=total_fuel_cost,
-                total_orders=total_deliveries,
-                avg_delivery_time=avg_delivery_time,
-                high_value_orders=high_value_orders
-            )
+            # 5. Save simulation run data. Everything above ran outside any
+            # transaction; the writes below are short and scoped to this run,
+            # so concurrent simulations don't block each other. The change
+            # feed version is taken only as the commit's last statement.
+            with Change.scope() as change:
+                simulation_run = SimulationRun.objects.create(
+                    run_id=run_id,
+                    num_drivers=num_drivers,
+                    start_time=start_time,
+                    max_hours_per_day=max_hours_per_day,
+                    total_profit=total_profit,
+                    efficiency_score=efficiency_score,
+                    on_time_deliveries=on_time_deliveries,
+                    late_deliveries=late_deliveries,
+                    total_fuel_cost=total_fuel_cost,
+                    total_orders=kpis['total_orders'],
+                    avg_delivery_time=kpis['avg_delivery_time'],
+                    high_value_orders=kpis['high_value_orders'],
+                    rule_set=rule_set,
+                    mode=mode,
+                    depot=depot or ''
+                )
+
+                # Keep this run's per-order outcomes for run-to-run comparison
+                for outcome in outcomes:
+                    outcome.simulation_run = simulation_run
+                OrderOutcome.objects.bulk_create(outcomes, batch_size=1000)
+
+                # The Order rows are shared by every run: publish this run's
+                # results onto them under a lock, unless a run that started
+                # later has already published its own
+                with advisory_lock('simulation-publish'):
+                    published = Order.objects.filter(simulation_run_at__gt=simulation_timestamp)
+                    if depot is not None:
+                        published = published.filter(depot=depot)
+                    if not published.exists():
+                        # bulk_update() doesn't save(): stamp the change here
+                        for order in processed_orders:
+                            order.sync_version = change
+                        Order.objects.bulk_update(processed_orders, self.RESULT_FIELDS + ['sync_version'],
+                                                  batch_size=1000)
+
+                # Columnar copy of the outcomes that analytics and run diffs
+                # memory-map, written once the run is committed
+                outcome_columns = {
+                    'order': snapshot.order_ids[evaluation.assigned],
+                    'route': snapshot.order_route_ids[evaluation.assigned],
+                    'profit': outcome_store.units_to_cents(results['profit']),
+                    'fuel_cost': outcome_store.units_to_cents(results['fuel_cost']),
+                    'is_late': results['is_late'],
+                    'delivery_minutes': results['delivery_minutes'],
+                    'driver': drivers if drivers is not None
+                    else outcome_store.round_robin_drivers(int(evaluation.assigned.sum()), num_drivers),
+                }
+                transaction.on_commit(lambda: outcome_store.write_quietly(simulation_run, outcome_columns))
+                transaction.on_commit(lambda: sketches.write_quietly(simulation_run, outcome_columns))
             
+            logger.info("Simulation %s: %d orders (%d on time, %d late, %d without a route) with rule set v%d "
+                        "in %s mode, %.0f ms", run_id, snapshot.total_orders, on_time_deliveries, late_deliveries,
+                        unrouted_orders, rule_set.version, mode, (time.perf_counter() - started) * 1000)
+
             # 6. Return results [cite: 81]
             results = {
                 'total_profit': total_profit,
@@ -209,8 +416,18 @@ class SimulationAPIView(APIView):
                 'on_time_deliveries': on_time_deliveries,
                 'late_deliveries': late_deliveries,
                 'fuel_cost_breakdown': total_fuel_cost, # This will be used for the chart [cite: 41]
-                'run_id': run_id
+                'run_id': run_id,
+                'rule_set_version': rule_set.version,
+                'mode': mode
             }
+            if evaluation.undelivered is not None:
+                results['undelivered_orders'] = undelivered_orders
+            if depot is not None:
+                results['depot'] = depot
+            if shard_kpis:
+                results['shards'] = {
+                    shard: ScenarioAPIView.kpi_data(kpis) for shard, kpis in shard_kpis.items()
+                }
             return Response(results, status=status.HTTP_200_OK)
         except Exception as e:
             logger.error(f"Simulation error: {str(e)}", exc_info=True)
@@ -248,38 +465,191 @@ class LoginAPIView(APIView):
                 status=status.HTTP_401_UNAUTHORIZED
             )
 
-class SimulationRunViewSet(viewsets.ModelViewSet):
+class SimulationRunViewSet(IdempotencyMixin, DepotFilterMixin, ChangeFeedMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = SimulationRun.objects.all().order_by('-timestamp')
     serializer_class = SimulationRunSerializer
     permission_classes = [IsAuthenticated]
 
-class HistoricalDataAPIView(APIView):
+def historical_trend_data(runs) -> List[Dict[str, Any]]:
+    """Shape simulation runs into the rows used by the dashboard trend charts"""
+    trend_data = []
+    for run in runs:
+        trend_data.append({
+            'timestamp': run.timestamp.isoformat(),
+            'run_id': run.run_id,
+            'total_profit': float(run.total_profit),
+            'efficiency_score': float(run.efficiency_score),
+            'on_time_deliveries': run.on_time_deliveries,
+            'late_deliveries': run.late_deliveries,
+            'total_fuel_cost': float(run.total_fuel_cost),
+            'total_orders': run.total_orders,
+            'avg_delivery_time': float(run.avg_delivery_time) if run.avg_delivery_time else 0,
+            'high_value_orders': run.high_value_orders
+        })
+    return trend_data
+
+
+def driver_performance_rows(simulation_run: SimulationRun) -> List[tuple]:
+    """(is_late, profit, delivery_minutes, route_id, driver) per outcome of the run, from the outcome store"""
+    columns = outcome_store.load(simulation_run)
+    live_routes = set(Route.objects.filter(id__in=np.unique(columns['route']).tolist()).values_list('id', flat=True))
+    return list(zip(
+        columns['is_late'].tolist(),
+        (columns['profit'] / 100).tolist(),
+        columns['delivery_minutes'].tolist(),
+        [route_id if route_id in live_routes else None for route_id in columns['route'].tolist()],
+        columns['driver'].tolist(),
+    ))
+
+
+def route_performance_rows(simulation_run: SimulationRun) -> List[tuple]:
+    """(is_late, profit, delivery_minutes, route code, distance_km, traffic_level, route pk) per outcome of the run"""
+    columns = outcome_store.load(simulation_run)
+    routes = {
+        route[0]: route[1:] for route in Route.objects.filter(
+            id__in=np.unique(columns['route']).tolist()
+        ).values_list('id', 'route_id', 'distance_km', 'traffic_level')
+    }
+    missing = (None, None, None)
+    return [
+        (is_late, profit, delivery_minutes, *routes.get(route_id, missing), route_id)
+        for is_late, profit, delivery_minutes, route_id in zip(
+            columns['is_late'].tolist(),
+            (columns['profit'] / 100).tolist(),
+            columns['delivery_minutes'].tolist(),
+            columns['route'].tolist(),
+        )
+    ]
+
+
+def driver_performance_data(rows, simulation_run: SimulationRun,
+                            run_sketches: sketches.RunSketches) -> List[Dict[str, Any]]:
+    """Group a run's outcome rows (driver_performance_rows()) by the driver that delivered them"""
+    driver_performance = {}
+
+    for is_late, profit, delivery_minutes, route_id, driver in rows:
+        driver_name = f"Driver {driver + 1}"
+
+        data = driver_performance.get(driver_name)
+        if data is None:
+            data = driver_performance[driver_name] = {
+                'driver_name': driver_name,
+                'total_orders': 0,
+                'on_time_orders': 0,
+                'late_orders': 0,
+                'total_profit': 0,
+                'driver_index': driver,
+                'delivery_time_sum': 0.0,
+                'delivery_count': 0
+            }
+
+        data['total_orders'] += 1
+        if is_late:
+            data['late_orders'] += 1
+        else:
+            data['on_time_orders'] += 1
+
+        data['total_profit'] += float(profit)
+
+        if delivery_minutes is not None and route_id:
+            data['delivery_time_sum'] += float(delivery_minutes)
+            data['delivery_count'] += 1
+
+    # Calculate efficiency scores and average delivery times
+    driver_data = []
+    for driver_name, data in sorted(driver_performance.items(), key=lambda item: item[1]['driver_index']):
+        efficiency_score = (data['on_time_orders'] / data['total_orders']) * 100 if data['total_orders'] > 0 else 0
+        avg_delivery_time = data['delivery_time_sum'] / data['delivery_count'] if data['delivery_count'] else 0
+
+        driver_data.append({
+            'driver_name': driver_name,
+            'total_orders': data['total_orders'],
+            'on_time_orders': data['on_time_orders'],
+            'late_orders': data['late_orders'],
+            'efficiency_score': round(efficiency_score, 2),
+            'total_profit': round(data['total_profit'], 2),
+            'avg_delivery_time': round(avg_delivery_time, 2),
+            'delivery_time_percentiles': run_sketches['driver', 'delivery_minutes'].percentiles(data['driver_index']),
+            'profit_percentiles': run_sketches['driver', 'profit'].percentiles(data['driver_index'])
+        })
+    return driver_data
+
+
+def route_performance_data(rows, simulation_run: SimulationRun,
+                           run_sketches: sketches.RunSketches) -> List[Dict[str, Any]]:
+    """Group a run's outcome rows (route_performance_rows()) by route"""
+    route_performance = {}
+
+    for is_late, profit, delivery_minutes, route_id, distance_km, traffic_level, route_pk in rows:
+        if route_id is None:
+            continue
+
+        data = route_performance.get(route_id)
+        if data is None:
+            data = route_performance[route_id] = {
+                'route_id': route_id,
+                'total_orders': 0,
+                'on_time_orders': 0,
+                'late_orders': 0,
+                'total_profit': 0,
+                'route_pk': route_pk,
+                'delivery_time_sum': 0.0,
+                'delivery_count': 0,
+                'distance_km': float(distance_km),
+                'traffic_level': traffic_level
+            }
+
+        data['total_orders'] += 1
+        if is_late:
+            data['late_orders'] += 1
+        else:
+            data['on_time_orders'] += 1
+
+        data['total_profit'] += float(profit)
+
+        if delivery_minutes is not None:
+            data['delivery_time_sum'] += float(delivery_minutes)
+            data['delivery_count'] += 1
+
+    # Calculate efficiency scores and average delivery times
+    route_data = []
+    for route_id, data in route_performance.items():
+        efficiency_score = (data['on_time_orders'] / data['total_orders']) * 100 if data['total_orders'] > 0 else 0
+        avg_delivery_time = data['delivery_time_sum'] / data['delivery_count'] if data['delivery_count'] else 0
+
+        route_data.append({
+            'route_id': route_id,
+            'total_orders': data['total_orders'],
+            'on_time_orders': data['on_time_orders'],
+            'late_orders': data['late_orders'],
+            'efficiency_score': round(efficiency_score, 2),
+            'total_profit': round(data['total_profit'], 2),
+            'avg_delivery_time': round(avg_delivery_time, 2),
+            'distance_km': data['distance_km'],
+            'traffic_level': data['traffic_level'],
+            'delivery_time_percentiles': run_sketches['route', 'delivery_minutes'].percentiles(data['route_pk']),
+            'profit_percentiles': run_sketches['route', 'profit'].percentiles(data['route_pk'])
+        })
+    return route_data
+
+
+class HistoricalDataAPIView(AdmissionMixin, APIView):
     permission_classes = [IsAuthenticated]
+    admission_class = 'analytics'
     
     def get(self, request, *args, **kwargs):
         """Get historical simulation data for trend charts"""
         try:
-            # Get last 10 simulation runs for trend analysis
-            runs = SimulationRun.objects.all().order_by('-timestamp')[:10]
-            
-            trend_data = []
-            for run in runs:
-                trend_data.append({
-                    'timestamp': run.timestamp.isoformat(),
-                    'run_id': run.run_id,
-                    'total_profit': float(run.total_profit),
-                    'efficiency_score': float(run.efficiency_score),
-                    'on_time_deliveries': run.on_time_deliveries,
-                    'late_deliveries': run.late_deliveries,
-                    'total_fuel_cost': float(run.total_fuel_cost),
-                    'total_orders': run.total_orders,
-                    'avg_delivery_time': float(run.avg_delivery_time) if run.avg_delivery_time else 0,
-                    'high_value_orders': run.high_value_orders
-                })
-            
+            # Get last 10 simulation runs for trend analysis, of one depot
+            # with ?depot=
+            runs = SimulationRun.objects.all()
+            depot = request.query_params.get('depot')
+            if depot:
+                runs = runs.filter(depot=depot)
+
             return Response({
-                'trend_data': trend_data,
-                'total_runs': SimulationRun.objects.count()
+                'trend_data': historical_trend_data(runs.order_by('-timestamp')[:10]),
+                'total_runs': runs.count()
             }, status=status.HTTP_200_OK)
             
         except Exception as e:
@@ -289,8 +659,9 @@ class HistoricalDataAPIView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-class DriverPerformanceAPIView(APIView):
+class DriverPerformanceAPIView(AdmissionMixin, APIView):
     permission_classes = [IsAuthenticated]
+    admission_class = 'analytics'
     
     def get(self, request, *args, **kwargs):
         """Get driver performance breakdown for drill-down analysis"""
@@ -311,56 +682,12 @@ class DriverPerformanceAPIView(APIView):
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            # Get orders for this simulation run
-            orders = Order.objects.filter(simulation_run_at=simulation_run.timestamp)
-            
-            # Group by driver (we'll simulate driver assignment for now)
-            driver_performance = {}
-            
-            for i, order in enumerate(orders):
-                # Simulate driver assignment based on order index
-                driver_name = f"Driver {(i % simulation_run.num_drivers) + 1}"
-                
-                if driver_name not in driver_performance:
-                    driver_performance[driver_name] = {
-                        'driver_name': driver_name,
-                        'total_orders': 0,
-                        'on_time_orders': 0,
-                        'late_orders': 0,
-                        'total_profit': 0,
-                        'delivery_times': []
-                    }
-                
-                driver_performance[driver_name]['total_orders'] += 1
-                if order.is_late:
-                    driver_performance[driver_name]['late_orders'] += 1
-                else:
-                    driver_performance[driver_name]['on_time_orders'] += 1
-                
-                driver_performance[driver_name]['total_profit'] += float(order.profit)
-                
-                if order.delivery_timestamp and order.assigned_route:
-                    delivery_time = (order.delivery_timestamp - simulation_run.start_time).total_seconds() / 60
-                    driver_performance[driver_name]['delivery_times'].append(delivery_time)
-            
-            # Calculate efficiency scores and average delivery times
-            driver_data = []
-            for driver_name, data in driver_performance.items():
-                efficiency_score = (data['on_time_orders'] / data['total_orders']) * 100 if data['total_orders'] > 0 else 0
-                avg_delivery_time = sum(data['delivery_times']) / len(data['delivery_times']) if data['delivery_times'] else 0
-                
-                driver_data.append({
-                    'driver_name': driver_name,
-                    'total_orders': data['total_orders'],
-                    'on_time_orders': data['on_time_orders'],
-                    'late_orders': data['late_orders'],
-                    'efficiency_score': round(efficiency_score, 2),
-                    'total_profit': round(data['total_profit'], 2),
-                    'avg_delivery_time': round(avg_delivery_time, 2)
-                })
-            
+            # Get this run's per-order outcomes
+            orders = driver_performance_rows(simulation_run)
+            run_sketches = sketches.load(simulation_run)
+
             return Response({
-                'driver_performance': driver_data,
+                'driver_performance': driver_performance_data(orders, simulation_run, run_sketches),
                 'simulation_run': SimulationRunSerializer(simulation_run).data
             }, status=status.HTTP_200_OK)
             
@@ -371,8 +698,9 @@ class DriverPerformanceAPIView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-class RoutePerformanceAPIView(APIView):
+class RoutePerformanceAPIView(AdmissionMixin, APIView):
     permission_classes = [IsAuthenticated]
+    admission_class = 'analytics'
     
     def get(self, request, *args, **kwargs):
         """Get route performance breakdown for drill-down analysis"""
@@ -393,62 +721,12 @@ class RoutePerformanceAPIView(APIView):
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            # Get orders for this simulation run
-            orders = Order.objects.filter(simulation_run_at=simulation_run.timestamp)
-            
-            # Group by route
-            route_performance = {}
-            
-            for order in orders:
-                if not order.assigned_route:
-                    continue
-                    
-                route_id = order.assigned_route.route_id
-                
-                if route_id not in route_performance:
-                    route_performance[route_id] = {
-                        'route_id': route_id,
-                        'total_orders': 0,
-                        'on_time_orders': 0,
-                        'late_orders': 0,
-                        'total_profit': 0,
-                        'delivery_times': [],
-                        'distance_km': float(order.assigned_route.distance_km),
-                        'traffic_level': order.assigned_route.traffic_level
-                    }
-                
-                route_performance[route_id]['total_orders'] += 1
-                if order.is_late:
-                    route_performance[route_id]['late_orders'] += 1
-                else:
-                    route_performance[route_id]['on_time_orders'] += 1
-                
-                route_performance[route_id]['total_profit'] += float(order.profit)
-                
-                if order.delivery_timestamp:
-                    delivery_time = (order.delivery_timestamp - simulation_run.start_time).total_seconds() / 60
-                    route_performance[route_id]['delivery_times'].append(delivery_time)
-            
-            # Calculate efficiency scores and average delivery times
-            route_data = []
-            for route_id, data in route_performance.items():
-                efficiency_score = (data['on_time_orders'] / data['total_orders']) * 100 if data['total_orders'] > 0 else 0
-                avg_delivery_time = sum(data['delivery_times']) / len(data['delivery_times']) if data['delivery_times'] else 0
-                
-                route_data.append({
-                    'route_id': route_id,
-                    'total_orders': data['total_orders'],
-                    'on_time_orders': data['on_time_orders'],
-                    'late_orders': data['late_orders'],
-                    'efficiency_score': round(efficiency_score, 2),
-                    'total_profit': round(data['total_profit'], 2),
-                    'avg_delivery_time': round(avg_delivery_time, 2),
-                    'distance_km': data['distance_km'],
-                    'traffic_level': data['traffic_level']
-                })
-            
+            # Get this run's per-order outcomes
+            orders = route_performance_rows(simulation_run)
+            run_sketches = sketches.load(simulation_run)
+
             return Response({
-                'route_performance': route_data,
+                'route_performance': route_performance_data(orders, simulation_run, run_sketches),
                 'simulation_run': SimulationRunSerializer(simulation_run).data
             }, status=status.HTTP_200_OK)
             
@@ -459,6 +737,381 @@ class RoutePerformanceAPIView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class RunDiffAPIView(AdmissionMixin, APIView):
+    permission_classes = [IsAuthenticated]
+    admission_class = 'analytics'
+
+    def get(self, request, *args, **kwargs):
+        """Compare two simulation runs: KPI deltas plus per-order and per-route changes"""
+        try:
+            base_run_id = request.query_params.get('base_run_id')
+            compare_run_id = request.query_params.get('compare_run_id')
+            if not base_run_id or not compare_run_id:
+                return Response(
+                    {'error': 'base_run_id and compare_run_id parameters are required'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            try:
+                limit = int(request.query_params.get('limit', 100))
+                if limit < 0:
+                    raise ValueError
+            except ValueError:
+                return Response(
+                    {'error': 'limit must be a non-negative integer'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            runs = SimulationRun.objects.in_bulk([base_run_id, compare_run_id], field_name='run_id')
+            if base_run_id not in runs or compare_run_id not in runs:
+                return Response(
+                    {'error': 'Simulation run not found'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            base_run, compare_run = runs[base_run_id], runs[compare_run_id]
+
+            for run in (base_run, compare_run):
+                if run.total_orders and not run.outcomes.exists():
+                    return Response(
+                        {'error': f'Simulation run {run.run_id} has no stored order outcomes to compare'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+
+            return Response({
+                'base_run': SimulationRunSerializer(base_run).data,
+                'compare_run': SimulationRunSerializer(compare_run).data,
+                **diff_runs(base_run, compare_run, limit)
+            }, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            logger.error(f"Error comparing simulation runs: {str(e)}")
+            return Response(
+                {'error': 'Failed to compare simulation runs'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+class RunPercentilesAPIView(AdmissionMixin, APIView):
+    """
+    Delivery time and profit percentiles over one or more runs, merged from
+    the runs' stored quantile sketches (see sketches.py): for the fleet
+    (group=run), per driver or per route.
+    """
+    permission_classes = [IsAuthenticated]
+    admission_class = 'analytics'
+    MAX_RUNS = 100
+    GROUPS = ('run', 'driver', 'route')
+
+    def get(self, request, *args, **kwargs):
+        try:
+            run_ids = [run_id for run_id in request.query_params.get('run_ids', '').split(',') if run_id]
+            if not run_ids:
+                return Response(
+                    {'error': 'run_ids parameter is required'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if len(run_ids) > self.MAX_RUNS:
+                return Response(
+                    {'error': f'At most {self.MAX_RUNS} run_ids can be merged'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            group = request.query_params.get('group', 'run')
+            if group not in self.GROUPS:
+                return Response(
+                    {'error': f"Invalid group. Use one of: {', '.join(self.GROUPS)}."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            runs = SimulationRun.objects.in_bulk(run_ids, field_name='run_id')
+            missing = [run_id for run_id in run_ids if run_id not in runs]
+            if missing:
+                return Response(
+                    {'error': f'Simulation run not found: {", ".join(missing)}'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+
+            merged = sketches.merge_runs([sketches.load(run) for run in runs.values()], group)
+            delivery, profit = merged['delivery_minutes'], merged['profit']
+            keys = np.union1d(delivery.keys, profit.keys).tolist()
+            if group == 'route':
+                codes = dict(Route.objects.filter(id__in=keys).values_list('id', 'route_id'))
+                labels = {key: {'route_id': codes.get(key)} for key in keys}
+            elif group == 'driver':
+                labels = {key: {'driver_name': f"Driver {key + 1}"} for key in keys}
+            else:
+                labels = {key: {} for key in keys}
+
+            return Response({
+                'run_ids': list(dict.fromkeys(run_ids)),
+                'group': group,
+                'percentiles': [
+                    {
+                        **labels[key],
+                        'total_orders': profit.count(key),
+                        'delivery_time': delivery.percentiles(key),
+                        'profit': profit.percentiles(key)
+                    }
+                    for key in keys
+                ]
+            }, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            logger.error(f"Error fetching run percentiles: {str(e)}")
+            return Response(
+                {'error': 'Failed to fetch run percentiles'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+class ScenarioAPIView(AdmissionMixin, APIView):
+    """
+    What-if KPIs: apply route/order/driver overrides to the shared in-memory
+    snapshot and evaluate the rules over it. Nothing is written.
+
+    Batch mode (the default) evaluates every order at the start time. Event
+    mode simulates one day of dispatch with each driver's fatigue and weekly
+    hours, like the first day of a horizon, and is the only mode that accepts
+    driver overrides.
+    """
+    permission_classes = [IsAuthenticated]
+    admission_class = 'analytics'
+
+    @staticmethod
+    def kpi_data(kpis: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            field: round(float(value), 2) if isinstance(value, (Decimal, float)) else value
+            for field, value in kpis.items()
+        }
+
+    @staticmethod
+    def event_kpis(snapshot: DatasetSnapshot, plan, params: Dict[str, Any]) -> Dict[str, Any]:
+        """KPIs of one simulated day, with the driver counts of a horizon day"""
+        day = simulate_horizon(
+            snapshot, plan,
+            num_drivers=params['num_drivers'],
+            days=1,
+            max_hours_per_day=params['max_hours_per_day'],
+            start_time=params['start_time'],
+        )['daily'][0]
+        return {field: value for field, value in day.items() if field not in ('day', 'date')}
+
+    def post(self, request, *args, **kwargs):
+        serializer = ScenarioSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        overrides = serializer.validated_data
+
+        rule_set, error_response = resolve_rule_set(overrides.get('rule_set_version'))
+        if error_response is not None:
+            return error_response
+
+        try:
+            plan = get_plan(rule_set)
+            snapshot = get_snapshot()
+            try:
+                scenario = snapshot.with_overrides(
+                    routes=overrides['routes'], orders=overrides['orders'], drivers=overrides['drivers']
+                )
+            except KeyError as e:
+                return Response({'error': e.args[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+            if overrides['mode'] == SimulationRun.MODE_EVENT:
+                kpis = self.kpi_data(self.event_kpis(scenario, plan, overrides))
+                baseline = self.kpi_data(self.event_kpis(snapshot, plan, overrides))
+            else:
+                kpis = self.kpi_data(summarize(scenario.evaluate(plan), scenario.total_orders))
+                baseline = self.kpi_data(snapshot.baseline(plan))
+            return Response({
+                'rule_set_version': rule_set.version,
+                'mode': overrides['mode'],
+                'snapshot_loaded_at': snapshot.loaded_at,
+                'overrides': {name: len(overrides[name]) for name in ('routes', 'orders', 'drivers')},
+                'kpis': kpis,
+                'baseline': baseline,
+                'kpi_deltas': {field: round(kpis[field] - baseline[field], 2) for field in kpis},
+            })
+
+        except Exception as e:
+            logger.error(f"Scenario error: {str(e)}", exc_info=True)
+            return Response(
+                {'error': 'Failed to evaluate scenario'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class HorizonSimulationAPIView(AdmissionMixin, APIView):
+    """
+    Simulate consecutive days in event mode, carrying each driver's hours
+    forward in a rolling 7-day fatigue window. Each depot is simulated with
+    its own drivers, or only ``depot`` when given. Returns daily KPIs;
+    nothing is written.
+    """
+    permission_classes = [IsAuthenticated]
+    admission_class = 'simulation'
+
+    def post(self, request, *args, **kwargs):
+        serializer = HorizonSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        rule_set, error_response = resolve_rule_set(params.get('rule_set_version'))
+        if error_response is not None:
+            return error_response
+
+        try:
+            snapshot = get_snapshot()
+            depot = params.get('depot') or None
+            if depot is not None and depot not in snapshot.depots:
+                return Response(
+                    {'error': 'Depot not found'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            horizon = simulate_horizon(
+                snapshot.shard(depot) if depot is not None else snapshot, get_plan(rule_set),
+                num_drivers=params['num_drivers'],
+                days=params['days'],
+                max_hours_per_day=params['max_hours_per_day'],
+                start_time=params['start_time'],
+            )
+            results = {
+                'rule_set_version': rule_set.version,
+                'days': params['days'],
+                'daily': [ScenarioAPIView.kpi_data(day) for day in horizon['daily']],
+                'totals': ScenarioAPIView.kpi_data(horizon['totals']),
+                'drivers': horizon['drivers'],
+            }
+            if depot is not None:
+                results['depot'] = depot
+            return Response(results)
+
+        except Exception as e:
+            logger.error(f"Horizon simulation error: {str(e)}", exc_info=True)
+            return Response(
+                {'error': 'Failed to simulate the horizon'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class FleetOptimizationAPIView(AdmissionMixin, APIView):
+    """
+    Search for the fewest drivers and shortest shift whose event-mode
+    simulation reaches a target efficiency score or profit (see
+    optimizer.py). Returns the plan and the evaluations behind it; nothing
+    is written.
+    """
+    permission_classes = [IsAuthenticated]
+    admission_class = 'simulation'
+
+    def post(self, request, *args, **kwargs):
+        serializer = FleetOptimizationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        rule_set, error_response = resolve_rule_set(params.get('rule_set_version'))
+        if error_response is not None:
+            return error_response
+
+        try:
+            started = time.perf_counter()
+            snapshot = get_snapshot()
+            depot = params.get('depot') or None
+            if depot is not None and depot not in snapshot.depots:
+                return Response(
+                    {'error': 'Depot not found'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            start_time = params['start_time']
+            evaluator = get_evaluator(
+                snapshot, get_plan(rule_set),
+                start_minute=start_time.hour * 60 + start_time.minute + start_time.second / 60,
+                depot=depot,
+            )
+            result = search(
+                evaluator,
+                metric=params['metric'],
+                target=params['target'],
+                drivers=(params['min_drivers'], params['max_drivers']),
+                hours=(params['min_hours_per_day'], params['max_hours_per_day']),
+                prefer=params['prefer'],
+            )
+            plan, evaluations = result['plan'], result['evaluations']
+            simulations = sum(not evaluation['cached'] for evaluation in evaluations)
+            logger.info("Fleet optimization for %s >= %s: %s after %d evaluations (%d simulated), %.0f ms",
+                        params['metric'], params['target'],
+                        f"{plan['num_drivers']} drivers, {plan['max_hours_per_day']} hours" if plan else 'no plan',
+                        len(evaluations), simulations, (time.perf_counter() - started) * 1000)
+            return Response({
+                'rule_set_version': rule_set.version,
+                'snapshot_loaded_at': snapshot.loaded_at,
+                'metric': params['metric'],
+                'target': params['target'],
+                'feasible': plan is not None,
+                'plan': {**plan, 'kpis': ScenarioAPIView.kpi_data(plan['kpis'])} if plan is not None else None,
+                'simulations': simulations,
+                'evaluations': [
+                    {**evaluation, 'kpis': ScenarioAPIView.kpi_data(evaluation['kpis'])}
+                    for evaluation in evaluations
+                ],
+            })
+
+        except Exception as e:
+            logger.error(f"Fleet optimization error: {str(e)}", exc_info=True)
+            return Response(
+                {'error': 'Failed to optimize the fleet size'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class ProjectedKPIAPIView(AdmissionMixin, APIView):
+    """
+    KPIs a simulation of the current dataset would report, computed from the
+    per-route order statistics in time proportional to the number of routes.
+    With ``?depot=``, the depot's orders are evaluated from the cached
+    snapshot instead, since the statistics aren't kept per depot. Nothing is
+    written and no run is recorded.
+    """
+    permission_classes = [IsAuthenticated]
+    admission_class = 'analytics'
+
+    def get(self, request, *args, **kwargs):
+        rule_set, error_response = resolve_rule_set(request.query_params.get('rule_set_version'))
+        if error_response is not None:
+            return error_response
+
+        try:
+            plan = get_plan(rule_set)
+            depot = request.query_params.get('depot') or None
+            if depot is None:
+                kpis = route_kpis(plan)
+            else:
+                snapshot = get_snapshot()
+                if depot not in snapshot.depots:
+                    return Response(
+                        {'error': 'Depot not found'},
+                        status=status.HTTP_404_NOT_FOUND
+                    )
+                shard = snapshot.shard(depot)
+                kpis = summarize(shard.evaluate(plan), shard.total_orders)
+            results = {
+                'rule_set_version': rule_set.version,
+                'kpis': ScenarioAPIView.kpi_data(kpis),
+            }
+            if depot is not None:
+                results['depot'] = depot
+            return Response(results)
+
+        except Exception as e:
+            logger.error(f"Error computing projected KPIs: {str(e)}", exc_info=True)
+            return Response(
+                {'error': 'Failed to compute projected KPIs'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class AdmissionMetricsAPIView(APIView):
+    """Concurrency, queue depth and rejection counters per admission class"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(admission_stats())
+
+
 class HomeView(TemplateView):
     template_name = 'delivery_api/index.html'
     
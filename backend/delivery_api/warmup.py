@@ -0,0 +1,87 @@
+"""
+Warm-up of a server process before it takes traffic.
+
+``prepare()`` does the work that needs no connections: it imports the
+URLconf, and with it every view and the modules they use, builds the URL
+reverse map and reads the build-time OpenAPI schema. Under gunicorn's
+preload it runs once in the master, so forked workers inherit the result.
+
+``warm_up()`` runs in each worker before it accepts requests: it opens the
+database connections (filling the psycopg pool when one is configured),
+reaches the cache, and compiles the active rule set's evaluation plan; with
+WARMUP_SCENARIO_SNAPSHOT it also loads the scenario snapshot. Both return
+the seconds each step took, for the server to log.
+
+``on_first_request()`` calls back once, when the process has finished its
+first response, so servers can report time to first request.
+"""
+import threading
+import time
+from typing import Callable, Dict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db import connections
+from django.urls import get_resolver, reverse
+
+from . import docs
+from .rules import get_active_rule_set, get_plan
+from .simulation import GENERATION_KEY, get_snapshot
+
+_prepared = False
+
+
+def _timed(timings: Dict[str, float], step: str, work: Callable[[], object]) -> None:
+    started = time.perf_counter()
+    work()
+    timings[step] = time.perf_counter() - started
+
+
+def prepare() -> Dict[str, float]:
+    """Imports and in-memory set-up; opens no connections, so it's safe before a fork"""
+    global _prepared
+    timings: Dict[str, float] = {}
+    if _prepared:
+        return timings
+    _timed(timings, 'urls', lambda: (get_resolver().url_patterns, reverse('home')))
+    _timed(timings, 'schema', lambda: [docs.load_schema(schema_format) for schema_format in docs.SCHEMA_FORMATS])
+    _prepared = True
+    return timings
+
+
+def warm_up() -> Dict[str, float]:
+    """Prime this process's connections and caches"""
+    timings = prepare()
+    if not settings.WARMUP_ENABLED:
+        return timings
+    for alias in connections:
+        _timed(timings, f'database:{alias}', connections[alias].ensure_connection)
+    _timed(timings, 'cache', lambda: cache.get(GENERATION_KEY))
+
+    def compile_rules():
+        rule_set = get_active_rule_set()
+        if rule_set is not None:
+            get_plan(rule_set)
+
+    _timed(timings, 'rules', compile_rules)
+    if settings.WARMUP_SCENARIO_SNAPSHOT:
+        _timed(timings, 'scenario_snapshot', get_snapshot)
+    return timings
+
+
+def on_first_request(callback: Callable[[], None]) -> None:
+    """Call ``callback`` once, after the first response of this process"""
+    lock = threading.Lock()
+    called = False
+
+    def first_request_finished(sender, **kwargs):
+        nonlocal called
+        with lock:
+            if called:
+                return
+            called = True
+        request_finished.disconnect(first_request_finished)
+        callback()
+
+    request_finished.connect(first_request_finished, weak=False)
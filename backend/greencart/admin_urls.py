@@ -0,0 +1,12 @@
+"""
+URLconf of the admin site, imported on the first /admin/ request.
+
+The admin is installed as LazyAdminConfig (greencart/apps.py), which doesn't
+import the apps' admin.py modules at start-up; they register their
+ModelAdmins here.
+"""
+from django.contrib import admin
+
+admin.autodiscover()
+
+urlpatterns = admin.site.get_urls()
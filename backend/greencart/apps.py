@@ -0,0 +1,23 @@
+from django.contrib.admin.apps import SimpleAdminConfig
+from django.contrib.admin.checks import check_admin_app, check_dependencies
+from django.core import checks
+
+
+def check_admin_modules(app_configs, **kwargs):
+    # The registrations the admin checks inspect
+    from django.contrib import admin
+
+    admin.autodiscover()
+    return check_admin_app(app_configs, **kwargs)
+
+
+class LazyAdminConfig(SimpleAdminConfig):
+    """
+    The admin without autodiscovery at start-up: the apps' admin.py modules
+    are imported with the admin URLconf on the first /admin/ request
+    (greencart/admin_urls.py), or by the system checks.
+    """
+
+    def ready(self):
+        checks.register(check_dependencies, checks.Tags.admin)
+        checks.register(check_admin_modules, checks.Tags.admin)
@@ -0,0 +1,58 @@
+"""
+Production gunicorn profile; gunicorn reads this file from the working
+directory (start.sh, start-asgi.sh).
+
+The app is imported once in the master (preload_app) and the workers are
+forked from it, so each starts with Django, DRF and the views already loaded
+and shares those pages with the master. Before a worker accepts connections
+it warms up (delivery_api/warmup.py): database connections, cache and the
+active rule set. The master opens no connections, so workers inherit none.
+
+Logged at info level: how long the app took to load, each worker's warm-up,
+and each worker's time to first request.
+"""
+import os
+import time
+
+STARTED_AT = time.monotonic()
+
+wsgi_app = 'greencart.wsgi:application'
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+# Sync workers: admission control limits default below this count and turn
+# away over-limit requests instead of queueing them (delivery_api/admission.py)
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+preload_app = True
+
+
+def _timings(timings):
+    return ', '.join(f'{step} {seconds * 1000:.0f}ms' for step, seconds in timings.items()) or 'nothing to do'
+
+
+def when_ready(server):
+    # With preload the app is loaded by now; without it, workers prepare themselves
+    if server.cfg.preload_app:
+        from django.db import connections
+        from delivery_api import warmup
+
+        timings = warmup.prepare()
+        connections.close_all()
+        server.log.info("App loaded %.2fs after start (%s)", time.monotonic() - STARTED_AT, _timings(timings))
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.monotonic()
+
+
+def post_worker_init(worker):
+    from delivery_api import warmup
+
+    timings = warmup.warm_up()
+    worker.log.info("Worker %s warmed up in %.2fs (%s)", worker.pid, time.monotonic() - worker.forked_at,
+                    _timings(timings))
+
+    def report():
+        now = time.monotonic()
+        worker.log.info("Worker %s served its first request %.2fs after server start, %.2fs after fork",
+                        worker.pid, now - STARTED_AT, now - worker.forked_at)
+
+    warmup.on_first_request(report)
@@ -0,0 +1,17 @@
+#!/bin/bash
+
+# Apply database migrations
+python manage.py migrate
+
+# ASGI profile: a couple of uvicorn worker processes serve many concurrent
+# dashboard readers through the async analytics views. Persistent
+# connections don't survive across async requests, so use the psycopg pool.
+export DJANGO_ASYNC_VIEWS=True
+export DB_POOL_ENABLED=${DB_POOL_ENABLED:-True}
+
+# gunicorn.conf.py (preload, warm-up, startup timings) applies here too
+
+gunicorn greencart.asgi:application \
+  --worker-class uvicorn_worker.UvicornWorker \
+  --workers ${WEB_CONCURRENCY:-2} \
+  --bind 0.0.0.0:$PORT
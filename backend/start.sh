@@ -3,6 +3,7 @@
 # Apply database migrations
 python manage.py migrate
 
-# Start Gunicorn server
-# The 0.0.0.0 host is important for Render to bind correctly.
-gunicorn backend.wsgi --host 0.0.0.0 --port $PORT
\ No newline at end of file
+# Start Gunicorn with the production profile in gunicorn.conf.py: the app is
+# preloaded, workers warm up before taking traffic, and it binds 0.0.0.0:$PORT
+# as Render needs.
+exec gunicorn greencart.wsgi:application
@@ -0,0 +1,37 @@
+// Keeps a local copy of an API collection in step with the server through
+// its change feed: one full list, then only the rows changed since.
+const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://127.0.0.1:8000';
+
+const applyChanges = (rows, changes) => {
+  const deleted = new Set(changes.deleted);
+  const changed = new Map(changes.results.map(row => [row.id, row]));
+  const kept = rows
+    .filter(row => !deleted.has(row.id))
+    .map(row => {
+      const update = changed.get(row.id);
+      changed.delete(row.id);
+      return update || row;
+    });
+  return [...kept, ...changed.values()];
+};
+
+// Returns { rows, version }. Without a version, or once the server no longer
+// keeps changes that old (410), it fetches the full list.
+export const syncCollection = async (endpoint, rows, version, accessToken) => {
+  const headers = { 'Authorization': `Bearer ${accessToken}` };
+  if (version !== null && version !== undefined) {
+    const response = await fetch(`${API_BASE_URL}/api/${endpoint}/?since=${version}`, { headers });
+    if (response.ok) {
+      const changes = await response.json();
+      return { rows: applyChanges(rows, changes), version: changes.version };
+    }
+    if (response.status !== 410) {
+      throw new Error(`Failed to fetch ${endpoint}.`);
+    }
+  }
+  const response = await fetch(`${API_BASE_URL}/api/${endpoint}/`, { headers });
+  if (!response.ok) {
+    throw new Error(`Failed to fetch ${endpoint}.`);
+  }
+  return { rows: await response.json(), version: response.headers.get('Change-Version') };
+};
@@ -1,5 +1,6 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useAuth } from '../context/AuthContext';
+import { syncCollection } from '../changeFeed';
 
 const CrudTable = ({ title, endpoint, fields, onRefresh }) => {
   const [data, setData] = useState([]);
@@ -8,21 +9,19 @@ const CrudTable = ({ title, endpoint, fields, onRefresh }) => {
   const [error, setError] = useState('');
   const { isAuthenticated } = useAuth();
 
+  // Rows and change feed version of the last fetch
+  const feedRef = useRef({ endpoint, rows: [], version: null });
+
   const accessToken = localStorage.getItem('accessToken');
 
   const fetchData = async () => {
     if (!isAuthenticated) return;
     try {
-      const response = await fetch(`http://127.0.0.1:8000/api/${endpoint}/`, {
-        headers: {
-          'Authorization': `Bearer ${accessToken}`,
-        },
-      });
-      if (!response.ok) {
-        throw new Error(`Failed to fetch ${title}.`);
-      }
-      const jsonData = await response.json();
-      setData(jsonData);
+      // Once loaded, only the rows changed since the last fetch are downloaded
+      const feed = feedRef.current.endpoint === endpoint ? feedRef.current : { rows: [], version: null };
+      const { rows, version } = await syncCollection(endpoint, feed.rows, feed.version, accessToken);
+      feedRef.current = { endpoint, rows, version };
+      setData(rows);
     } catch (err) {
       setError(err.message);
     }
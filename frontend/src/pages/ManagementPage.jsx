@@ -1,5 +1,6 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useAuth } from '../context/AuthContext';
+import { syncCollection } from '../changeFeed';
 import { 
   FiUsers, 
   FiMapPin, 
@@ -26,43 +27,30 @@ const ManagementPage = () => {
   const [editingItem, setEditingItem] = useState(null);
   const { isAuthenticated } = useAuth();
 
-  useEffect(() => {
-    const fetchData = async () => {
-      if (!isAuthenticated) return;
-
-      const accessToken = localStorage.getItem('accessToken');
-      try {
-        // Fetch all data in parallel
-        const [driversRes, routesRes, ordersRes] = await Promise.all([
-          fetch(`${import.meta.env.VITE_API_BASE_URL || 'http://127.0.0.1:8000'}/api/drivers/`, {
-            headers: { 'Authorization': `Bearer ${accessToken}` },
-          }),
-          fetch(`${import.meta.env.VITE_API_BASE_URL || 'http://127.0.0.1:8000'}/api/routes/`, {
-            headers: { 'Authorization': `Bearer ${accessToken}` },
-          }),
-          fetch(`${import.meta.env.VITE_API_BASE_URL || 'http://127.0.0.1:8000'}/api/orders/`, {
-            headers: { 'Authorization': `Bearer ${accessToken}` },
-          })
-        ]);
+  // Change feed version each collection was last synced at
+  const versions = useRef({});
 
-        if (!driversRes.ok || !routesRes.ok || !ordersRes.ok) {
-          throw new Error('Failed to fetch data.');
-        }
+  // Brings the given collections up to date with only the rows changed
+  // since the last sync (the full list the first time)
+  const syncData = async (types) => {
+    const accessToken = localStorage.getItem('accessToken');
+    const current = { drivers, routes, orders };
+    const setters = { drivers: setDrivers, routes: setRoutes, orders: setOrders };
+    const synced = await Promise.all(
+      types.map(type => syncCollection(type, current[type], versions.current[type], accessToken))
+    );
+    synced.forEach(({ rows, version }, index) => {
+      versions.current[types[index]] = version;
+      setters[types[index]](rows);
+    });
+  };
 
-        const [driversData, routesData, ordersData] = await Promise.all([
-          driversRes.json(),
-          routesRes.json(),
-          ordersRes.json()
-        ]);
+  // Orders show their route, and deleting a route unassigns its orders
+  const affectedBy = (type) => (type === 'routes' ? ['routes', 'orders'] : [type]);
 
-        setDrivers(driversData);
-        setRoutes(routesData);
-        setOrders(ordersData);
-      } catch (err) {
-        setError(err.message);
-      }
-    };
-    fetchData();
+  useEffect(() => {
+    if (!isAuthenticated) return;
+    syncData(['drivers', 'routes', 'orders']).catch(err => setError(err.message));
   }, [isAuthenticated]);
 
   // CRUD Functions
@@ -80,14 +68,7 @@ const ManagementPage = () => {
         throw new Error(`Failed to delete ${type}.`);
       }
 
-      // Update local state
-      if (type === 'drivers') {
-        setDrivers(drivers.filter(d => d.id !== id));
-      } else if (type === 'routes') {
-        setRoutes(routes.filter(r => r.id !== id));
-      } else if (type === 'orders') {
-        setOrders(orders.filter(o => o.id !== id));
-      }
+      await syncData(affectedBy(type));
 
       setSuccessMessage(`${type.charAt(0).toUpperCase() + type.slice(1)} deleted successfully!`);
       setTimeout(() => setSuccessMessage(''), 3000);
@@ -133,28 +114,7 @@ const ManagementPage = () => {
         throw new Error(errorData.error || `Failed to ${editingItem && editingItem.id ? 'update' : 'create'} ${type}.`);
       }
 
-      const result = await response.json();
-      
-      // Update local state
-      if (type === 'drivers') {
-        if (editingItem && editingItem.id) {
-          setDrivers(drivers.map(d => d.id === editingItem.id ? result : d));
-        } else {
-          setDrivers([...drivers, result]);
-        }
-      } else if (type === 'routes') {
-        if (editingItem && editingItem.id) {
-          setRoutes(routes.map(r => r.id === editingItem.id ? result : r));
-        } else {
-          setRoutes([...routes, result]);
-        }
-      } else if (type === 'orders') {
-        if (editingItem && editingItem.id) {
-          setOrders(orders.map(o => o.id === editingItem.id ? result : o));
-        } else {
-          setOrders([...orders, result]);
-        }
-      }
+      await syncData(affectedBy(type));
 
       setSuccessMessage(`${type.charAt(0).toUpperCase() + type.slice(1)} ${editingItem && editingItem.id ? 'updated' : 'created'} successfully!`);
       setShowAddForm(false);
@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useRef, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useAuth } from '../context/AuthContext';
 import { useSimulation } from '../context/SimulationContext';
@@ -23,9 +23,17 @@ const SimulationPage = () => {
   const [error, setError] = useState('');
   const [successMessage, setSuccessMessage] = useState('');
   const [isLoading, setIsLoading] = useState(false);
+  // Idempotency key of the last request that got no response; a retry of the
+  // same parameters reuses it so the server replays instead of re-running
+  const pendingRequest = useRef(null);
+  const inFlight = useRef(false);
 
   const handleRunSimulation = async (e) => {
     e.preventDefault();
+    // A double-click fires twice before isLoading disables the button
+    if (inFlight.current) {
+      return;
+    }
     setError('');
     setSuccessMessage('');
     setIsLoading(true);
@@ -71,20 +79,36 @@ const SimulationPage = () => {
       };
       
       console.log('Simulation request data:', requestData);
-      
+
+      const body = JSON.stringify(requestData);
+      if (!pendingRequest.current || pendingRequest.current.body !== body) {
+        pendingRequest.current = { body, key: crypto.randomUUID() };
+      }
+
+      inFlight.current = true;
       const response = await fetch(`${import.meta.env.VITE_API_BASE_URL || 'http://127.0.0.1:8000'}/api/simulate/`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
-          'Authorization': `Bearer ${accessToken}`
+          'Authorization': `Bearer ${accessToken}`,
+          'Idempotency-Key': pendingRequest.current.key
         },
-        body: JSON.stringify(requestData),
+        body,
       });
+      // 409: the original is still running, so a retry keeps its key.
+      // Any other answer means the next click is a new simulation.
+      if (response.status !== 409) {
+        pendingRequest.current = null;
+      }
 
       if (!response.ok) {
         const errorData = await response.json();
         console.error('Simulation error:', errorData);
-        throw new Error(errorData.error || `Simulation failed with status ${response.status}`);
+        if (response.status === 429 || response.status === 503) {
+          const retryAfter = response.headers.get('Retry-After');
+          throw new Error(`The simulation engine is busy. Please try again${retryAfter ? ` in ${retryAfter} seconds` : ' shortly'}.`);
+        }
+        throw new Error(errorData.error || errorData.detail || `Simulation failed with status ${response.status}`);
       }
 
       const results = await response.json();
@@ -108,6 +132,7 @@ const SimulationPage = () => {
       console.error('Simulation error:', error);
       setError(error.message);
     } finally {
+      inFlight.current = false;
       setIsLoading(false);
     }
   };